@@ -0,0 +1,118 @@
+# app/answer_cache.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedder import get_embedder
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    query = re.sub(r"[^\w\s]", " ", (query or "").lower())
+    return " ".join(query.split())
+
+
+class AnswerCache:
+    """
+    Cache of generated answers in front of the LLM.
+
+    Lookups try the exact normalized query first, then the most similar
+    cached query embedding (cosine >= `threshold`). Entries expire after
+    `ttl` seconds, the least recently used entry is evicted past
+    `max_entries`, and everything is dropped when any of `watch_paths`
+    (index / chunk files) changes on disk.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, threshold=0.95, watch_paths=()):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.watch_paths = list(watch_paths)
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        # normalized query -> (answer, embedding, created_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = self._files_signature()
+
+    def _files_signature(self):
+        sig = []
+        for path in self.watch_paths:
+            try:
+                st = os.stat(path)
+                sig.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((path, None, None))
+        return tuple(sig)
+
+    def _check_files(self):
+        sig = self._files_signature()
+        if sig != self._signature:
+            self._signature = sig
+            self._entries.clear()
+            print("Answer cache invalidated: index files changed.")
+
+    def _expire(self, now):
+        for key in [k for k, (_, _, created) in self._entries.items() if now - created > self.ttl]:
+            del self._entries[key]
+
+    def _embed(self, key):
+        emb = get_embedder().encode([key], normalize_embeddings=True)
+        return np.asarray(emb, dtype="float32")[0]
+
+    def get(self, query):
+        """Return a cached answer for `query`, or None."""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_files()
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            keys = list(self._entries) if self.threshold < 1.0 else []
+            matrix = np.stack([self._entries[k][1] for k in keys]) if keys else None
+
+        if matrix is not None:
+            scores = matrix @ self._embed(key)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                with self._lock:
+                    entry = self._entries.get(keys[best])
+                    if entry is not None:
+                        self._entries.move_to_end(keys[best])
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return entry[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query, answer):
+        key = normalize_query(query)
+        # embeddings are only needed for near-duplicate lookups
+        emb = self._embed(key) if self.threshold < 1.0 else None
+        with self._lock:
+            self._entries[key] = (answer, emb, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -1,34 +1,152 @@
 import os
-import re
 import torch
-import requests
-from flask import Flask, request, render_template_string, send_file, Response
-from transformers import AutoModelForCausalLM, AutoTokenizer
-
-
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+from flask import Flask, request, render_template_string, send_file, Response, stream_with_context
+from transformers import AutoTokenizer
+from model_loader import load_causal_lm
+from generation import GenerationScheduler
+from prefix_cache import PrefixCache
+from answer_cache import AnswerCache
+from redaction import redact, contains_pii, StreamRedactor
+from prompting import GENERATION_KWARGS, POLICY_REFUSAL, build_prompt, clean_model_output
+from retrieval import load_retriever
+from chunk_store import CURRENT_FILE
+from chunk_meta import filter_key
+from tenants import TENANTS_DIR, TenantPool, UnknownTenant, check_tenant_id
+from context_builder import ContextBuilder
+import mailer
+from mailer import get_mailer
+from model_server import ModelClient
+from embedder import register_embedder, warm_up as warm_up_embedder
+from lifecycle import Startup
+import metrics
+from resume_sections import RESUME_SECTIONS
 
 
 # ================= CONFIG =================
-MODEL_NAME = "meta-llama/Llama-2-7b-chat-hf"
+MODEL_NAME = os.getenv("MODEL_NAME", "meta-llama/Llama-2-7b-chat-hf")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Load model + tokenizer
-print("Loading lightweight model for local testing...")
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    torch_dtype=torch.float16 if DEVICE == "cuda" else torch.float32,
-    device_map="auto"
-    low_cpu_mem_usage=True
+# MODEL_SERVER=<unix socket>: a shared model_server.py process owns the model,
+# embedder and index, and this worker only proxies to it (multi-worker mode)
+MODEL_SERVER = os.getenv("MODEL_SERVER")
+
+# DRAFT_MODEL_NAME=<small LM with the same tokenizer> enables speculative decoding
+# for the greedy endpoints listed in SPECULATIVE_ENDPOINTS while at most
+# SPECULATIVE_MAX_ACTIVE requests are generating (see GenerationScheduler)
+DRAFT_MODEL_NAME = os.getenv("DRAFT_MODEL_NAME")
+SPECULATIVE_ENDPOINTS = set(os.getenv("SPECULATIVE_ENDPOINTS", "ask,ask_stream").split(","))
+
+# Loaded in the background by the startup stages below, so the server binds
+# (and answers /healthz, /readyz) immediately; /ask returns 503 until ready
+tokenizer = model = scheduler = retriever = context_builder = model_client = tenant_pool = None
+startup = Startup()
+
+def _load_model():
+    global tokenizer, model, scheduler, model_client
+    if MODEL_SERVER:
+        print(f"Using model server at {MODEL_SERVER}")
+        model_client = ModelClient(MODEL_SERVER)
+        while True:  # the model server may still be loading its own model
+            try:
+                model_client.ping()
+                break
+            except OSError:
+                time.sleep(1)
+        # the answer cache's query embeddings go through the server as well
+        register_embedder(model_client.embedder)
+        scheduler = model_client.scheduler
+        return
+
+    # Load model + tokenizer
+    print("Loading lightweight model for local testing...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    # LLM_QUANTIZE=int8|int4|bf16 shrinks the resident model on CPU (see model_loader)
+    model = load_causal_lm(MODEL_NAME, DEVICE)
+    draft_model = load_causal_lm(DRAFT_MODEL_NAME, DEVICE) if DRAFT_MODEL_NAME else None
+
+    # Flask threads share one model through the continuous-batching scheduler
+    scheduler = GenerationScheduler(
+        model, tokenizer, DEVICE,
+        max_batch_size=int(os.getenv("GENERATION_MAX_BATCH", "8")),
+        prefix_cache=PrefixCache(max_entries=int(os.getenv("PREFIX_CACHE_SIZE", "4"))),
+        draft_model=draft_model,
+        num_draft_tokens=int(os.getenv("DRAFT_NUM_TOKENS", "4")),
+        speculative_max_active=int(os.getenv("SPECULATIVE_MAX_ACTIVE", "1")),
+    )
+
+def _load_retrieval():
+    global retriever, context_builder, tenant_pool
+    if MODEL_SERVER:
+        retriever = model_client.retriever
+        context_builder = model_client.context_builder
+        tenant_pool = model_client.tenants
+        return
+    # per-tenant indexes under TENANTS_DIR, loaded on a tenant's first request
+    tenant_pool = TenantPool(TENANTS_DIR, tokenizer=tokenizer, fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", "12")))
+    # same hybrid BM25 + dense engine as the Gradio UI; falls back to RESUME_SECTIONS
+    retriever = load_retriever(MODELS_DIR, fallback_corpus=RESUME_SECTIONS)
+    # over-fetch, MMR-rerank and pack hits into the prompt's token budget
+    context_builder = ContextBuilder(retriever, tokenizer, fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", "12")))
+
+def _warm_up():
+    """Run one short request end to end so the first visitor doesn't pay for lazy init."""
+    warm_up_embedder()
+    prompt, context_prefix = _build_prompt("What are your technical skills?")
+    scheduler.generate(prompt, context_prefix=context_prefix, max_input_tokens=GENERATION_KWARGS["max_input_tokens"],
+                       max_new_tokens=4, do_sample=False, speculative=True)
+
+# suggested-prompt buttons repeat the same few questions; serve those from cache
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+INDEX_FILE = os.path.join(MODELS_DIR, "resume.index")
+CHUNKS_FILE = os.path.join(MODELS_DIR, CURRENT_FILE)
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    watch_paths=[INDEX_FILE, CHUNKS_FILE],
 )
-model.to(DEVICE)
+
+# tenants get their own answer caches (a near-duplicate question about another
+# resume must not hit), kept for the most recently asked ANSWER_CACHE_TENANTS
+tenant_answer_caches = OrderedDict()
+_tenant_caches_lock = threading.Lock()
+
+def _answer_cache_for(tenant, filters):
+    """The answer cache for a request, or None when its answer is not cached (filtered requests)."""
+    if filters:
+        return None
+    if tenant is None:
+        return answer_cache
+    key = tenant if isinstance(tenant, str) else tuple(sorted(tenant))
+    with _tenant_caches_lock:
+        cache = tenant_answer_caches.get(key)
+        if cache is None:
+            dirs = [os.path.join(TENANTS_DIR, t) for t in ([key] if isinstance(key, str) else key)]
+            cache = tenant_answer_caches[key] = AnswerCache(
+                max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+                watch_paths=[os.path.join(d, name) for d in dirs for name in ("resume.index", CURRENT_FILE)],
+            )
+            if len(tenant_answer_caches) > int(os.getenv("ANSWER_CACHE_TENANTS", "64")):
+                tenant_answer_caches.popitem(last=False)
+        tenant_answer_caches.move_to_end(key)
+    return cache
 
 app = Flask(__name__)
 
+# outbound mail is spooled + delivered in the background; starting it here
+# also resumes anything a previous run left in the spool
+get_mailer()
+
 # ================= DATA =================
 NAME = "Ameesha Priya"
 TITLE = "Software Engineer – Backend, Distributed & FullStack Systems"
@@ -42,93 +160,39 @@ CORE_SKILLS = [
     "AWS", "GCP", "Azure", "Microservices", "Distributed Systems"
 ]
 
-PII_REGEX = re.compile(r'(\b\d{10}\b|\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b|\S+@\S+)')
-POLICY_REFUSAL = "I'm sorry, I cannot share personal phone numbers or private email addresses. Please use the Contact form on this page to reach out."
-
 # ================= HELPERS =================
-def llama_retrieve(query: str):
+def llama_retrieve(query: str, k: int = 3, budget_tokens: int = None, filters: dict = None, tenant=None):
     """
     Return relevant resume fragments (as a list of strings) for the given query.
-    Kept simple: keyword matching to preserve original behaviour.
-    """
-    query_lower = (query or "").lower()
-    relevant_sections = []
-    
-    if any(word in query_lower for word in ['experience', 'work', 'job', 'role', 'position']):
-        relevant_sections.append(
-            "Professional Experience: 4+ years at Bank of America, Brillio, Accenture, and Sheetz. Led automation tools for derivative trading, scaled operations from 700 to 1300 stores, developed microservices handling $50M+ daily volume."
-        )
-    
-    if any(word in query_lower for word in ['skill', 'technical', 'technology', 'programming']):
-        relevant_sections.append(
-            "Technical Skills: Java, Python, Spring Boot, Kafka, Kubernetes, AWS, GCP, Azure, Docker, ReactJS, MongoDB, Redis. Expert in distributed systems and microservices architecture."
-        )
-    
-    if any(word in query_lower for word in ['project', 'built', 'developed', 'created']):
-        relevant_sections.append(
-            "Key Projects: Event syndicator for Sheetz scaling to 1300 stores, automation tools for Merrill Lynch trading, SOAP to REST migration at Brillio, real-time data processing with Kafka and Samza."
-        )
-    
-    if any(word in query_lower for word in ['education', 'degree', 'university', 'school']):
-        relevant_sections.append(
-            "Education: Master of Software Engineering from Carnegie Mellon University (2024), Bachelor of Computer Science from Kalinga Institute of Industrial Technology (2020)."
-        )
-    
-    if any(word in query_lower for word in ['award', 'achievement', 'recognition']):
-        relevant_sections.append(
-            "Awards: Silver Award from Bank of America (Q1 2023), Top 4 in Accenture x Salesforce Hackathon (2021)."
-        )
-    
-    if not relevant_sections:
-        relevant_sections.append(
-            "Ameesha Priya is a Backend-focused Software Engineer with 4+ years architecting distributed systems across finance, healthcare, and e-commerce. Expert in Java, Kafka, Spring Boot, and Kubernetes on AWS/GCP/Azure."
-        )
-    
-    return relevant_sections
-
-def _clean_model_output(resp: str, prompt: str) -> str:
-    """
-    Robustly remove the prompt portion from the model output and return only the assistant's answer.
-    Approach:
-    1) If model outputs an explicit assistant marker like '<|assistant|>' use that.
-    2) Otherwise, remove the first occurrence of the prompt string.
-    3) If neither works, fallback to remove everything up to 'Answer:' or last newline.
+    Exact-term queries ("Kafka", "education") are served by BM25 alone; the
+    rest fuse BM25 and embedding rankings (see retrieval.HybridRetriever).
+    With `budget_tokens`, as many reranked fragments as fit are returned instead of k.
+    `filters` restricts the search by document, section and years (see chunk_meta).
+    `tenant` searches that tenant's index instead, or fans out over a list of tenants.
     """
-    if not resp:
-        return ""
-
-    # attempt to find explicit assistant marker
-    if "<|assistant|>" in resp:
-        return resp.split("<|assistant|>")[-1].strip()
-
-    # attempt to remove prompt string if present
-    idx = resp.find(prompt)
-    if idx != -1:
-        return resp[idx + len(prompt):].strip()
-
-    # fallback: try to find "Answer:" or last newline
-    # remove everything up to the last occurrence of "Answer:" (case-insensitive)
-    lower = resp.lower()
-    if "answer:" in lower:
-        pos = lower.rfind("answer:")
-        return resp[pos + len("answer:"):].strip()
-
-    # final fallback: strip the prompt-like first line(s)
-    lines = resp.splitlines()
-    # if >1 line, return from second line to end
-    if len(lines) > 1:
-        return "\n".join(lines[1:]).strip()
-
-    return resp.strip()
-
-def generate_answer(user_msg: str) -> str:
-    """Generate a resume-grounded answer and prevent echoing or PII leaks."""
-    # PII check on the incoming user message
-    if PII_REGEX.search(user_msg or ""):
-        return POLICY_REFUSAL
-
-    # Build context from resume fragments (keeps your simple retrieval logic)
-    chunks = llama_retrieve(user_msg) or []
+    if tenant is not None:
+        if budget_tokens is not None:
+            return tenant_pool.build_context(tenant, query or "", budget_tokens, filters)
+        if isinstance(tenant, str):
+            return tenant_pool.retrieve(tenant, query or "", k, filters)
+        return [text for _, text, _ in tenant_pool.fan_out(query or "", k, tenant, filters)]
+    if budget_tokens is not None:
+        chunks = context_builder.build(query or "", budget_tokens, filters)
+    else:
+        chunks = retriever.retrieve(query or "", k, filters)
+    if filters:
+        return chunks  # nothing matched the filter: no fallback section either
+    return chunks or [RESUME_SECTIONS[-1]]
+
+def _build_prompt(user_msg: str, filters: dict = None, tenant=None):
+    """Return (prompt, context_prefix); the prefix's KV cache is reused across questions."""
+    # Fill what the question and template leave of max_input_tokens with context,
+    # so the scheduler never truncates the question away
+    template, _ = build_prompt(user_msg)
+    with metrics.stage("prompt_budget"):
+        budget = context_builder.budget_for(template, GENERATION_KWARGS["max_input_tokens"])
+    with metrics.stage("retrieval"):
+        chunks = llama_retrieve(user_msg, budget_tokens=budget, filters=filters, tenant=tenant)
     context = "\n".join(chunks)
 
     # System rules kept strict and concise
@@ -139,44 +203,178 @@ def generate_answer(user_msg: str) -> str:
         "Keep answers concise, professional, and do not repeat the user's prompt."
     )
 
-    # Use a plain chat-style prompt (no weird token markup needed)
-    # NOTE: we intentionally avoid complex role tokens so the causal LM doesn't echo them back verbatim.
-    prompt = (
-        f"Resume context:\n{context}\n\n"
-        f"User question: {user_msg}\n\n"
-        f"Answer:"
-    )
+    # same template as batch_qa.py (see prompting.py)
+    return build_prompt(user_msg, context)
 
-    try:
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024, padding=True)
-        inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
+def request_options(data, tenant_header=None):
+    """
+    (filters, tenant) of an /ask body. `tenant` (or the X-Tenant-ID header)
+    is one tenant id or a list to fan out over; None uses MODELS_DIR.
+    Raises ValueError for malformed options (or filters the index cannot
+    apply) and UnknownTenant for a tenant without an index, before any work
+    starts, so /ask/stream can still answer with a 400 / 404.
+    """
+    filters = data.get("filters")
+    filter_key(filters)
+    tenant = data["tenant"] if data.get("tenant") is not None else tenant_header
+    if tenant is None:
+        if filters:
+            retriever.check_filters(filters)
+        return filters, None
+    tenants = [tenant] if isinstance(tenant, str) else tenant
+    if not isinstance(tenants, list) or not tenants:
+        raise ValueError("tenant must be a tenant id or a non-empty list of them")
+    for tenant_id in tenants:
+        if not tenant_pool.has_tenant(check_tenant_id(tenant_id)):
+            raise UnknownTenant(f"unknown tenant {tenant_id!r}")
+        if filters:
+            tenant_pool.check_filters(tenant_id, filters)
+    return filters, tenant
+
+def generate_answer(user_msg: str, filters: dict = None, tenant=None, on_start=None) -> str:
+    """
+    Generate a resume-grounded answer and prevent echoing or PII leaks.
+    Filtered questions bypass the answer cache, which is keyed on the text alone.
+    `on_start`, if given, receives a thread-safe cancel callable once generation
+    is queued (as in stream_answer); a cancelled call raises CancelledError.
+    """
+    cache = _answer_cache_for(tenant, filters)
+    # PII check on the incoming user message
+    with metrics.stage("pii_check"):
+        if contains_pii(user_msg):
+            return POLICY_REFUSAL
+
+    if cache is not None:
+        with metrics.stage("answer_cache"):
+            cached = cache.get(user_msg)
+        if cached is not None:
+            return cached
+
+    prompt, context_prefix = _build_prompt(user_msg, filters, tenant)
 
+    try:
         # Increase max_new_tokens so the model can complete a full sentence/paragraph.
         # Use do_sample=False to reduce odd echoing (deterministic completion); you can flip to True if you prefer sampling.
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=300,       # bigger to avoid truncation mid-sentence
-                temperature=0.0,         # deterministic; set >0 for sample diversity
-                top_p=0.9,
-                do_sample=False,        # deterministic completion reduces odd repeats
-                pad_token_id=tokenizer.eos_token_id,
-                eos_token_id=tokenizer.eos_token_id,
-            )
-
-        resp = tokenizer.decode(outputs[0], skip_special_tokens=False)
+        with metrics.stage("generate"):  # queue wait + prefill + decode (split in the scheduler)
+            kwargs = dict(context_prefix=context_prefix, speculative="ask" in SPECULATIVE_ENDPOINTS,
+                          **GENERATION_KWARGS)
+            if on_start is None:
+                resp = scheduler.generate(prompt, **kwargs)
+            else:
+                # same request as generate(), through a streamer so the caller can cancel it
+                streamer = scheduler.stream(prompt, **kwargs)
+                on_start(streamer.close)
+                try:
+                    resp = "".join(streamer)
+                finally:
+                    streamer.close()
         # strip model echo/prompts robustly
-        answer = _clean_model_output(resp, prompt)
+        with metrics.stage("clean_output"):
+            answer = clean_model_output(resp, prompt)
 
+    except CancelledError:
+        raise
     except Exception as e:
         print("Error in generate_answer:", e)
         return "Sorry, an error occurred generating the response."
 
     # post-process: redact any PII that may still appear
-    answer = re.sub(r'\S+@\S+', '[redacted]', answer)
-    answer = re.sub(r'\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b', '[redacted]', answer)
+    with metrics.stage("redact"):
+        answer = redact(answer)
+    if cache is not None:
+        with metrics.stage("answer_cache"):
+            cache.put(user_msg, answer)
     return answer
 
+def stream_answer(user_msg: str, on_start=None, filters: dict = None, tenant=None):
+    """
+    Streaming variant of generate_answer: yields redacted text deltas as tokens
+    are decoded instead of waiting for the full answer. `on_start`, if given,
+    receives a thread-safe cancel callable once generation is queued.
+    """
+    with metrics.stage("pii_check"):
+        if contains_pii(user_msg):
+            yield POLICY_REFUSAL
+            return
+
+    cache = _answer_cache_for(tenant, filters)
+    if cache is not None:
+        with metrics.stage("answer_cache"):
+            cached = cache.get(user_msg)
+        if cached is not None:
+            yield cached
+            return
+
+    prompt, context_prefix = _build_prompt(user_msg, filters, tenant)
+    streamer = scheduler.stream(prompt, context_prefix=context_prefix,
+                                speculative="ask_stream" in SPECULATIVE_ENDPOINTS, **GENERATION_KWARGS)
+    if on_start is not None:
+        on_start(streamer.close)
+    redactor = StreamRedactor()
+    started = False
+    answer = ""
+    trace = metrics.current_trace()
+    t0 = time.perf_counter()
+    try:
+        for delta in streamer:
+            if not started:
+                # the continuation usually opens with whitespace after "Answer:"
+                delta = delta.lstrip()
+                started = bool(delta)
+                if started:
+                    metrics.observe("first_token", time.perf_counter() - t0, trace)
+            out = redactor.feed(delta)
+            if out:
+                answer += out
+                yield out
+    except CancelledError:
+        return  # closed by the caller (disconnect or deadline); nobody is reading
+    except Exception as e:
+        print("Error in stream_answer:", e)
+        yield "Sorry, an error occurred generating the response."
+        return
+    finally:
+        # client disconnects close this generator; stop spending decode steps on it
+        streamer.close()
+    tail = redactor.flush()
+    if tail:
+        yield tail
+    streamed = (answer + tail).strip()
+    # cache exactly what the client saw, and only when it is what /ask would
+    # return too: an echo that clean_model_output strips is not cached
+    if cache is not None and clean_model_output(streamed, prompt) == streamed:
+        cache.put(user_msg, streamed)
+
+# model -> retrieval -> warm-up, off the import path; see /healthz and /readyz
+startup.start([("model", _load_model), ("retrieval", _load_retrieval), ("warm-up", _warm_up)])
+
+# scrape-time gauges for /metrics (scheduler ones go over the socket in MODEL_SERVER mode)
+metrics.gauge("resume_ready", "1 once every startup stage has finished.", lambda: int(startup.ready))
+metrics.gauge("resume_generation_queue_depth", "Prompts waiting for the generation scheduler.",
+              lambda: scheduler.queue_depth if scheduler else None)
+metrics.gauge("resume_generation_tokens_per_second", "Decode throughput since start.",
+              lambda: scheduler.metrics()["tokens_per_s"] if scheduler else None)
+metrics.gauge("resume_speculative_acceptance_rate", "Share of drafted tokens the main model accepted.",
+              lambda: scheduler.metrics()["acceptance_rate"] if scheduler else None)
+metrics.gauge("resume_tenants_resident", "Tenant indexes currently loaded.",
+              lambda: tenant_pool.stats()["resident"] if tenant_pool else None)
+metrics.gauge("resume_tenants_resident_mb", "Estimated memory of the loaded tenant indexes.",
+              lambda: tenant_pool.stats()["resident_mb"] if tenant_pool else None)
+metrics.scraped_counter("resume_tenant_evictions_total", "Tenant indexes evicted from the pool since start.",
+                        lambda: tenant_pool.stats()["evictions"] if tenant_pool else None)
+metrics.gauge("resume_answer_cache_hit_rate", "Answer cache hits / lookups.", lambda: answer_cache.stats()["hit_rate"])
+# never get_mailer() here: a scrape must not create the spool or start the worker
+metrics.gauge("resume_mail_spool_size", "Contact messages waiting for delivery.",
+              lambda: len(mailer._mailer) if mailer._mailer is not None else None)
+
+def _prefix_hit_rate():
+    cache = getattr(scheduler, "prefix_cache", None)
+    if cache is None or not cache.hits + cache.misses:
+        return None
+    return cache.hits / (cache.hits + cache.misses)
+
+metrics.gauge("resume_prefix_cache_hit_rate", "KV prefix cache hits / lookups.", _prefix_hit_rate)
+
 # ================= ROUTES =================
 @app.route("/")
 def index():
@@ -347,6 +545,8 @@ function appendMessage(sender, text) {
   
   chatBox.appendChild(div);
   chatBox.scrollTop = chatBox.scrollHeight;
+  const paragraphs = div.querySelectorAll("p");
+  return paragraphs[paragraphs.length - 1];
 }
 
 async function sendMessage() {
@@ -359,13 +559,48 @@ async function sendMessage() {
   sendBtn.innerHTML = '<span>Sending...</span>';
 
   try {
-    const res = await fetch("/ask", {
+    const res = await fetch("/ask/stream", {
       method: "POST",
       headers: {"Content-Type": "application/json"},
       body: JSON.stringify({msg: text})
     });
-    const data = await res.json();
-    appendMessage("bot", data.answer);
+    if (!res.ok) {
+      // 503 while the model loads, 429 when the async server is full: JSON, not an event stream
+      const body = await res.json().catch(() => ({}));
+      const retry = res.headers.get("Retry-After");
+      const wait = retry ? ` Please try again in ${retry} s.` : " Please try again shortly.";
+      let note = body.error || "Sorry, there was an error processing your request.";
+      if (res.status === 503) note = "I'm still loading." + wait;
+      else if (res.status === 429) note = "I'm busy answering other questions." + wait;
+      appendMessage("bot", "").textContent = note;
+      return;
+    }
+    // render tokens as they arrive instead of waiting for the full answer
+    const answerEl = appendMessage("bot", "");
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let answer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split("\\n\\n");
+      buffer = events.pop();
+      for (const evt of events) {
+        if (evt.startsWith("event: done")) continue;
+        const line = evt.split("\\n").find(l => l.startsWith("data: "));
+        if (!line) continue;
+        const data = JSON.parse(line.slice(6));
+        if (evt.startsWith("event: error")) {  // deadline or failure after the stream started
+          answer += (answer ? " " : "") + "(Sorry, the answer was cut short: " + data.error + ".)";
+        } else {
+          answer += data.delta;
+        }
+        answerEl.textContent = answer;
+        chatBox.scrollTop = chatBox.scrollHeight;
+      }
+    }
   } catch (error) {
     appendMessage("bot", "Sorry, there was an error processing your request.");
   } finally {
@@ -396,12 +631,73 @@ document.querySelectorAll(".qx").forEach(b => b.onclick = () => {
 </html>
     """, name=NAME, title=TITLE, skills=CORE_SKILLS)
 
+def _not_ready():
+    """503 for /ask while the startup stages are still running (or failed)."""
+    return {"error": "model is still loading"}, 503, {"Retry-After": "5"}
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up; 500 only if a startup stage failed."""
+    status = startup.status()
+    if startup.ready:
+        # decode tokens/s and, with a draft model, speculative acceptance rate
+        status["generation"] = scheduler.metrics()
+    return status, 500 if status["failed"] else 200
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 once the model, index and warm-up are done."""
+    status = startup.status()
+    return status, 200 if status["ready"] else 503
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text format: per-stage latency histograms, counters and gauges."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/ask", methods=["POST"])
 def ask():
+    if not startup.ready:
+        return _not_ready()
     data = request.get_json()
     msg = data.get("msg", "")
-    ans = generate_answer(msg)
-    return {"answer": ans}
+    try:
+        filters, tenant = request_options(data, request.headers.get("X-Tenant-ID"))
+        with metrics.trace("ask", request.headers.get("X-Request-ID")) as trace:
+            ans = generate_answer(msg, filters, tenant)
+    except ValueError as e:  # bad filters, or a doc filter on an index without doc metadata
+        return {"error": str(e)}, 400
+    except UnknownTenant as e:
+        return {"error": str(e)}, 404
+    headers = {"X-Request-ID": trace.request_id} if trace else {}
+    return {"answer": ans}, 200, headers
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """Server-Sent Events: one `data:` event per text delta, then `event: done`."""
+    if not startup.ready:
+        return _not_ready()
+    data = request.get_json()
+    msg = data.get("msg", "")
+    try:
+        filters, tenant = request_options(data, request.headers.get("X-Tenant-ID"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except UnknownTenant as e:
+        return {"error": str(e)}, 404
+    request_id = request.headers.get("X-Request-ID") or metrics.new_request_id()
+
+    def events():
+        with metrics.trace("ask_stream", request_id):
+            for delta in stream_answer(msg, filters=filters, tenant=tenant):
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id},
+    )
 
 @app.route("/download")
 def download_resume():
@@ -430,23 +726,14 @@ def contact():
     return "Missing email or message", 400
 
 def send_email(name, email, message):
-    if not SENDGRID_API_KEY:
-        print("SENDGRID_API_KEY not set. Cannot send email.")
-        return
-    data = {
-        "personalizations": [{"to": [{"email": "apriya.gcp@gmail.com"}]}],
-        "from": {"email": "no-reply@yourdomain.com"},
-        "subject": f"New message from {name}",
-        "content": [{"type": "text/plain", "value": f"From: {email}\n\n{message}"}],
-    }
-    response = requests.post(
-        "https://api.sendgrid.com/v3/mail/send",
-        headers={"Authorization": f"Bearer {SENDGRID_API_KEY}", "Content-Type": "application/json"},
-        json=data,
+    """Spool the contact message for background delivery (see mailer.Mailer); never blocks on the provider."""
+    get_mailer().enqueue(
+        to="apriya.gcp@gmail.com",
+        sender="no-reply@yourdomain.com",
+        subject=f"New message from {name}",
+        text=f"From: {email}\n\n{message}",
     )
-    if response.status_code >= 400:
-        print("SendGrid email error:", response.text)
-    
+
 if __name__ == "__main__":
     port = 7860
     print(f"Starting server on http://localhost:{port}")
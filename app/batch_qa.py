@@ -0,0 +1,233 @@
+# app/batch_qa.py
+"""
+Answer a file of questions offline, for evaluation runs.
+
+    python app/batch_qa.py questions.jsonl --out answers.jsonl
+    python app/batch_qa.py questions.jsonl --out answers.jsonl --tenant alice --batch-size 16
+
+Input lines are JSON objects with a "question" (or "msg") and an optional
+"id" (default: the line number); other fields are copied to the output.
+Each output line adds "answer", "retrieval_ms", "generation_ms",
+"latency_ms", "prompt_tokens" and "completion_tokens" (or "error").
+
+Questions are read in chunks. Each chunk's contexts are retrieved
+concurrently (so QueryBatcher micro-batches the encode and FAISS
+calls), and its prompts are sorted by token length and cut into buckets of
+--batch-size. A bucket goes to the generation scheduler together, so its
+prefill and decode steps pad only to the bucket's longest prompt.
+
+The output file is the checkpoint: every finished bucket is flushed and
+fsync'd, and a rerun skips ids already answered (failed items are retried;
+the later line wins). Kill it at any point and run the same command again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from prompting import GENERATION_KWARGS, POLICY_REFUSAL, build_prompt, clean_model_output
+from redaction import contains_pii, redact
+
+
+# -------------------
+# Input / checkpoint
+# -------------------
+def read_questions(path):
+    """[(id, item)] in file order; blank lines are skipped."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            question = item.get("question", item.get("msg"))
+            if not isinstance(question, str):
+                raise ValueError(f"{path}:{lineno}: expected a \"question\" string")
+            item["question"] = question
+            items.append((str(item.get("id", lineno)), item))
+    return items
+
+
+def answered_ids(path):
+    """
+    Ids already answered in `path`. A torn last line (the run was killed
+    mid-write) is cut off so appending continues on a clean line.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        record = json.loads(line)
+        if "error" in record:
+            done.discard(record["id"])
+        else:
+            done.add(record["id"])
+    return done
+
+
+# -------------------
+# Retrieval + generation
+# -------------------
+class BatchAnswerer:
+    """Batched retrieval and length-bucketed generation over one loaded model + index."""
+
+    def __init__(self, scheduler, context_builder, tokenizer, tenants=None, tenant=None, batch_size=8,
+                 retrieval_threads=32, sort_by_length=True, generation_kwargs=None):
+        self.scheduler = scheduler
+        self.context_builder = context_builder
+        self.tokenizer = tokenizer
+        self.tenants = tenants
+        self.tenant = tenant
+        self.batch_size = batch_size
+        self.sort_by_length = sort_by_length
+        self.generation_kwargs = dict(GENERATION_KWARGS, **(generation_kwargs or {}))
+        self.budget = context_builder.budget_for(build_prompt("")[0], self.generation_kwargs["max_input_tokens"])
+        self._executor = ThreadPoolExecutor(max_workers=retrieval_threads, thread_name_prefix="batch-retrieval")
+
+    def _context(self, question):
+        t0 = time.perf_counter()
+        # leave room for the question itself, as app._build_prompt does
+        budget = max(0, self.budget - self.context_builder.count_tokens(question))
+        if self.tenant is not None:
+            chunks = self.tenants.build_context(self.tenant, question, budget)
+        else:
+            chunks = self.context_builder.build(question, budget)
+        return "\n".join(chunks), (time.perf_counter() - t0) * 1000
+
+    def prepare(self, items):
+        """Retrieve every item's context concurrently; returns records with their prompts."""
+        records = []
+        for (item_id, item), (context, retrieval_ms) in zip(
+                items, self._executor.map(self._context, [item["question"] for _, item in items])):
+            prompt, context_prefix = build_prompt(item["question"], context)
+            records.append({**item, "id": item_id, "prompt": prompt, "context_prefix": context_prefix,
+                            "retrieval_ms": round(retrieval_ms, 2)})
+        return records
+
+    def buckets(self, records):
+        """Records sorted by prompt length (tokens), in groups of batch_size."""
+        if self.sort_by_length:
+            lengths = [len(ids) for ids in self.tokenizer([r["prompt"] for r in records])["input_ids"]]
+            records = [records[i] for i in np.argsort(lengths, kind="stable")]
+        return [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+
+    def generate(self, bucket):
+        """
+        Submit a bucket together and fill in each record's answer, timings and token counts.
+        Answers get the same refusal and clean-up as /ask.
+        """
+        t0 = time.perf_counter()
+        futures = [None if contains_pii(record.get("question", "")) else
+                   self.scheduler.submit(record["prompt"], context_prefix=record["context_prefix"],
+                                         **self.generation_kwargs)
+                   for record in bucket]
+        for record, future in zip(bucket, futures):
+            prompt = record.pop("prompt")
+            del record["context_prefix"]
+            if future is None:
+                record["answer"] = POLICY_REFUSAL
+                record["generation_ms"] = 0.0
+                record["latency_ms"] = record["retrieval_ms"]
+                continue
+            try:
+                record["answer"] = redact(clean_model_output(future.result(), prompt))
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+                continue
+            # stamped by the scheduler when the request finished, not when we got to it
+            generation_ms = (future.finished_at - t0) * 1000
+            record["generation_ms"] = round(generation_ms, 2)
+            record["latency_ms"] = round(record["retrieval_ms"] + generation_ms, 2)
+            record.update(getattr(future, "usage", {}))
+        return bucket
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+# -------------------
+# Driver
+# -------------------
+def run(answerer, items, out_path, chunk_size=256):
+    """Answer `items` not yet in `out_path`, appending results; returns a summary dict."""
+    done = answered_ids(out_path)
+    todo = [(item_id, item) for item_id, item in items if item_id not in done]
+    print(f"{len(items)} questions, {len(items) - len(todo)} already answered, {len(todo)} to go")
+
+    t0 = time.perf_counter()
+    latencies, tokens, errors, answered = [], 0, 0, 0
+    with open(out_path, "a", encoding="utf-8") as out:
+        for start in range(0, len(todo), chunk_size):
+            records = answerer.prepare(todo[start:start + chunk_size])
+            for bucket in answerer.buckets(records):
+                for record in answerer.generate(bucket):
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    if "error" in record:
+                        errors += 1
+                        continue
+                    answered += 1
+                    latencies.append(record["latency_ms"])
+                    tokens += record.get("completion_tokens", 0)
+                # checkpoint: a finished bucket survives a kill
+                out.flush()
+                os.fsync(out.fileno())
+            elapsed = time.perf_counter() - t0
+            print(f"  {answered + errors}/{len(todo)} done ({(answered + errors) / elapsed:.2f} q/s, "
+                  f"{tokens / elapsed:.1f} tokens/s, {errors} errors)")
+
+    elapsed = time.perf_counter() - t0
+    summary = {
+        "answered": answered,
+        "errors": errors,
+        "skipped": len(items) - len(todo),
+        "seconds": round(elapsed, 2),
+        "questions_per_s": round((answered + errors) / elapsed, 3) if elapsed else None,
+        "tokens_per_s": round(tokens / elapsed, 2) if elapsed else None,
+        "p50_latency_ms": round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+        "p99_latency_ms": round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+    }
+    print(json.dumps(summary))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL file of questions")
+    parser.add_argument("--out", required=True, help="JSONL answers file (also the resume checkpoint)")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "meta-llama/Llama-2-7b-chat-hf"))
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR", "models"))
+    parser.add_argument("--tenant", help="answer from this tenant's index (see tenants.py)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("GENERATION_MAX_BATCH", "8")),
+                        help="prompts per length bucket (also the scheduler's batch size)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="questions retrieved per round")
+    parser.add_argument("--max-new-tokens", type=int, default=GENERATION_KWARGS["max_new_tokens"])
+    parser.add_argument("--no-sort", action="store_true", help="keep file order instead of length buckets")
+    args = parser.parse_args()
+
+    os.environ["GENERATION_MAX_BATCH"] = str(args.batch_size)
+    from model_server import load_components
+
+    items = read_questions(args.questions)
+    scheduler, _, context_builder, _, tenants = load_components(args.model, args.models_dir)
+    if args.tenant is not None and not tenants.has_tenant(args.tenant):
+        sys.exit(f"No index for tenant {args.tenant!r} under {tenants.root}")
+    answerer = BatchAnswerer(scheduler, context_builder, context_builder.tokenizer, tenants=tenants,
+                             tenant=args.tenant, batch_size=args.batch_size, sort_by_length=not args.no_sort,
+                             generation_kwargs={"max_new_tokens": args.max_new_tokens})
+    try:
+        run(answerer, items, args.out, args.chunk_size)
+    finally:
+        answerer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# app/bench_ann.py
+"""
+Recall@k vs. latency for the index types in index_factory, measured against
+the exact flat baseline.
+
+    python app/bench_ann.py --synthetic 200000 --out ann_bench.json
+    python app/bench_ann.py --store models --out ann_bench.json
+
+Queries are stored vectors plus a little noise. Single-query latency
+(p50/p99) and batched throughput are reported for each search setting.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore
+from index_factory import build_ann_index, set_search_params
+
+SWEEPS = {
+    "flat": [{}],
+    "ivf": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "ivfpq": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "hnsw": [{"ef_search": e} for e in (16, 32, 64, 128)],
+}
+
+
+def synthetic_corpus(n, dim, clusters=256, seed=0):
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def make_queries(vectors, n, noise=0.1, seed=1):
+    rng = np.random.default_rng(seed)
+    q = np.asarray(vectors[rng.integers(0, len(vectors), n)], dtype=np.float32)
+    q = q + noise * rng.standard_normal(q.shape).astype(np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    t0 = time.perf_counter()
+    _, found = index.search(queries, k)
+    batch_s = time.perf_counter() - t0
+    return {
+        "recall_at_k": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "batch_qps": round(len(queries) / batch_s, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", help="model dir whose embeddings.npy to index")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="synthetic corpus size when --store is not given")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(SWEEPS))
+    parser.add_argument("--out", default="ann_bench.json")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = ChunkStore(args.store).embeddings
+    else:
+        vectors = synthetic_corpus(args.synthetic, args.dim)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = make_queries(vectors, args.queries)
+
+    exact = build_ann_index("flat", vectors, ids)
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    for kind in args.types:
+        t0 = time.perf_counter()
+        index = build_ann_index(kind, vectors, ids)
+        build_s = time.perf_counter() - t0
+        for params in SWEEPS[kind]:
+            set_search_params(index, **params)
+            row = {"type": kind, **params, "build_s": round(build_s, 2), **measure(index, queries, truth, args.k)}
+            results.append(row)
+            print(json.dumps(row))
+
+    with open(args.out, "w") as f:
+        json.dump({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+                   "queries": args.queries, "results": results}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
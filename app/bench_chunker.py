@@ -0,0 +1,171 @@
+# app/bench_chunker.py
+"""
+Chunking throughput and token budgets on a synthetic corpus.
+
+    python app/bench_chunker.py --docs 2000 --out chunker_bench.json
+
+Compares the word-count chunkers (split_into_chunks per paragraph, and
+split_text_chunk.py's old 300-word split) with chunker.TokenChunker, and
+with the obvious tokenizer-aware alternative that tokenizes every sentence
+separately and packs them. Reports MB/s, chunk counts and how many chunks
+go over the embedder's 256-token limit (i.e. would be silently truncated
+when encoded), plus the tokenizer's own throughput on the corpus, which
+bounds any tokenizer-aware chunker. Uses the all-MiniLM-L6-v2 tokenizer;
+when it can't be downloaded, a WordPiece tokenizer trained on the corpus
+stands in.
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+import numpy as np
+
+from bench_e2e import FILLER_WORDS, TOPIC_WORDS
+from build_index import split_paragraph_chunks, split_sentences
+from chunker import EMBED_MAX_TOKENS, TokenChunker, load_tokenizer
+
+
+# -------------------
+# Baselines
+# -------------------
+def legacy_split_text(text, max_words=300):
+    words = text.split()
+    return [" ".join(words[i:i+max_words]) for i in range(0, len(words), max_words)]
+
+
+def per_sentence_chunks(text, tokenizer, max_tokens):
+    """Tokenize each sentence on its own, then pack whole sentences up to `max_tokens` (no overlap)."""
+    chunks = []
+    for para in re.split(r'\n\s*\n', text):
+        current, size = [], 0
+        for sentence in split_sentences(" ".join(para.split())):
+            n = len(tokenizer(sentence, add_special_tokens=False)["input_ids"])
+            if current and size + n > max_tokens:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            current.append(sentence)
+            size += n
+        if current:
+            chunks.append(" ".join(current))
+    return chunks
+
+
+# -------------------
+# Corpus and tokenizer
+# -------------------
+def synthetic_documents(n_docs, seed=0):
+    """Resume-like documents: paragraphs of sentences, with long technical tokens mixed in."""
+    rng = random.Random(seed)
+    rare = [f"{rng.choice(TOPIC_WORDS)}{rng.choice(['Service', 'Pipeline', 'v2', '-api', 'Controller'])}"
+            for _ in range(500)]
+    docs = []
+    for _ in range(n_docs):
+        paragraphs = []
+        for _ in range(rng.randint(2, 8)):
+            sentences = []
+            for _ in range(rng.randint(2, 24)):
+                words = [rng.choice(TOPIC_WORDS) if r < 0.5 else rng.choice(rare) if r < 0.6
+                         else rng.choice(FILLER_WORDS) for r in (rng.random() for _ in range(rng.randint(6, 30)))]
+                sentences.append(" ".join(words).capitalize() + ".")
+            paragraphs.append(" ".join(sentences))
+        docs.append("\n\n".join(paragraphs))
+    return docs
+
+
+def get_tokenizer(name, docs):
+    try:
+        return load_tokenizer(name), name
+    except Exception as e:
+        print(f"Couldn't load {name} ({type(e).__name__}); training a stand-in WordPiece tokenizer")
+    from tokenizers import BertWordPieceTokenizer
+    from tokenizers.processors import BertProcessing
+    from transformers import PreTrainedTokenizerFast
+
+    wordpiece = BertWordPieceTokenizer(lowercase=True)
+    wordpiece.train_from_iterator(docs, vocab_size=4000, show_progress=False)
+    # [CLS] ... [SEP] like MiniLM, so the 256-token limit counts the same
+    wordpiece.post_processor = BertProcessing(("[SEP]", wordpiece.token_to_id("[SEP]")),
+                                              ("[CLS]", wordpiece.token_to_id("[CLS]")))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=wordpiece._tokenizer, unk_token="[UNK]",
+                                        cls_token="[CLS]", sep_token="[SEP]", pad_token="[PAD]")
+    return tokenizer, "wordpiece-stand-in"
+
+
+def _token_counts(tokenizer, chunks):
+    """Embedder input length of each chunk, [CLS]/[SEP] included."""
+    ids = tokenizer(chunks, add_special_tokens=True, return_attention_mask=False)["input_ids"]
+    return np.fromiter(map(len, ids), dtype=np.int64, count=len(ids))
+
+
+def _time(fn, docs, repeat):
+    best, chunks = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = [chunk for doc in docs for chunk in fn(doc)]
+        seconds = time.perf_counter() - t0
+        best = seconds if best is None else min(best, seconds)
+    return chunks, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--tokenizer", default="all-MiniLM-L6-v2")
+    parser.add_argument("--overlap", type=int, default=32, help="token overlap for the token chunkers")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="chunker_bench.json")
+    args = parser.parse_args()
+
+    docs = synthetic_documents(args.docs)
+    mb = sum(len(d.encode()) for d in docs) / (1024 * 1024)
+    tokenizer, tokenizer_name = get_tokenizer(args.tokenizer, docs)
+    print(f"corpus: {len(docs)} docs, {mb:.1f} MB; tokenizer {tokenizer_name}")
+
+    by_tokens = TokenChunker(tokenizer, overlap=args.overlap)
+    by_sentences = TokenChunker(tokenizer, overlap=args.overlap, align_sentences=True)
+    t0 = time.perf_counter()
+    tokenizer(docs, add_special_tokens=False, return_offsets_mapping=True)
+    tokenize_mb_per_s = round(mb / (time.perf_counter() - t0), 2)
+    print(f"tokenizer alone: {tokenize_mb_per_s} MB/s")
+
+    runs = [
+        ("80-word windows", split_paragraph_chunks),
+        ("300-word split", legacy_split_text),
+        ("per-sentence tokenize", lambda d: per_sentence_chunks(d, tokenizer, by_tokens.max_tokens)),
+        (f"tokens {by_tokens.max_tokens}", lambda d: split_paragraph_chunks(d, chunker=by_tokens)),
+        (f"tokens {by_sentences.max_tokens} + sentences",
+         lambda d: split_paragraph_chunks(d, chunker=by_sentences)),
+    ]
+
+    rows = []
+    for name, fn in runs:
+        chunks, seconds = _time(fn, docs, args.repeat)
+        lengths = _token_counts(tokenizer, chunks)
+        over = lengths > EMBED_MAX_TOKENS
+        row = {
+            "chunker": name,
+            "mb_per_s": round(mb / seconds, 2),
+            "chunks": len(chunks),
+            "mean_tokens": round(float(lengths.mean()), 1),
+            "max_tokens": int(lengths.max()),
+            "over_limit_pct": round(100 * float(over.mean()), 2),
+            "truncated_tokens": int((lengths[over] - EMBED_MAX_TOKENS).sum()),
+        }
+        if "sentences" in name:
+            row["sentence_aligned_pct"] = round(100 * sum(c.endswith((".", "!", "?")) for c in chunks) / len(chunks), 2)
+        rows.append(row)
+        print(f"{name:28s} {row['mb_per_s']:7.2f} MB/s  {row['chunks']:7d} chunks  mean {row['mean_tokens']:6.1f}  "
+              f"max {row['max_tokens']:4d} tok  over limit {row['over_limit_pct']:5.2f}%"
+              + (f"  sentence-aligned {row['sentence_aligned_pct']}%" if "sentence_aligned_pct" in row else ""))
+
+    with open(args.out, "w") as f:
+        json.dump({"docs": len(docs), "corpus_mb": round(mb, 2), "tokenizer": tokenizer_name,
+                   "embed_max_tokens": EMBED_MAX_TOKENS, "tokenizer_mb_per_s": tokenize_mb_per_s, "results": rows},
+                  f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
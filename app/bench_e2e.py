@@ -0,0 +1,309 @@
+# app/bench_e2e.py
+"""
+End-to-end performance baseline that runs offline, without the 7B weights.
+
+    python app/bench_e2e.py --chunks 1000 10000 --concurrency 8 --out e2e_bench.json
+    python app/bench_e2e.py --chunks 1000 10000 --baseline e2e_bench.json   # compare to an earlier run
+
+Stand-ins: a tiny randomly initialised Llama (word-level tokenizer, saved
+to a temp dir and loaded through the normal app.py path) and a
+feature-hashing embedder registered in place of the SentenceTransformer.
+Generated text is gibberish, but every code path and data structure is
+the real one, so timings move when the code does.
+
+For each corpus size a fresh process:
+  1. builds a synthetic corpus, chunks it with build_index.split_into_chunks
+     and indexes it with build_index.update_index (index build time);
+  2. times HybridRetriever.search for a mix of short and long queries
+     (retrieval p50/p99);
+  3. starts app.py on a local port (Flask, or serve_async with --server asgi)
+     over that index and drives /ask with N closed-loop clients
+     (throughput, latency percentiles);
+and records the process's peak RSS after each phase.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# resume-flavoured words so BM25 and the lexical fast path see realistic terms
+TOPIC_WORDS = (
+    "java python kafka kubernetes spring boot microservices aws gcp azure docker terraform postgres redis "
+    "grpc rest api latency throughput pipeline streaming batch samza flink spark airflow backend frontend "
+    "react typescript distributed systems scalability observability monitoring deployment migration cache "
+    "database schema replication sharding consensus bank payments fraud analytics dashboard team led built "
+    "designed reduced improved owned mentored launched migrated automated optimized"
+).split()
+FILLER_WORDS = ("the", "and", "with", "for", "to", "of", "in", "a", "on", "using", "across", "by")
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _percentiles(seconds):
+    ms = np.asarray(seconds) * 1000 if seconds else np.zeros(1)
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p99_ms": round(float(np.percentile(ms, 99)), 3)}
+
+
+# -------------------
+# Stand-ins
+# -------------------
+class HashEmbedder:
+    """Feature-hashing bag of words: deterministic, no weights, roughly the cost shape of encode()."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        from retrieval import tokenize
+
+        vecs = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                h = zlib.crc32(term.encode("utf-8"))
+                vecs[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            vecs /= np.where(norms == 0, 1.0, norms)
+        return vecs
+
+
+def synthetic_corpus(n_chunks, words_per_doc=400, seed=0):
+    """Documents whose split_into_chunks() output totals about `n_chunks` chunks."""
+    from build_index import split_into_chunks
+
+    rng = random.Random(seed)
+    # a long tail of rare terms, like project and product names in real resumes
+    rare = [f"proj{i}" for i in range(max(100, n_chunks // 2))]
+    docs, chunks = [], []
+    while len(chunks) < n_chunks:
+        words = []
+        for _ in range(words_per_doc):
+            r = rng.random()
+            words.append(rng.choice(TOPIC_WORDS) if r < 0.55 else rng.choice(rare) if r < 0.65
+                         else rng.choice(FILLER_WORDS))
+        doc = " ".join(words)
+        docs.append(doc)
+        chunks.extend(split_into_chunks(doc))
+    return docs, chunks[:n_chunks]
+
+
+def make_tiny_lm(path, hidden=64, layers=2):
+    """Save a random tiny Llama + word-level tokenizer that AutoTokenizer / load_causal_lm can load."""
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    vocab = {"<unk>": 0, "<s>": 1, "</s>": 2}
+    for word in TOPIC_WORDS + list(FILLER_WORDS) + "resume context user question answer : ? . ,".split():
+        vocab.setdefault(word, len(vocab))
+    for i in range(2000):
+        vocab.setdefault(f"proj{i}", len(vocab))
+    tok = Tokenizer(WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = Whitespace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="<unk>", bos_token="<s>",
+                                        eos_token="</s>", pad_token="</s>")
+    tokenizer.save_pretrained(path)
+
+    config = LlamaConfig(vocab_size=len(vocab), hidden_size=hidden, intermediate_size=hidden * 2,
+                         num_hidden_layers=layers, num_attention_heads=4, num_key_value_heads=4,
+                         max_position_embeddings=2048, bos_token_id=1, eos_token_id=2, pad_token_id=2)
+    LlamaForCausalLM(config).save_pretrained(path)
+
+
+# -------------------
+# Phases
+# -------------------
+def bench_build(chunks, out_dir, index_type):
+    from build_index import update_index
+
+    t0 = time.perf_counter()
+    update_index(chunks, out_dir=out_dir, kind=index_type)
+    seconds = time.perf_counter() - t0
+    return {"build_s": round(seconds, 3), "chunks_per_s": round(len(chunks) / seconds, 1),
+            "peak_rss_mb": _peak_rss_mb()}
+
+
+def bench_retrieval(out_dir, n_queries, k=5, seed=1):
+    from retrieval import load_retriever
+
+    retriever = load_retriever(out_dir)
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n_queries):
+        # short single-term queries take BM25's fast path; longer ones fuse with FAISS
+        n_words = 1 if i % 3 == 0 else rng.randint(4, 10)
+        queries.append(" ".join(rng.choice(TOPIC_WORDS) for _ in range(n_words)))
+    for q in queries[:10]:
+        retriever.search(q, k)  # warm-up (page in the mmapped store, start the batcher)
+
+    latencies = []
+    t0 = time.perf_counter()
+    for q in queries:
+        t = time.perf_counter()
+        retriever.search(q, k)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - t0
+    return {"queries": n_queries, "qps": round(n_queries / elapsed, 1), **_percentiles(latencies),
+            "peak_rss_mb": _peak_rss_mb()}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(server, port):
+    import app as resume_app
+
+    if server == "asgi":
+        import uvicorn
+        import serve_async
+
+        config = uvicorn.Config(serve_async.app, host="127.0.0.1", port=port, log_level="warning")
+        srv = uvicorn.Server(config)
+        threading.Thread(target=srv.run, daemon=True).start()
+        return srv
+
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access-log line per request
+    srv = make_server("127.0.0.1", port, resume_app.app, threaded=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def bench_ask(server, concurrency, duration, max_new_tokens):
+    import requests
+    import app as resume_app
+    from bench_workers import _load
+
+    if not resume_app.startup.wait(300):
+        raise RuntimeError(f"app did not start: {resume_app.startup.error}")
+    resume_app.GENERATION_KWARGS["max_new_tokens"] = max_new_tokens
+
+    port = _free_port()
+    _serve(server, port)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).ok:
+                break
+        except requests.RequestException:
+            time.sleep(0.2)
+    result = _load(f"http://127.0.0.1:{port}/ask", concurrency, duration)
+    result["generation"] = resume_app.scheduler.metrics()
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _run_size(n_chunks, args, lm_dir, results):
+    sys.path.insert(0, APP_DIR)
+    work = tempfile.mkdtemp(prefix=f"bench-e2e-{n_chunks}-")
+    out_dir = os.path.join(work, "models")
+    os.makedirs(out_dir)
+    os.environ.update(MODEL_NAME=lm_dir, MODELS_DIR=out_dir, MAIL_SPOOL_DIR=os.path.join(work, "spool"),
+                      TRACE_LOG="0", ANSWER_CACHE_THRESHOLD="2")  # unique questions, no semantic hits
+    os.chdir(work)  # build_index creates ./models on import
+
+    from embedder import register_embedder
+    register_embedder(HashEmbedder())
+
+    row = {"chunks": n_chunks, "baseline_rss_mb": _peak_rss_mb()}
+    docs, chunks = synthetic_corpus(n_chunks, seed=n_chunks)
+    row["docs"] = len(docs)
+    row["build"] = bench_build(chunks, out_dir, args.index_type)
+    row["retrieval"] = bench_retrieval(out_dir, args.queries)
+    if args.concurrency:
+        row["ask"] = bench_ask(args.server, args.concurrency, args.duration, args.max_new_tokens)
+    row["peak_rss_mb"] = _peak_rss_mb()
+    results.put(row)
+
+
+def _compare(rows, baseline_path):
+    with open(baseline_path) as f:
+        base = {r["chunks"]: r for r in json.load(f)["results"]}
+    keys = [("build", "build_s"), ("retrieval", "p50_ms"), ("retrieval", "p99_ms"),
+            ("ask", "rps"), ("ask", "p50_ms"), ("ask", "p99_ms"), (None, "peak_rss_mb")]
+    for row in rows:
+        old = base.get(row["chunks"])
+        if old is None:
+            continue
+        parts = []
+        for section, key in keys:
+            new_v = (row.get(section) or {}).get(key) if section else row.get(key)
+            old_v = (old.get(section) or {}).get(key) if section else old.get(key)
+            if new_v is not None and old_v:
+                parts.append(f"{section + '.' if section else ''}{key} {old_v} -> {new_v} ({new_v / old_v:.2f}x)")
+        print(f"chunks={row['chunks']}: " + "; ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000], help="corpus sizes in chunks")
+    parser.add_argument("--index-type", default="flat", help="flat, ivf, ivfpq or hnsw (see index_factory)")
+    parser.add_argument("--queries", type=int, default=500, help="retrieval queries per corpus")
+    parser.add_argument("--concurrency", type=int, default=8, help="/ask clients (0 skips the serving phase)")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of /ask load")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--out", default="e2e_bench.json")
+    args = parser.parse_args()
+    out_path = os.path.abspath(args.out)
+
+    lm_dir = tempfile.mkdtemp(prefix="bench-e2e-lm-")
+    make_tiny_lm(lm_dir)
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    for n in args.chunks:
+        results = ctx.Queue()
+        proc = ctx.Process(target=_run_size, args=(n, args, lm_dir, results))
+        proc.start()
+        while True:
+            try:
+                row = results.get(timeout=5)
+                break
+            except queue.Empty:
+                if not proc.is_alive():
+                    raise RuntimeError(f"benchmark for {n} chunks exited with code {proc.exitcode}")
+        proc.join(30)
+        if proc.is_alive():
+            proc.kill()  # daemon server threads
+        rows.append(row)
+        ask = row.get("ask") or {}
+        print(f"chunks={n}: build {row['build']['build_s']}s  retrieval p50={row['retrieval']['p50_ms']}ms "
+              f"p99={row['retrieval']['p99_ms']}ms  /ask {ask.get('rps')} rps p99={ask.get('p99_ms')}ms  "
+              f"peak rss {row['peak_rss_mb']} MB")
+
+    if args.baseline:
+        _compare(rows, args.baseline)
+    with open(out_path, "w") as f:
+        json.dump({"index_type": args.index_type, "server": args.server, "concurrency": args.concurrency,
+                   "duration_s": args.duration, "max_new_tokens": args.max_new_tokens, "results": rows}, f, indent=2)
+    print(f"Wrote {out_path}")
+
+
+if __name__ == "__main__":
+    main()
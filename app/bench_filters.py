@@ -0,0 +1,139 @@
+# app/bench_filters.py
+"""
+Filtered retrieval on a synthetic multi-resume corpus: FAISS searches
+restricted by an ID selector (index_factory.filtered_search) against
+post-filtering an over-fetched top-k.
+
+    python app/bench_filters.py --chunks 100000 --out filter_bench.json
+
+Each chunk gets a document, section and year range (chunk_meta columns);
+filters of decreasing selectivity are compiled into row masks with
+chunk_meta.ChunkMetadata.mask(). For every index type and filter it reports
+single-query p50/p99, recall@k against an exact scan of the allowed rows,
+and the share of queries that came back with a full k.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bench_ann import make_queries, synthetic_corpus
+from chunk_meta import SECTIONS, ChunkMetadata
+from index_factory import IDFilter, build_ann_index, filtered_search, set_search_params
+
+FILTERS = {
+    "none": {},
+    "years>=2020": {"year_from": 2020},
+    "section": {"section": "education"},
+    "section+years": {"section": "experience", "year_from": 2022},
+    "one doc": {"doc": "resume_00007"},
+}
+
+
+def synthetic_metadata(n_chunks, chunks_per_doc=40, seed=0):
+    """Resume-shaped columns: each document walks through its sections in order, with a span of years."""
+    rng = np.random.default_rng(seed)
+    n_docs = -(-n_chunks // chunks_per_doc)
+    doc_ids = np.repeat(np.arange(n_docs), chunks_per_doc)[:n_chunks].astype(np.int32)
+    # experience-heavy, like real resumes; sections are contiguous within a document
+    weights = np.array([0.05, 0.05, 0.45, 0.15, 0.15, 0.10, 0.05])
+    section = np.empty(n_chunks, dtype=np.int8)
+    for doc in range(n_docs):
+        rows = np.flatnonzero(doc_ids == doc)
+        counts = rng.multinomial(len(rows), weights)
+        section[rows] = np.repeat(np.arange(len(SECTIONS)), counts)
+    year_from = rng.integers(2000, 2026, n_chunks).astype(np.int16)
+    year_to = np.minimum(year_from + rng.integers(0, 5, n_chunks), 2026).astype(np.int16)
+    undated = rng.random(n_chunks) < 0.3
+    year_from[undated], year_to[undated] = -1, -1
+    docs = [f"corpus/resume_{doc:05d}.txt" for doc in range(n_docs)]
+    return ChunkMetadata(section, year_from, year_to, doc_ids=doc_ids, docs=docs)
+
+
+def exact_filtered(vectors, queries, mask, k):
+    rows = np.flatnonzero(mask)
+    scores = queries @ vectors[rows].T
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return rows[top]
+
+
+def post_filter_search(index, query, k, mask, over_fetch):
+    """The alternative: fetch k * over_fetch, drop disallowed hits, keep the first k."""
+    _, I = index.search(query, k * over_fetch)
+    hits = I[0][I[0] != -1]
+    return hits[mask[hits]][:k]
+
+
+def _valid(hits):
+    return hits[hits != -1]
+
+
+def measure(search, queries, truth):
+    latencies, found = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = search(q[None, :])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found.append(hits)
+    want = truth.shape[1]
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "recall_at_k": round(float(np.mean([len(set(f.tolist()) & set(t.tolist())) / want
+                                            for f, t in zip(found, truth)])), 4),
+        "full_k_pct": round(100 * float(np.mean([len(f) >= want for f in found])), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--over-fetch", type=int, default=10, help="post-filter fetches k * this many")
+    parser.add_argument("--types", nargs="+", default=["flat", "ivf", "hnsw"])
+    parser.add_argument("--out", default="filter_bench.json")
+    args = parser.parse_args()
+
+    vectors = synthetic_corpus(args.chunks, args.dim)
+    queries = make_queries(vectors, args.queries)
+    meta = synthetic_metadata(args.chunks)
+    ids = np.arange(args.chunks, dtype=np.int64)
+    masks = {name: meta.mask(**f) for name, f in FILTERS.items()}
+    truths = {name: exact_filtered(vectors, queries, np.ones(args.chunks, bool) if mask is None else mask, args.k)
+              for name, mask in masks.items()}
+    print(f"corpus: {args.chunks} chunks, {len(meta.docs)} docs, dim {args.dim}")
+
+    rows = []
+    for kind in args.types:
+        t0 = time.perf_counter()
+        index = set_search_params(build_ann_index(kind, vectors, ids))
+        print(f"{kind}: built in {time.perf_counter() - t0:.1f}s")
+        for name, mask in masks.items():
+            selectivity = 1.0 if mask is None else float(mask.mean())
+            if mask is None:
+                runs = {"unfiltered": lambda q: index.search(q, args.k)[1][0]}
+            else:
+                id_filter = IDFilter(ids[mask])
+                runs = {
+                    "pre-filter": lambda q: filtered_search(index, q, args.k, id_filter)[1][0],
+                    f"post-filter x{args.over_fetch}":
+                        lambda q: post_filter_search(index, q, args.k, mask, args.over_fetch),
+                }
+            for method, search in runs.items():
+                row = {"index": kind, "filter": name, "selectivity_pct": round(100 * selectivity, 3),
+                       "method": method, **measure(lambda q: _valid(search(q)), queries, truths[name])}
+                rows.append(row)
+                print(f"  {name:14s} {row['selectivity_pct']:7.3f}%  {method:15s} p50 {row['p50_ms']:8.3f} ms  "
+                      f"p99 {row['p99_ms']:8.3f} ms  recall {row['recall_at_k']:.3f}  full k {row['full_k_pct']:5.1f}%")
+
+    with open(args.out, "w") as f:
+        json.dump({"chunks": args.chunks, "dim": args.dim, "k": args.k, "over_fetch": args.over_fetch,
+                   "results": rows}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# app/bench_quantization.py
+"""
+Compare LLM loading modes on CPU: resident memory, decode tokens/s and how
+closely greedy answers track the fp32 baseline.
+
+    python app/bench_quantization.py --modes fp32 int8 --out quant_bench.json
+    python app/bench_quantization.py --modes fp32 int8 int4    (int4 on CPU needs optimum-quanto)
+
+Each mode is loaded in a fresh process so memory numbers don't overlap. A
+mode whose process fails or dies is recorded with an "error" instead.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import resource
+import time
+
+PROMPTS = [
+    "Resume context:\nProfessional Experience: 4+ years at Bank of America, Brillio, Accenture, and Sheetz.\n\nUser question: Tell me about your experience\n\nAnswer:",
+    "Resume context:\nTechnical Skills: Java, Python, Spring Boot, Kafka, Kubernetes, AWS, GCP, Azure.\n\nUser question: What are your technical skills?\n\nAnswer:",
+    "Resume context:\nEducation: Master of Software Engineering from Carnegie Mellon University (2024).\n\nUser question: Tell me about your education\n\nAnswer:",
+]
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / 2**20
+
+
+def _run_mode(model_name, mode, max_new_tokens, results):
+    try:
+        results.put(_measure(model_name, mode, max_new_tokens))
+    except Exception as e:  # e.g. int4 without optimum-quanto
+        results.put({"mode": mode, "error": f"{type(e).__name__}: {e}"})
+
+
+def _measure(model_name, mode, max_new_tokens):
+    import torch
+    from transformers import AutoTokenizer
+    from model_loader import load_causal_lm
+
+    t0 = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = load_causal_lm(model_name, "cpu", quantize=mode)
+    load_s = time.perf_counter() - t0
+
+    outputs, new_tokens, gen_s = [], 0, 0.0
+    with torch.inference_mode():
+        for prompt in PROMPTS:
+            inputs = tokenizer(prompt, return_tensors="pt")
+            t0 = time.perf_counter()
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                 pad_token_id=tokenizer.eos_token_id)
+            gen_s += time.perf_counter() - t0
+            ids = out[0, inputs["input_ids"].shape[1]:].tolist()
+            new_tokens += len(ids)
+            outputs.append(ids)
+
+    return {
+        "mode": mode,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(_rss_mb(), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "tokens_per_s": round(new_tokens / gen_s, 2) if gen_s else None,
+        "outputs": outputs,
+        "texts": [tokenizer.decode(ids, skip_special_tokens=True) for ids in outputs],
+    }
+
+
+def _wait_result(proc, results, mode, poll_s=5.0):
+    """The row `proc` reports, or an error row if it exits (e.g. killed for OOM) without one."""
+    while True:
+        try:
+            return results.get(timeout=poll_s)
+        except queue.Empty:
+            if proc.is_alive():
+                continue
+        try:  # it may have reported just before exiting
+            return results.get(timeout=1.0)
+        except queue.Empty:
+            return {"mode": mode, "error": f"process exited with code {proc.exitcode}"}
+
+
+def _agreement(ref, ids):
+    """Fraction of reference tokens reproduced before the first divergence."""
+    n = 0
+    for a, b in zip(ref, ids):
+        if a != b:
+            break
+        n += 1
+    return n / len(ref) if ref else 1.0
+
+
+def _word_f1(ref, text):
+    ref_words, words = ref.lower().split(), text.lower().split()
+    common = sum(min(ref_words.count(w), words.count(w)) for w in set(words))
+    if not common:
+        return 0.0
+    precision, recall = common / len(words), common / len(ref_words)
+    return 2 * precision * recall / (precision + recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="NousResearch/Llama-2-7b-chat-hf")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "int8"],
+                        help="any of fp32 bf16 int8 int4 (int4 on CPU needs optimum-quanto)")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--out", default="quant_bench.json")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    for mode in args.modes:
+        results = ctx.Queue()
+        proc = ctx.Process(target=_run_mode, args=(args.model, mode, args.max_new_tokens, results))
+        proc.start()
+        row = _wait_result(proc, results, mode)
+        proc.join()
+        rows.append(row)
+        if "error" in row:
+            print(f"{mode:>5}: failed ({row['error']})")
+        else:
+            print(f"{mode:>5}: rss={row['rss_mb']} MB  peak={row['peak_rss_mb']} MB  {row['tokens_per_s']} tok/s")
+
+    measured = [r for r in rows if "error" not in r]
+    baseline = next((r for r in measured if r["mode"] == "fp32"), measured[0] if measured else None)
+    for row in measured:
+        row["token_agreement"] = round(sum(
+            _agreement(ref, ids) for ref, ids in zip(baseline["outputs"], row["outputs"])) / len(PROMPTS), 3)
+        row["word_f1"] = round(sum(
+            _word_f1(ref, text) for ref, text in zip(baseline["texts"], row["texts"])) / len(PROMPTS), 3)
+        del row["outputs"]
+
+    with open(args.out, "w") as f:
+        json.dump({"model": args.model, "baseline": baseline and baseline["mode"], "results": rows}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
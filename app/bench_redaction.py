@@ -0,0 +1,187 @@
+# app/bench_redaction.py
+"""
+PII redaction throughput (MB/s) on a large synthetic corpus: the old
+one-re.sub-per-rule passes against the single-scan redaction engine.
+
+    python app/bench_redaction.py --mb 64 --out redaction_bench.json
+
+Three workloads, each checked for identical output against the old code:
+  index   build_index.clean_context rules (emails, links, phones -> "")
+  output  request screening + answer scrubbing (emails, phones -> [redacted])
+  stream  StreamRedactor fed token-sized deltas (also checked against
+          redact() on the whole text)
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from bench_e2e import FILLER_WORDS, TOPIC_WORDS
+from redaction import INDEX, OUTPUT, StreamRedactor, contains_pii
+
+
+# -------------------
+# The rules as they were applied before the engine
+# -------------------
+def legacy_clean_context(text):
+    text = re.sub(r'\S+@\S+', '', text)
+    text = re.sub(r'http\S+', '', text)
+    text = re.sub(r'linkedin\.com\S+', '', text)
+    text = re.sub(r'github\.com\S+', '', text)
+    text = re.sub(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}', '', text)
+    return text.strip()
+
+
+def legacy_redact(text):
+    text = re.sub(r'\S+@\S+', '[redacted]', text)
+    text = re.sub(r'\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b', '[redacted]', text)
+    return text
+
+
+LEGACY_PII = re.compile(r'(\b\d{10}\b|\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b|\S+@\S+)')
+_EMAIL = re.compile(r'\S+@\S+')
+_PHONE = re.compile(r'\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b')
+_TOKEN_START = re.compile(r'(?:^|(?<=\s))\S')
+
+
+class LegacyStreamRedactor:
+    def __init__(self):
+        self._buffer = ""
+
+    def _safe_cut(self):
+        starts = [m.start() for m in _TOKEN_START.finditer(self._buffer)]
+        if len(starts) <= 3:
+            return 0
+        cut = starts[-3]
+        for regex in (_EMAIL, _PHONE):
+            for m in regex.finditer(self._buffer):
+                if m.start() < cut < m.end():
+                    cut = m.start()
+        return cut
+
+    def feed(self, delta):
+        self._buffer += delta
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return legacy_redact(ready)
+
+    def flush(self):
+        ready, self._buffer = self._buffer, ""
+        return legacy_redact(ready)
+
+
+# -------------------
+# Corpus
+# -------------------
+def _pii(rng):
+    n = lambda k: "".join(rng.choice("0123456789") for _ in range(k))
+    return rng.choice([
+        lambda: f"jane.doe{n(2)}@example.com",
+        lambda: f"{n(3)}-{n(3)}-{n(4)}",
+        lambda: f"({n(3)}) {n(3)}-{n(4)}",
+        lambda: f"{n(3)}.{n(3)}.{n(4)}",
+        lambda: n(10),
+        lambda: f"https://example.com/p/{n(4)}",
+        lambda: f"linkedin.com/in/jane-{n(3)}",
+        lambda: f"github.com/jane{n(2)}/repo",
+        lambda: f"v{n(1)}.{n(2)}",  # digits that are not PII
+    ])()
+
+
+def synthetic_text(mb, pii_rate=0.01, seed=0):
+    """About `mb` MB of resume-like prose with PII sprinkled in at `pii_rate` per word."""
+    rng = random.Random(seed)
+    vocab = TOPIC_WORDS + list(FILLER_WORDS)
+    words, size, target = [], 0, int(mb * 1024 * 1024)
+    while size < target:
+        w = _pii(rng) if rng.random() < pii_rate else rng.choice(vocab)
+        if rng.random() < 0.02:
+            w += ".\n\n" if rng.random() < 0.2 else "."
+        words.append(w)
+        size += len(w) + 1
+    return " ".join(words)
+
+
+# -------------------
+# Timing
+# -------------------
+def _best(fn, text, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(text)
+        seconds = time.perf_counter() - t0
+        best = seconds if best is None else min(best, seconds)
+    return out, best
+
+
+def _stream(text, redactor_cls=StreamRedactor):
+    redactor, parts = redactor_cls(), []
+    for delta in re.findall(r'\s*\S+', text):  # roughly one token per delta
+        parts.append(redactor.feed(delta))
+    parts.append(redactor.flush())
+    return "".join(parts)
+
+
+def _mismatches(a_lines, b_lines):
+    return sum(1 for a, b in zip(a_lines, b_lines) if a != b) + abs(len(a_lines) - len(b_lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=32, help="corpus size for index/output")
+    parser.add_argument("--stream-mb", type=float, default=2, help="corpus size for the streaming run")
+    parser.add_argument("--pii-rate", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="redaction_bench.json")
+    args = parser.parse_args()
+
+    text = synthetic_text(args.mb, args.pii_rate)
+    mb = len(text.encode()) / (1024 * 1024)
+    print(f"corpus: {mb:.1f} MB, pii rate {args.pii_rate}")
+
+    rows = []
+
+    def compare(name, legacy_fn, engine_fn, sample, sample_mb, repeat):
+        old, old_s = _best(legacy_fn, sample, repeat)
+        new, new_s = _best(engine_fn, sample, repeat)
+        row = {
+            "workload": name,
+            "mb": round(sample_mb, 2),
+            "legacy_mb_per_s": round(sample_mb / old_s, 1),
+            "engine_mb_per_s": round(sample_mb / new_s, 1),
+            "speedup": round(old_s / new_s, 2),
+            "identical_output": old == new,
+        }
+        if old != new:
+            # per paragraph, so the count is meaningful on a 32 MB string
+            row["mismatched_paragraphs"] = _mismatches(old.split("\n\n"), new.split("\n\n"))
+        rows.append(row)
+        print(f"{name:7s} legacy {row['legacy_mb_per_s']:7.1f} MB/s  engine {row['engine_mb_per_s']:7.1f} MB/s  "
+              f"x{row['speedup']}  identical={row['identical_output']}")
+
+    compare("index", legacy_clean_context, lambda t: INDEX.sub(t).strip(), text, mb, args.repeat)
+    compare("output", legacy_redact, OUTPUT.sub, text, mb, args.repeat)
+
+    # request screening is a yes/no per message; check it agrees line by line
+    lines = text.split("\n\n")
+    screened = sum(1 for line in lines if contains_pii(line))
+    disagree = sum(1 for line in lines if contains_pii(line) != bool(LEGACY_PII.search(line)))
+    print(f"screen  {screened}/{len(lines)} paragraphs flagged, {disagree} disagreements with the old PII_REGEX")
+
+    sample = text[: int(args.stream_mb * 1024 * 1024)]
+    compare("stream", lambda t: _stream(t, LegacyStreamRedactor), _stream, sample,
+            len(sample.encode()) / (1024 * 1024), 1)
+    print(f"stream  identical to redact() on the whole text: {_stream(sample) == OUTPUT.sub(sample)}")
+
+    with open(args.out, "w") as f:
+        json.dump({"corpus_mb": round(mb, 2), "pii_rate": args.pii_rate, "results": rows,
+                   "screening_disagreements": disagree}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# app/bench_speculative.py
+"""
+Speculative decoding on CPU: greedy tokens/s with and without a draft model,
+the draft acceptance rate, and a check that both paths give the same text.
+
+    python app/bench_speculative.py --draft TinyLlama/TinyLlama-1.1B-Chat-v1.0 --draft-tokens 2 4 6
+
+The draft must share the main model's tokenizer (any Llama-2-vocabulary
+model works with the Llama-2 chat model). By default prompts run one at a
+time, which is the case speculation helps most: a lone request leaves the
+CPU idle between single-token decode steps. With --concurrency N they are
+submitted N at a time, so the scheduler batches them instead of speculating
+(see GenerationScheduler.speculative_max_active).
+
+    python app/bench_speculative.py --draft-tokens 4 --concurrency 4
+"""
+import argparse
+import json
+import time
+
+from bench_quantization import PROMPTS
+
+
+def _run(scheduler, max_new_tokens, speculative, concurrency=1):
+    for key in scheduler.stats:
+        scheduler.stats[key] = 0
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(max(concurrency, len(PROMPTS)))]
+    texts, t0 = [], time.perf_counter()
+    for start in range(0, len(prompts), concurrency):
+        futures = [scheduler.submit(prompt, max_new_tokens=max_new_tokens, do_sample=False, speculative=speculative)
+                   for prompt in prompts[start:start + concurrency]]
+        texts.extend(f.result() for f in futures)
+    return texts, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="NousResearch/Llama-2-7b-chat-hf")
+    parser.add_argument("--draft", default="TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[2, 4, 6])
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=1, help="prompts submitted at once")
+    parser.add_argument("--out", default="speculative_bench.json")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    from generation import GenerationScheduler
+    from model_loader import load_causal_lm
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = load_causal_lm(args.model, "cpu")
+    draft = load_causal_lm(args.draft, "cpu")
+
+    scheduler = GenerationScheduler(model, tokenizer, "cpu", max_batch_size=args.concurrency, draft_model=draft)
+    _run(scheduler, 4, speculative=True)  # warm-up
+
+    baseline, base_s = _run(scheduler, args.max_new_tokens, speculative=False, concurrency=args.concurrency)
+    base_tps = scheduler.metrics()["tokens_per_s"]
+    print(f"greedy: {base_tps} tok/s ({base_s:.1f}s)")
+
+    rows = []
+    for k in args.draft_tokens:
+        scheduler.num_draft_tokens = k
+        texts, seconds = _run(scheduler, args.max_new_tokens, speculative=True, concurrency=args.concurrency)
+        metrics = scheduler.metrics()
+        row = {
+            "draft_tokens": k,
+            "tokens_per_s": metrics["tokens_per_s"],
+            "speedup": round(base_s / seconds, 2),
+            "acceptance_rate": metrics["acceptance_rate"],
+            "identical_output": texts == baseline,
+        }
+        rows.append(row)
+        print(f"k={k}: {row['tokens_per_s']} tok/s  x{row['speedup']}  accept={row['acceptance_rate']}  "
+              f"identical={row['identical_output']}")
+
+    with open(args.out, "w") as f:
+        json.dump({"model": args.model, "draft": args.draft, "max_new_tokens": args.max_new_tokens,
+                   "concurrency": args.concurrency,
+                   "greedy_tokens_per_s": base_tps, "results": rows}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# app/bench_tenants.py
+"""
+Multi-tenant serving: memory and latency of tenants.TenantPool under
+skewed traffic, at several memory budgets.
+
+    python app/bench_tenants.py --tenants 200 --chunks 2000 --out tenant_bench.json
+
+Builds --tenants synthetic tenant indexes (hashing embedder, flat index)
+under --root, then sends --queries retrievals whose tenants follow a Zipf
+distribution, so a few tenants are hot and most are rarely asked about.
+For each budget (a percentage of what all tenants together need) it
+reports the resident footprint, process RSS, hit rate, evictions and
+warm / cold-load latency. A last run fans queries out over --fan-out
+shards, against asking each shard separately.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import time
+
+import faiss
+import numpy as np
+
+from bench_e2e import TOPIC_WORDS, HashEmbedder, synthetic_corpus
+from chunk_store import ChunkStore, write_chunk_store
+from embedder import register_embedder
+from index_factory import build_ann_index
+from retrieval import save_bm25
+from tenants import INDEX_FILE, TenantPool, footprint
+
+
+def rss_mb():
+    """Current resident set size (peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def build_tenants(root, n_tenants, n_chunks, embedder):
+    tenant_ids = [f"tenant{t:04d}" for t in range(n_tenants)]
+    for t, tenant_id in enumerate(tenant_ids):
+        out_dir = os.path.join(root, tenant_id)
+        if os.path.exists(os.path.join(out_dir, INDEX_FILE)):
+            continue  # reuse a previous run's corpus
+        os.makedirs(out_dir, exist_ok=True)
+        _, chunks = synthetic_corpus(n_chunks, seed=t)
+        embeddings = embedder.encode(chunks, normalize_embeddings=True)
+        ids = np.arange(len(chunks), dtype=np.int64)
+        write_chunk_store(out_dir, chunks, embeddings, ids)
+        faiss.write_index(build_ann_index("flat", embeddings, ids), os.path.join(out_dir, INDEX_FILE))
+        save_bm25(ChunkStore(out_dir), out_dir)
+    return tenant_ids
+
+
+def zipf_traffic(tenant_ids, n_queries, s=1.1, seed=0):
+    """(tenant id, query) pairs; tenant popularity ~ 1 / rank**s."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) ** s for rank in range(len(tenant_ids))]
+    tenants = rng.choices(tenant_ids, weights=weights, k=n_queries)
+    # 4+ terms, so queries take the dense path rather than BM25 alone
+    return [(t, " ".join(rng.choices(TOPIC_WORDS, k=rng.randint(4, 7)))) for t in tenants]
+
+
+def _pcts(ms):
+    if not ms:
+        return None, None
+    return round(float(np.percentile(ms, 50)), 3), round(float(np.percentile(ms, 99)), 3)
+
+
+def run_budget(root, traffic, budget_mb, k):
+    pool = TenantPool(root, memory_budget_mb=budget_mb)
+    rss_before = rss_mb()
+    warm, cold, peak_resident = [], [], 0.0
+    for tenant_id, query in traffic:
+        loads = pool.loads
+        t0 = time.perf_counter()
+        pool.retrieve(tenant_id, query, k)
+        ms = (time.perf_counter() - t0) * 1000
+        (cold if pool.loads > loads else warm).append(ms)
+        peak_resident = max(peak_resident, pool.stats()["resident_mb"])
+    stats = pool.stats()
+    rss_after = rss_mb()
+    pool.close()
+    warm_p50, warm_p99 = _pcts(warm)
+    cold_p50, _ = _pcts(cold)
+    return {
+        "budget_mb": round(budget_mb, 1),
+        "peak_resident_mb": round(peak_resident, 1),
+        "resident_tenants": stats["resident"],
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+        "hit_rate": round(stats["hit_rate"], 4),
+        "loads": stats["loads"],
+        "evictions": stats["evictions"],
+        "warm_p50_ms": warm_p50,
+        "warm_p99_ms": warm_p99,
+        "cold_p50_ms": cold_p50,
+    }
+
+
+def run_fan_out(root, tenant_ids, queries, shards, k):
+    pool = TenantPool(root, memory_budget_mb=1e9)
+    group = tenant_ids[:shards]
+    for tenant_id in group:  # load outside the timed loop
+        pool.retrieve(tenant_id, "warm up", 1)
+    fan, separate = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        pool.fan_out(query, k, group)
+        fan.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        for tenant_id in group:
+            pool.retrieve(tenant_id, query, k)
+        separate.append((time.perf_counter() - t0) * 1000)
+    pool.close()
+    return {"shards": shards, "fan_out_p50_ms": _pcts(fan)[0], "fan_out_p99_ms": _pcts(fan)[1],
+            "per_shard_sum_p50_ms": _pcts(separate)[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default="bench_tenants")
+    parser.add_argument("--tenants", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=2000, help="chunks per tenant")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--budget-pct", type=float, nargs="+", default=[5, 20, 100])
+    parser.add_argument("--fan-out", type=int, default=8)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--out", default="tenant_bench.json")
+    args = parser.parse_args()
+
+    embedder = HashEmbedder()
+    register_embedder(embedder)
+    t0 = time.perf_counter()
+    tenant_ids = build_tenants(args.root, args.tenants, args.chunks, embedder)
+    total_mb = sum(footprint(os.path.join(args.root, t)) for t in tenant_ids) / 2**20
+    print(f"{len(tenant_ids)} tenants x {args.chunks} chunks under {args.root} "
+          f"({time.perf_counter() - t0:.1f}s); all tenants resident: {total_mb:.1f} MB")
+
+    traffic = zipf_traffic(tenant_ids, args.queries, args.zipf)
+    rows = []
+    for pct in args.budget_pct:
+        row = {"budget_pct": pct, **run_budget(args.root, traffic, total_mb * pct / 100, args.k)}
+        rows.append(row)
+        print(f"budget {pct:5.1f}% ({row['budget_mb']:7.1f} MB): peak resident {row['peak_resident_mb']:7.1f} MB, "
+              f"rss +{row['rss_growth_mb']} MB, hit rate {row['hit_rate']:.3f}, {row['loads']} loads, "
+              f"{row['evictions']} evictions, warm p50/p99 {row['warm_p50_ms']}/{row['warm_p99_ms']} ms, "
+              f"cold p50 {row['cold_p50_ms']} ms")
+
+    fan_out = run_fan_out(args.root, tenant_ids, [q for _, q in traffic[:200]], min(args.fan_out, len(tenant_ids)),
+                          args.k)
+    print(f"fan-out over {fan_out['shards']} shards: p50 {fan_out['fan_out_p50_ms']} ms "
+          f"(p99 {fan_out['fan_out_p99_ms']}), asking each shard separately: p50 {fan_out['per_shard_sum_p50_ms']} ms")
+
+    with open(args.out, "w") as f:
+        json.dump({"tenants": len(tenant_ids), "chunks_per_tenant": args.chunks, "queries": args.queries,
+                   "zipf": args.zipf, "all_resident_mb": round(total_mb, 1), "results": rows, "fan_out": fan_out},
+                  f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
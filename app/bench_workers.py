@@ -0,0 +1,248 @@
+# app/bench_workers.py
+"""
+Front-end scaling benchmark for the split deployment: one model server,
+N HTTP workers (uvicorn serve_async:app --workers N) talking to it over
+its Unix socket, and a closed-loop load generator hitting /ask.
+
+    python app/bench_workers.py --workers 1 2 4 --concurrency 32 --duration 20
+    python app/bench_workers.py --model-server /tmp/resume-model.sock   # real model
+
+Without --model-server a stub model server is started whose decode step
+costs --step-ms regardless of batch size (like the batched scheduler), so
+the numbers isolate front-end overhead and IPC. Reports requests/s,
+latency percentiles, 429s and the workers' total RSS per worker count.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# -------------------
+# Stub model server
+# -------------------
+class _StubRequest:
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.cancelled = False
+        self.text = ""
+        self.n = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class StubScheduler:
+    """Emits one token per active request every `step_ms`, up to `max_batch_size` at a time."""
+
+    def __init__(self, step_ms, tokens, max_batch_size=8):
+        self.step_s = step_ms / 1000.0
+        self.tokens = tokens
+        self.max_batch_size = max_batch_size
+        self._pending = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def queue_depth(self):
+        return self._pending.qsize()
+
+    def stream(self, prompt, **kwargs):
+        from generation import TokenStreamer
+
+        streamer = TokenStreamer()
+        streamer.request = _StubRequest(streamer)
+        self._pending.put(streamer.request)
+        return streamer
+
+    def generate(self, prompt, **kwargs):
+        return "".join(self.stream(prompt, **kwargs))
+
+    def metrics(self):
+        return {}
+
+    def _run(self):
+        active = []
+        while True:
+            if not active:
+                active.append(self._pending.get())
+            while len(active) < self.max_batch_size and not self._pending.empty():
+                active.append(self._pending.get_nowait())
+            time.sleep(self.step_s)
+            for req in list(active):
+                if req.cancelled:
+                    req.streamer.fail(CancelledError())
+                    active.remove(req)
+                    continue
+                req.n += 1
+                req.text += f"tok{req.n} "
+                req.streamer.put(req.text, done=req.n >= self.tokens)
+                if req.n >= self.tokens:
+                    active.remove(req)
+
+
+class StubContext:
+    def __init__(self):
+        from resume_sections import RESUME_SECTIONS
+        self.sections = RESUME_SECTIONS
+
+    def retrieve(self, query, k=3):
+        return self.sections[:k]
+
+    def build(self, query, budget_tokens):
+        return self.sections[:2]
+
+    def budget_for(self, prompt_template, max_input_tokens, reserve=8):
+        return max_input_tokens // 2
+
+
+class StubEmbedder:
+    def encode(self, texts, **kwargs):
+        vecs = np.random.default_rng(abs(hash(tuple(texts))) % 2**32).standard_normal((len(texts), 384))
+        return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _serve_stub(address, step_ms, tokens, max_batch, ready):
+    sys.path.insert(0, APP_DIR)
+    from model_server import ModelServer
+
+    context = StubContext()
+    ModelServer(StubScheduler(step_ms, tokens, max_batch), context, context, StubEmbedder()).serve(address, ready)
+
+
+# -------------------
+# Workers + load
+# -------------------
+def _tree_rss_mb(pid):
+    """RSS of `pid` and all its descendants (Linux /proc)."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                stack.extend(int(c) for c in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total / 2**20
+
+
+def _start_workers(n, port, env):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "serve_async:app", "--port", str(port), "--workers", str(n),
+         "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    )
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).ok:
+                time.sleep(2)  # let the remaining workers finish importing
+                return proc
+        except requests.RequestException:
+            time.sleep(0.5)
+    proc.kill()
+    raise RuntimeError("workers did not come up")
+
+
+def _load(url, concurrency, duration):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(cid):
+        session = requests.Session()
+        i = 0
+        while time.monotonic() < stop_at:
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                r = session.post(url, json={"msg": f"client {cid} request {i}: what did you build with Kafka?"},
+                                 timeout=120)
+                status = r.status_code
+            except requests.RequestException:
+                status = "error"
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "ok": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(lat, 50)), 1),
+        "p95_ms": round(float(np.percentile(lat, 95)), 1),
+        "p99_ms": round(float(np.percentile(lat, 99)), 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--model-server", help="socket of a running model_server.py (default: start a stub)")
+    parser.add_argument("--step-ms", type=float, default=20.0, help="stub decode step time")
+    parser.add_argument("--tokens", type=int, default=32, help="stub tokens per answer")
+    parser.add_argument("--max-batch", type=int, default=32, help="stub decode batch size")
+    parser.add_argument("--out", default="workers_bench.json")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-workers-")
+    stub = None
+    address = args.model_server
+    if address is None:
+        address = os.path.join(tmp, "model.sock")
+        ready = mp.Event()
+        stub = mp.Process(target=_serve_stub, args=(address, args.step_ms, args.tokens, args.max_batch, ready),
+                          daemon=True)
+        stub.start()
+        ready.wait(60)
+
+    env = dict(os.environ, MODEL_SERVER=address, MAIL_SPOOL_DIR=os.path.join(tmp, "spool"),
+               ANSWER_CACHE_SIZE="1", ASK_MAX_CONCURRENCY=str(args.concurrency),
+               ASK_MAX_QUEUE=str(args.concurrency))
+    results = []
+    try:
+        for n in args.workers:
+            proc = _start_workers(n, args.port, env)
+            try:
+                row = {"workers": n, "concurrency": args.concurrency,
+                       **_load(f"http://127.0.0.1:{args.port}/ask", args.concurrency, args.duration),
+                       "workers_rss_mb": round(_tree_rss_mb(proc.pid), 1)}
+            finally:
+                proc.terminate()
+                proc.wait(30)
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+    with open(args.out, "w") as f:
+        json.dump({"model_server": args.model_server or "stub", "step_ms": args.step_ms, "tokens": args.tokens,
+                   "duration_s": args.duration, "results": results}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,23 @@
 # app/build_index.py
-import os, re, pickle, numpy as np, faiss
-from sentence_transformers import SentenceTransformer
+import os, re, sys, json, time, numpy as np, faiss
+from embedder import EMBED_MODEL_NAME
+from chunk_store import ChunkStore, write_chunk_store
+from embedding_cache import EmbeddingCache, chunk_id
+from index_factory import INDEX_TYPES, build_ann_index, effective_kind, index_kind
+from retrieval import save_bm25
+from redaction import INDEX as INDEX_REDACTOR
+from chunker import token_chunker
+import chunk_meta
 
 DATA_FILE = "data/resume.txt"   # put your resume text here (plain .txt)
 OUT_DIR = "models"
+INDEX_FILE = "resume.index"
+META_FILE = "index_meta.json"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 def clean_context(text):
-    text = re.sub(r'\S+@\S+', '', text)         # emails
-    text = re.sub(r'http\S+', '', text)         # links
-    text = re.sub(r'linkedin\.com\S+', '', text)
-    text = re.sub(r'github\.com\S+', '', text)
-    text = re.sub(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}', '', text)
-    return text.strip()
+    """Drop emails, links and phone numbers (one scan, see redaction.INDEX)."""
+    return INDEX_REDACTOR.sub(text).strip()
 
 def split_into_chunks(text, chunk_size=80, overlap=20):
     """
@@ -33,28 +38,131 @@ def split_sentences(text):
     parts = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\!|\?)\s', text)
     return [p.strip() for p in parts if p.strip()]
 
-if __name__ == "__main__":
-    if not os.path.exists(DATA_FILE):
-        raise FileNotFoundError(
-            f"{DATA_FILE} not found. Create it and paste your resume text."
-        )
+def split_paragraph_chunks(text, chunk_size=80, overlap=20, chunker=None):
+    """
+    split_into_chunks applied per paragraph (blank-line separated), so editing
+    one paragraph only changes that paragraph's chunks instead of shifting
+    every window after it. With a chunker.TokenChunker the windows are
+    token-bounded instead (all paragraphs tokenized in one batch).
+    """
+    paragraphs = re.split(r'\n\s*\n', text)
+    if chunker is not None:
+        return [chunk for chunks in chunker.chunk_batch(paragraphs) for chunk in chunks]
+    chunks = []
+    for para in paragraphs:
+        chunks.extend(split_into_chunks(para, chunk_size=chunk_size, overlap=overlap))
+    return chunks
+
+def _read_meta(out_dir):
+    path = os.path.join(out_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def update_index(chunks, out_dir=OUT_DIR, model_name=EMBED_MODEL_NAME, rebuild=False, kind="flat",
+                 sources=None, meta=None, **index_kwargs):
+    """
+    Bring the index in `out_dir` in line with `chunks`, re-encoding only chunks
+    whose content hash is new. The FAISS index is an IndexIDMap2 keyed by
+    chunk_id(), so stale vectors are removed by id and new ones appended;
+    `rebuild=True`, a different embedding model or index `kind` (see
+    index_factory; a kind that fell back to flat counts as unchanged until
+    the corpus is large enough to train it) rebuilds it from the cached
+    embeddings. HNSW can't remove vectors, so it is always rebuilt.
+
+    `sources` (source file of each chunk) and `meta` (chunk_meta columns
+    aligned with `chunks`) are stored for filtered retrieval.
+    """
+    start = time.perf_counter()
+
+    # identical chunks collapse onto one id
+    ids, texts, keep, seen = [], [], [], set()
+    for row, chunk in enumerate(chunks):
+        key = chunk_id(chunk)
+        if key not in seen:
+            seen.add(key)
+            ids.append(key)
+            texts.append(chunk)
+            keep.append(row)
+    if not texts:
+        raise ValueError("No chunks to index.")
+    ids = np.asarray(ids, dtype=np.int64)
 
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        full_text = f.read()
+    cache = EmbeddingCache(os.path.join(out_dir, "embedding_cache"), model_name)
+    embeddings, encoded = cache.embed(texts, ids)
 
-    chunks = chunks = split_into_chunks(clean_context(full_text), chunk_size=80, overlap=20)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    index = None
+    if not rebuild and kind != "hnsw" and os.path.exists(index_path) and _read_meta(out_dir).get("embed_model") == model_name:
+        index = faiss.read_index(index_path)
+        # an ivf request on a corpus too small to train stays flat (and incremental)
+        # until the corpus grows enough to train it
+        if (not hasattr(index, "id_map") or index.d != embeddings.shape[1]
+                or index_kind(index) != effective_kind(kind, len(ids))):
+            index = None  # pre-incremental index or a different type: rebuild once
 
-    # embed with cosine-normalized vectors
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = embedder.encode(chunks, normalize_embeddings=True)
-    embeddings = np.asarray(embeddings, dtype="float32")
+    if index is None:
+        # cosine => inner product on normalized vectors
+        index = build_ann_index(kind, embeddings, ids, **index_kwargs)
+        added, removed = len(ids), 0
+    else:
+        existing = faiss.vector_to_array(index.id_map)
+        stale = np.setdiff1d(existing, ids)
+        if len(stale):
+            index.remove_ids(faiss.IDSelectorBatch(stale))
+        new = ~np.isin(ids, existing)
+        if new.any():
+            index.add_with_ids(embeddings[new], ids[new])
+        added, removed = int(new.sum()), len(stale)
 
-    # cosine => inner product on normalized vectors
-    index = faiss.IndexFlatIP(embeddings.shape[1])
-    index.add(embeddings)
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    # mmap-able text + embeddings instead of a pickle (see chunk_store.py)
+    docs = doc_ids = None
+    if sources is not None:
+        position = {}
+        doc_ids = [position.setdefault(sources[row], len(position)) for row in keep]
+        docs = list(position)
+    if meta is not None:
+        meta = {name: np.asarray(column)[keep] for name, column in meta.items()}
+    write_chunk_store(out_dir, texts, embeddings, ids, doc_ids=doc_ids, docs=docs, meta=meta)
+    # BM25 term statistics for the lexical half of retrieval.HybridRetriever
+    save_bm25(ChunkStore(out_dir), out_dir)
+    cache.save(retain=ids)  # drop embeddings of chunks no longer in the corpus
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"embed_model": model_name, "dim": int(embeddings.shape[1]), "chunks": len(texts),
+                   "index_type": index_kind(index)}, f)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Indexed {len(texts)} chunks ({encoded} encoded, +{added}/-{removed} vectors) "
+          f"in {elapsed_ms:.1f} ms → {index_path}")
+    return index
+
+if __name__ == "__main__":
+    # usage: python build_index.py [--rebuild] [--index-type=flat|ivf|ivfpq|hnsw]
+    #                               [--chunk-tokens=N [--align-sentences]] [file.txt ...]
+    # (defaults to data/resume.txt, a flat index and 80-word chunks)
+    args = sys.argv[1:]
+    rebuild = "--rebuild" in args
+    kind = next((a.split("=", 1)[1] for a in args if a.startswith("--index-type=")), "flat")
+    if kind not in INDEX_TYPES:
+        raise SystemExit(f"--index-type must be one of {INDEX_TYPES}")
+    chunk_tokens = next((int(a.split("=", 1)[1]) for a in args if a.startswith("--chunk-tokens=")), None)
+    chunker = token_chunker(chunk_tokens, align_sentences="--align-sentences" in args) if chunk_tokens else None
+    files = [a for a in args if not a.startswith("--")] or [DATA_FILE]
 
-    faiss.write_index(index, os.path.join(OUT_DIR, "resume.index"))
-    with open(os.path.join(OUT_DIR, "chunks.pkl"), "wb") as f:
-        pickle.dump(chunks, f)
+    chunks, sources, meta = [], [], []
+    for path in files:
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found. Create it and paste your resume text."
+            )
+        with open(path, "r", encoding="utf-8") as f:
+            full_text = f.read()
+        file_chunks = split_paragraph_chunks(clean_context(full_text), chunk_size=80, overlap=20, chunker=chunker)
+        chunks.extend(file_chunks)
+        sources.extend([path] * len(file_chunks))
+        meta.append(chunk_meta.describe(file_chunks))
 
-    print(f"Built index with {len(chunks)} chunks → {OUT_DIR}/resume.index")
+    update_index(chunks, OUT_DIR, rebuild=rebuild, kind=kind, sources=sources, meta=chunk_meta.concat(meta))
@@ -0,0 +1,189 @@
+# app/chunk_meta.py
+"""
+Per-chunk metadata for filtered retrieval.
+
+Stored next to the chunk store as one array per column in chunk_meta.npz
+(the source-document column is the store's existing chunk_docs.npy):
+
+    section    int8   index into SECTIONS ("other" when no heading was seen)
+    year_from  int16  earliest year mentioned in the chunk (-1: none)
+    year_to    int16  latest year, "Present"/"Current" counting as this year
+
+ChunkMetadata.mask() turns a filter such as
+{"doc": "alice.txt", "section": "experience", "year_from": 2021}
+into a boolean row mask; retrieval turns that into the FAISS ids a search
+is restricted to (index_factory.IDFilter).
+"""
+import datetime
+import os
+import re
+
+import numpy as np
+
+CHUNK_META_FILE = "chunk_meta.npz"
+
+# the sections app.py's built-in corpus is split into (resume_sections.py)
+SECTIONS = ("other", "summary", "experience", "projects", "skills", "education", "awards")
+FILTER_KEYS = ("doc", "section", "year_from", "year_to")
+
+_HEADINGS = {
+    "summary": r"summary|profile|about me|objective",
+    "experience": r"(?:professional |work )?experience|employment(?: history)?|work history",
+    "projects": r"(?:key |selected |personal )?projects",
+    "skills": r"(?:technical |core |key )?skills|technologies|tech stack",
+    "education": r"education|academics?",
+    "awards": r"awards|honou?rs|achievements|certifications",
+}
+# "Education:" anywhere, or an all-caps "EDUCATION" heading
+_HEADING_REGEX = re.compile(
+    "|".join(rf"(?P<{name}>\b(?i:{pattern})\s*:|\b{pattern.upper()}\b)"
+             for name, pattern in _HEADINGS.items())
+)
+_YEAR_REGEX = re.compile(r"\b(19[5-9]\d|20\d\d)\b|\b(?i:present|current)\b")
+
+
+def _years(text, this_year):
+    years = [int(m.group(1)) if m.group(1) else this_year for m in _YEAR_REGEX.finditer(text)]
+    return (min(years), max(years)) if years else (-1, -1)
+
+
+def describe(chunks):
+    """
+    Metadata columns for one document's chunks, in document order. A chunk
+    belongs to the section whose heading was seen last before it starts
+    (or that it starts with); chunks before any heading are "other".
+    """
+    this_year = datetime.date.today().year
+    section = np.zeros(len(chunks), dtype=np.int8)
+    year_from = np.full(len(chunks), -1, dtype=np.int16)
+    year_to = np.full(len(chunks), -1, dtype=np.int16)
+    current = 0
+    for i, chunk in enumerate(chunks):
+        headings = list(_HEADING_REGEX.finditer(chunk))
+        if headings and headings[0].start() < 3:
+            current = SECTIONS.index(headings[0].lastgroup)
+        section[i] = current
+        if headings:
+            current = SECTIONS.index(headings[-1].lastgroup)
+        year_from[i], year_to[i] = _years(chunk, this_year)
+    return {"section": section, "year_from": year_from, "year_to": year_to}
+
+
+def concat(parts):
+    """Join per-document column dicts (in row order) into one."""
+    return {name: np.concatenate([p[name] for p in parts]) for name in ("section", "year_from", "year_to")}
+
+
+def save(out_dir, columns):
+    path = os.path.join(out_dir, CHUNK_META_FILE)
+    np.savez(path + ".tmp.npz", section_names=np.asarray(SECTIONS), **columns)
+    os.replace(path + ".tmp.npz", path)
+
+
+class ChunkMetadata:
+    """Metadata columns for every row of a chunk store (or in-memory chunk list)."""
+
+    def __init__(self, section, year_from, year_to, doc_ids=None, docs=None):
+        self.section = section
+        self.year_from = year_from
+        self.year_to = year_to
+        self.doc_ids = doc_ids
+        self.docs = docs
+
+    def __len__(self):
+        return len(self.section)
+
+    @classmethod
+    def for_chunks(cls, chunks):
+        """
+        Load the sidecar of a ChunkStore, or derive the columns from the
+        texts (legacy stores and the built-in corpus).
+        """
+        dirpath = getattr(chunks, "dirpath", None)
+        path = os.path.join(dirpath, CHUNK_META_FILE) if dirpath else None
+        doc_ids, docs = getattr(chunks, "doc_ids", None), getattr(chunks, "docs", None)
+        if path and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                names = data["section_names"].tolist()
+                # re-map if SECTIONS changed since the store was built
+                remap = np.asarray([SECTIONS.index(n) if n in SECTIONS else 0 for n in names], dtype=np.int8)
+                columns = {"section": remap[data["section"]], "year_from": data["year_from"],
+                           "year_to": data["year_to"]}
+            if len(columns["section"]) == len(chunks):
+                return cls(doc_ids=doc_ids, docs=docs, **columns)
+        if dirpath:
+            print(f"No {CHUNK_META_FILE} in {dirpath}; deriving chunk metadata from the texts "
+                  f"(re-run build_index.py / ingest.py to store it).")
+            return cls(doc_ids=doc_ids, docs=docs, **describe(list(chunks)))
+        # a plain list (the built-in corpus): every entry stands on its own
+        return cls(**(concat([describe([chunk]) for chunk in chunks]) if len(chunks) else describe([])))
+
+    def _doc_rows(self, docs):
+        if self.doc_ids is None or self.docs is None:
+            raise ValueError("this index has no per-document metadata (build it with ingest.py)")
+        wanted = {docs} if isinstance(docs, str) else set(docs)
+        matches = [i for i, path in enumerate(self.docs)
+                   if path in wanted or os.path.basename(path) in wanted
+                   or os.path.splitext(os.path.basename(path))[0] in wanted]
+        return np.isin(self.doc_ids, matches)
+
+    def mask(self, doc=None, section=None, year_from=None, year_to=None):
+        """
+        Boolean row mask for a filter; None when nothing is filtered. `doc`
+        and `section` take a name or a list of names; a year range keeps
+        chunks whose years overlap it (undated chunks are dropped).
+        """
+        mask = None
+
+        def both(m):
+            return m if mask is None else mask & m
+
+        if doc is not None:
+            mask = both(self._doc_rows(doc))
+        if section is not None:
+            names = [section] if isinstance(section, str) else list(section)
+            unknown = [n for n in names if n not in SECTIONS]
+            if unknown:
+                raise ValueError(f"unknown section {unknown[0]!r}; expected one of {SECTIONS}")
+            mask = both(np.isin(self.section, [SECTIONS.index(n) for n in names]))
+        if year_from is not None or year_to is not None:
+            dated = self.year_from >= 0
+            if year_from is not None:
+                dated &= self.year_to >= int(year_from)
+            if year_to is not None:
+                dated &= self.year_from <= int(year_to)
+            mask = both(dated)
+        return mask
+
+
+def filter_key(filters):
+    """
+    Normalise a filter dict into a hashable key (None when empty). Raises
+    ValueError for unknown keys, sections or non-integer years, so a
+    request can be rejected before it reaches retrieval.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"unknown filter {sorted(unknown)[0]!r}; expected any of {FILTER_KEYS}")
+    items = []
+    for key in FILTER_KEYS:
+        value = filters.get(key)
+        if value is None:
+            continue
+        if key in ("year_from", "year_to"):
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"{key} must be an integer year")
+        else:
+            names = [value] if isinstance(value, str) else value
+            if not isinstance(names, (list, tuple)) or not all(isinstance(n, str) for n in names):
+                raise ValueError(f"{key} must be a name or a list of names")
+            if key == "section" and any(n not in SECTIONS for n in names):
+                bad = next(n for n in names if n not in SECTIONS)
+                raise ValueError(f"unknown section {bad!r}; expected one of {SECTIONS}")
+            value = value if isinstance(value, str) else tuple(value)
+        items.append((key, value))
+    return tuple(items) or None
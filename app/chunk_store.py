@@ -0,0 +1,275 @@
+# app/chunk_store.py
+import json
+import mmap
+import os
+import pickle
+import shutil
+import time
+
+import faiss
+import numpy as np
+
+import chunk_meta
+
+# On-disk layout: every build writes a new generation directory
+# models/chunk_store.<n>/ and then switches models/chunk_store.current (the
+# generation's name) to it with one rename, so readers, which resolve the
+# pointer once, always open files of one complete build. A generation holds:
+#   chunks.offsets.npy  int64[n + 1] byte offsets into the blob
+#   chunks.blob         UTF-8 text of every chunk, back to back
+#   embeddings.npy      float32[n, dim] chunk embeddings (optional)
+#   chunk_ids.npy       int64[n] FAISS ids of the chunks (optional; row
+#                       numbers are the ids when absent)
+#   chunk_docs.npy      int32[n] index into docs.json of each chunk's
+#   docs.json           source document (optional, corpus ingests)
+#   chunk_meta.npz      section / year columns for filtered search
+#                       (optional, see chunk_meta.py)
+# bm25.npz (BM25 term statistics, see retrieval.py) stays in models/ and is
+# tied to its build by a signature. Stores written before generations
+# existed keep these files directly in models/ and are still read.
+# Everything is opened with mmap, so worker processes share the pages
+# through the OS page cache instead of each holding a private copy.
+CURRENT_FILE = "chunk_store.current"
+GENERATION_PREFIX = "chunk_store."
+OFFSETS_FILE = "chunks.offsets.npy"
+BLOB_FILE = "chunks.blob"
+EMBEDDINGS_FILE = "embeddings.npy"
+IDS_FILE = "chunk_ids.npy"
+DOC_IDS_FILE = "chunk_docs.npy"
+DOCS_FILE = "docs.json"
+LEGACY_CHUNKS_FILE = "chunks.pkl"
+
+
+def _replace(path, write):
+    # write next to the target and rename, so readers never see a half-written file
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def store_dir(dirpath):
+    """The directory holding `dirpath`'s current chunk store files (`dirpath` itself for old layouts)."""
+    try:
+        with open(os.path.join(dirpath, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(dirpath, f.read().strip())
+    except FileNotFoundError:
+        return dirpath
+
+
+def store_file(dirpath, name):
+    """Path of chunk store file `name` in `dirpath`'s current generation."""
+    return os.path.join(store_dir(dirpath), name)
+
+
+class ChunkStoreWriter:
+    """
+    Streams a chunk store to disk batch by batch. Text and embeddings go
+    straight to files in a new generation directory; only per-chunk
+    offsets/ids stay in memory. close() finishes the generation and then
+    switches CURRENT_FILE to it, so readers see the old store or the new
+    one, never a mix.
+    """
+
+    def __init__(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+        self.store_dir = os.path.join(out_dir, self.generation)
+        os.makedirs(self.store_dir)
+        self.count = 0
+        self.dim = None
+        self._lengths = []
+        self._ids = []
+        self._doc_ids = []
+        self._meta = []
+        self._blob = open(self._path(BLOB_FILE) + ".tmp", "wb")
+        self._emb = None
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def add(self, chunks, embeddings=None, ids=None, doc_ids=None, meta=None):
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            self._blob.write(data)
+            self._lengths.append(len(data))
+        if embeddings is not None and len(chunks):
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            if self._emb is None:
+                self.dim = embeddings.shape[1]
+                self._emb = open(self._path(EMBEDDINGS_FILE) + ".raw", "wb")
+            self._emb.write(embeddings.tobytes())
+        if ids is not None:
+            self._ids.extend(int(i) for i in ids)
+        if doc_ids is not None:
+            self._doc_ids.extend(int(d) for d in doc_ids)
+        if meta is not None:
+            self._meta.append(meta)  # chunk_meta column dict for these chunks
+        self.count += len(chunks)
+
+    def _finish_optional(self, name, values, dtype):
+        if values:
+            arr = np.asarray(values, dtype=dtype)
+            _replace(self._path(name), lambda f: np.save(f, arr))
+
+    def close(self, docs=None):
+        self._blob.close()
+        os.replace(self._path(BLOB_FILE) + ".tmp", self._path(BLOB_FILE))
+
+        if self._emb is not None:
+            self._emb.close()
+            raw = self._path(EMBEDDINGS_FILE) + ".raw"
+
+            def write_npy(f):
+                header = {"descr": "<f4", "fortran_order": False, "shape": (self.count, self.dim)}
+                np.lib.format.write_array_header_1_0(f, header)
+                with open(raw, "rb") as src:
+                    shutil.copyfileobj(src, f, 16 << 20)
+
+            _replace(self._path(EMBEDDINGS_FILE), write_npy)
+            os.remove(raw)
+
+        self._finish_optional(IDS_FILE, self._ids, np.int64)
+        self._finish_optional(DOC_IDS_FILE, self._doc_ids, np.int32)
+        if docs is not None:
+            _replace(self._path(DOCS_FILE), lambda f: f.write(json.dumps(list(docs)).encode("utf-8")))
+        if self._meta:
+            chunk_meta.save(self.store_dir, chunk_meta.concat(self._meta))
+        offsets = np.zeros(self.count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(self._lengths)
+        _replace(self._path(OFFSETS_FILE), lambda f: np.save(f, offsets))
+
+        previous = os.path.basename(store_dir(self.out_dir))
+        _replace(os.path.join(self.out_dir, CURRENT_FILE), lambda f: f.write(self.generation.encode("utf-8")))
+        self._prune(keep=(self.generation, previous))
+
+    def _prune(self, keep):
+        """Drop old generations and old-layout files; the previous generation stays for readers opening it now."""
+        for name in os.listdir(self.out_dir):
+            path = os.path.join(self.out_dir, name)
+            if name.startswith(GENERATION_PREFIX) and name not in keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        for name in (OFFSETS_FILE, BLOB_FILE, EMBEDDINGS_FILE, IDS_FILE, DOC_IDS_FILE, DOCS_FILE,
+                     chunk_meta.CHUNK_META_FILE):
+            if os.path.exists(os.path.join(self.out_dir, name)):
+                os.remove(os.path.join(self.out_dir, name))
+
+
+def write_chunk_store(out_dir, chunks, embeddings=None, ids=None, doc_ids=None, docs=None, meta=None):
+    """
+    Write `chunks` (list of str), optional embeddings and FAISS ids, source
+    documents and chunk_meta columns in the mmap-able format.
+    """
+    writer = ChunkStoreWriter(out_dir)
+    writer.add(chunks, embeddings, ids, doc_ids, meta)
+    writer.close(docs=docs)
+
+
+def has_chunk_store(dirpath):
+    dirpath = store_dir(dirpath)
+    return os.path.exists(os.path.join(dirpath, OFFSETS_FILE)) and os.path.exists(os.path.join(dirpath, BLOB_FILE))
+
+
+class ChunkStore:
+    """Read-only, memory-mapped sequence of chunk strings (the current generation of `dirpath`)."""
+
+    def __init__(self, dirpath):
+        # resolved once: every file below comes from the same build
+        dirpath = self.dirpath = store_dir(dirpath)
+        self.offsets = np.load(os.path.join(dirpath, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(dirpath, BLOB_FILE), "rb") as f:
+            # mmap can't map an empty file
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+        emb_path = os.path.join(dirpath, EMBEDDINGS_FILE)
+        self.embeddings = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+
+        ids_path = os.path.join(dirpath, IDS_FILE)
+        self.ids = np.load(ids_path, mmap_mode="r") if os.path.exists(ids_path) else None
+        self._id_order = None
+
+        doc_ids_path = os.path.join(dirpath, DOC_IDS_FILE)
+        self.doc_ids = np.load(doc_ids_path, mmap_mode="r") if os.path.exists(doc_ids_path) else None
+        self.docs = None
+        if os.path.exists(os.path.join(dirpath, DOCS_FILE)):
+            with open(os.path.join(dirpath, DOCS_FILE), "r", encoding="utf-8") as f:
+                self.docs = json.load(f)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def doc_of(self, row):
+        """Source document of chunk `row`, or None when the store has no doc metadata."""
+        if self.doc_ids is None or self.docs is None:
+            return None
+        return self.docs[int(self.doc_ids[row])]
+
+    def rows_for_ids(self, ids):
+        """Map FAISS ids to row numbers (-1 for ids not in the store)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.ids is None:
+            return np.where((ids >= 0) & (ids < len(self)), ids, -1)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids)
+            self._sorted_ids = self.ids[self._id_order]
+        pos = np.clip(np.searchsorted(self._sorted_ids, ids), 0, len(self._sorted_ids) - 1)
+        return np.where(self._sorted_ids[pos] == ids, self._id_order[pos], -1)
+
+    def by_ids(self, ids):
+        """Chunk texts for FAISS result ids, skipping -1 / unknown ids."""
+        return [self[int(r)] for r in self.rows_for_ids(ids) if r != -1]
+
+
+def load_chunks(dirpath):
+    """
+    Open the chunk store in `dirpath`. A legacy chunks.pkl (built before the
+    store existed) is only unpickled with ALLOW_LEGACY_PICKLE=1, since
+    unpickling a file can run arbitrary code; otherwise re-run build_index.py.
+    """
+    if has_chunk_store(dirpath):
+        return ChunkStore(dirpath)
+    legacy = os.path.join(dirpath, LEGACY_CHUNKS_FILE)
+    if not os.path.exists(legacy):
+        raise FileNotFoundError(f"No chunk store in {dirpath}; run build_index.py first.")
+    if os.getenv("ALLOW_LEGACY_PICKLE") != "1":
+        raise FileNotFoundError(
+            f"No chunk store in {dirpath}, only a legacy {LEGACY_CHUNKS_FILE}, which is not unpickled by default. "
+            f"Re-run build_index.py to convert it (or set ALLOW_LEGACY_PICKLE=1 if you trust the file).")
+    print(f"No chunk store in {dirpath}; loading legacy {legacy} (ALLOW_LEGACY_PICKLE=1). "
+          f"Re-run build_index.py to convert it.")
+    with open(legacy, "rb") as f:
+        return pickle.load(f)
+
+
+def chunks_for_ids(chunks, ids):
+    """Look up FAISS result ids in a ChunkStore or a legacy list of chunks."""
+    if hasattr(chunks, "by_ids"):
+        return chunks.by_ids(ids)
+    return [chunks[i] for i in ids if i != -1]
+
+
+def read_index(path):
+    """
+    Read a FAISS index with its codes memory-mapped (read-only) where this
+    faiss build and index type allow it, else fall back to a normal read.
+    """
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None) or faiss.IO_FLAG_MMAP
+    try:
+        return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
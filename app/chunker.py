@@ -0,0 +1,132 @@
+# app/chunker.py
+"""
+Token-bounded chunking.
+
+    token_chunker().chunk_batch(paragraphs)     # windows of <= 254 MiniLM tokens
+
+build_index.split_into_chunks counts words, but the embedder counts
+tokens: all-MiniLM-L6-v2 truncates at 256 including [CLS]/[SEP] and
+silently drops the rest of a longer chunk. TokenChunker tokenizes a batch
+of texts once, keeps the fast tokenizer's character offsets as arrays and
+cuts windows from them, so no chunk is ever re-tokenized to measure it.
+Windows end on word boundaries and can be aligned to sentences from
+build_index.split_sentences.
+"""
+import threading
+
+import numpy as np
+
+from embedder import EMBED_MODEL_NAME
+
+# all-MiniLM-L6-v2's max_seq_length; longer inputs are truncated when encoded
+EMBED_MAX_TOKENS = 256
+DEFAULT_TOKEN_OVERLAP = 32
+
+
+# -------------------
+# Tokenizer-bounded windows
+# -------------------
+_tokenizers = {}
+_lock = threading.Lock()
+
+
+def load_tokenizer(name=EMBED_MODEL_NAME):
+    """The (fast) tokenizer of embedding model `name`, loaded once per process."""
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+
+                # sentence-transformers resolves bare names under its own org
+                repo = name if "/" in name or "\\" in name else f"sentence-transformers/{name}"
+                tokenizer = _tokenizers[name] = AutoTokenizer.from_pretrained(repo, use_fast=True)
+    return tokenizer
+
+
+def _next_boundary(boundaries, lo, hi):
+    """Largest boundary in (lo, hi], or None."""
+    i = int(np.searchsorted(boundaries, hi, side="right")) - 1
+    return int(boundaries[i]) if i >= 0 and boundaries[i] > lo else None
+
+
+def _first_boundary(boundaries, lo, hi):
+    """Smallest boundary in [lo, hi], or None."""
+    i = int(np.searchsorted(boundaries, lo, side="left"))
+    return int(boundaries[i]) if i < len(boundaries) and boundaries[i] <= hi else None
+
+
+class TokenChunker:
+    """
+    Token-bounded windows with overlap: each chunk has at most `max_tokens`
+    tokens and shares at most `overlap` tokens with the previous one.
+    Windows end on word boundaries (or sentence boundaries with
+    align_sentences=True, falling back to words inside a sentence that is
+    longer than a window); a single word longer than a window is cut.
+    """
+
+    def __init__(self, tokenizer, max_tokens=None, overlap=DEFAULT_TOKEN_OVERLAP, align_sentences=False):
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("TokenChunker needs a fast tokenizer (offset mapping)")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens or EMBED_MAX_TOKENS - tokenizer.num_special_tokens_to_add()
+        if not 0 <= overlap < self.max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.overlap = overlap
+        self.align_sentences = align_sentences
+
+    def chunk(self, text):
+        return self.chunk_batch([text])[0]
+
+    def chunk_batch(self, texts):
+        """Chunk many texts with one batched tokenizer call; returns a list of chunk lists."""
+        norms = [" ".join(t.split()) for t in texts]
+        encoded = self.tokenizer(norms, add_special_tokens=False, return_offsets_mapping=True,
+                                 return_attention_mask=False, return_token_type_ids=False)
+        return [self._chunk_one(norm, offsets) for norm, offsets in zip(norms, encoded["offset_mapping"])]
+
+    def _chunk_one(self, norm, offsets):
+        if not offsets:
+            return [norm] if norm else []
+        offsets = np.asarray(offsets, dtype=np.int64)
+        tok_start, tok_end = offsets[:, 0], offsets[:, 1]
+        n = len(offsets)
+
+        # a token starts a word if it is the first one or follows a space
+        chars = np.frombuffer(norm.encode("utf-32-le"), dtype=np.uint32)
+        prev = chars[np.maximum(tok_start - 1, 0)]
+        word_starts = np.flatnonzero((tok_start == 0) | (prev == ord(" ")))
+        word_starts = np.append(word_starts, n)
+        boundaries = self._sentence_starts(norm, tok_start, n) if self.align_sentences else word_starts
+
+        spans, s = [], 0
+        while True:
+            limit = s + self.max_tokens
+            if limit >= n:
+                spans.append((s, n))
+                break
+            e = (_next_boundary(boundaries, s, limit) or _next_boundary(word_starts, s, limit) or limit)
+            spans.append((s, e))
+            # step back by at most `overlap` tokens, to a boundary
+            s = (_first_boundary(boundaries, max(e - self.overlap, s + 1), e)
+                 or _first_boundary(word_starts, max(e - self.overlap, s + 1), e) or e)
+        return [norm[tok_start[a]:tok_end[b - 1]] for a, b in spans]
+
+    @staticmethod
+    def _sentence_starts(norm, tok_start, n):
+        from build_index import split_sentences
+
+        chars, pos = [], 0
+        for sentence in split_sentences(norm):
+            pos = norm.find(sentence, pos)
+            chars.append(pos)
+            pos += len(sentence)
+        # first token at or after each sentence's first character
+        return np.unique(np.append(np.searchsorted(tok_start, chars), n))
+
+
+def token_chunker(max_tokens=None, overlap=DEFAULT_TOKEN_OVERLAP, align_sentences=False, model_name=EMBED_MODEL_NAME):
+    """TokenChunker over the embedding model's tokenizer."""
+    return TokenChunker(load_tokenizer(model_name), max_tokens=max_tokens, overlap=overlap,
+                        align_sentences=align_sentences)
@@ -0,0 +1,144 @@
+# app/context_builder.py
+import re
+
+import numpy as np
+
+import metrics
+
+# Chunks from split_into_chunks(overlap=20) share 20 words with their
+# neighbours; any shared run this long between two hits is treated as overlap
+MIN_OVERLAP_WORDS = 5
+
+
+def _word_overlap(a_words, b_words, min_overlap=MIN_OVERLAP_WORDS):
+    """Length of the longest suffix of `a_words` that is a prefix of `b_words`."""
+    for n in range(min(len(a_words), len(b_words)) - 1, min_overlap - 1, -1):
+        if a_words[-n:] == b_words[:n]:
+            return n
+    return 0
+
+
+def _jaccard(a, b):
+    a, b = set(re.findall(r"\w+", a.lower())), set(re.findall(r"\w+", b.lower()))
+    return len(a & b) / (len(a | b) or 1)
+
+
+def mmr_order(scores, similarity, mmr_lambda=0.7):
+    """
+    Maximal marginal relevance: order candidates so each pick trades its
+    relevance against its similarity to what was already picked.
+    `scores` is [n] relevance, `similarity` an [n, n] matrix.
+    """
+    n = len(scores)
+    if not n:
+        return []
+    rel = np.asarray(scores, dtype=np.float32)
+    rel = rel / (rel.max() or 1.0)
+    order, remaining = [], list(range(n))
+    redundancy = np.zeros(n, dtype=np.float32)
+    while remaining:
+        gains = [mmr_lambda * rel[i] - (1 - mmr_lambda) * redundancy[i] for i in remaining]
+        best = remaining.pop(int(np.argmax(gains)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+class ContextBuilder:
+    """
+    Retrieval -> context stage: over-fetch `fetch_k` hits, rerank them with
+    MMR, merge overlapping chunk windows, and pack the result into a token
+    budget counted with the generation tokenizer. Stored chunk embeddings
+    are reused for similarity, so reranking costs no extra encode() call.
+    """
+
+    def __init__(self, retriever, tokenizer, fetch_k=12, mmr_lambda=0.7, max_similarity=0.95,
+                 separator="\n", token_cache_size=4096):
+        self.retriever = retriever
+        self.tokenizer = tokenizer
+        self.fetch_k = fetch_k
+        self.mmr_lambda = mmr_lambda
+        self.max_similarity = max_similarity
+        self.separator = separator
+        self._token_counts = {}
+        self._token_cache_size = token_cache_size
+
+    def count_tokens(self, text):
+        n = self._token_counts.get(text)
+        if n is None:
+            n = len(self.tokenizer.encode(text, add_special_tokens=False))
+            if len(self._token_counts) >= self._token_cache_size:
+                self._token_counts.clear()
+            self._token_counts[text] = n
+        return n
+
+    def _similarity(self, rows, texts):
+        embeddings = getattr(self.retriever.chunks, "embeddings", None)
+        if embeddings is not None:
+            vecs = np.asarray(embeddings[np.asarray(rows)], dtype=np.float32)
+            return vecs @ vecs.T  # stored embeddings are normalized
+        return np.array([[_jaccard(a, b) for b in texts] for a in texts], dtype=np.float32)
+
+    def select(self, query, filters=None):
+        """Reranked candidate texts for `query`, most useful first, near-duplicates dropped."""
+        hits = self.retriever.search(query, self.fetch_k, filters)
+        if not hits:
+            return []
+        with metrics.stage("rerank"):
+            rows = [row for row, _ in hits]
+            texts = [self.retriever.chunks[row] for row in rows]
+            sim = self._similarity(rows, texts)
+            picked = []
+            for i in mmr_order([score for _, score in hits], sim, self.mmr_lambda):
+                if all(sim[i, j] < self.max_similarity for j in picked):
+                    picked.append(i)
+            return [texts[i] for i in picked]
+
+    def pack(self, texts, budget_tokens):
+        """
+        Greedily fit `texts` into `budget_tokens`. A chunk overlapping an
+        already packed one (neighbouring windows) is merged into it and only
+        its new words are paid for; chunks that don't fit are skipped so a
+        smaller one further down can still use the space.
+        """
+        packed = []  # word lists
+        used = 0
+        sep_cost = self.count_tokens(self.separator) if self.separator.strip() else 1
+        for text in texts:
+            words = text.split()
+            if not words or any(f" {' '.join(words)} " in f" {' '.join(p)} " for p in packed):
+                continue  # already covered by a merged window
+            for p in packed:
+                tail = _word_overlap(p, words)
+                if tail:
+                    cost = self.count_tokens(" ".join(words[tail:]))
+                    if used + cost <= budget_tokens:
+                        p.extend(words[tail:])
+                        used += cost
+                    break
+                head = _word_overlap(words, p)
+                if head:
+                    cost = self.count_tokens(" ".join(words[:-head]))
+                    if used + cost <= budget_tokens:
+                        p[:0] = words[:-head]
+                        used += cost
+                    break
+            else:
+                cost = self.count_tokens(text) + (sep_cost if packed else 0)
+                if used + cost <= budget_tokens:
+                    packed.append(words)
+                    used += cost
+        return [" ".join(p) for p in packed]
+
+    def build(self, query, budget_tokens, filters=None):
+        """Context chunks for `query` that together fit in `budget_tokens`."""
+        texts = self.select(query, filters)
+        with metrics.stage("pack"):
+            return self.pack(texts, budget_tokens)
+
+    def budget_for(self, prompt_template, max_input_tokens, reserve=8):
+        """
+        Tokens left for context in `prompt_template` (the prompt with an empty
+        context) under the scheduler's `max_input_tokens` truncation limit.
+        """
+        return max(0, max_input_tokens - len(self.tokenizer(prompt_template)["input_ids"]) - reserve)
@@ -0,0 +1,53 @@
+# app/embedder.py
+import threading
+
+# -------------------
+# Process-wide SentenceTransformer registry
+# -------------------
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_embedders = {}
+_lock = threading.Lock()
+
+
+def get_embedder(name=EMBED_MODEL_NAME):
+    """
+    Return the shared SentenceTransformer for `name`, loading it on first use.
+    Loading happens at most once per process, even with concurrent callers.
+    """
+    embedder = _embedders.get(name)
+    if embedder is not None:
+        return embedder
+
+    with _lock:
+        # another thread may have finished loading while we waited
+        embedder = _embedders.get(name)
+        if embedder is None:
+            # imported here so processes that only proxy to a model server
+            # (register_embedder) never load sentence-transformers
+            from sentence_transformers import SentenceTransformer
+
+            print(f"Loading embedder {name}...")
+            embedder = SentenceTransformer(name)
+            _embedders[name] = embedder
+    return embedder
+
+
+def register_embedder(embedder, name=EMBED_MODEL_NAME):
+    """
+    Install `embedder` (anything with a SentenceTransformer-style encode())
+    as the shared instance for `name`, e.g. a proxy to a model server.
+    """
+    with _lock:
+        _embedders[name] = embedder
+
+
+def encode(texts, name=EMBED_MODEL_NAME, **kwargs):
+    """Encode `texts` with the shared embedder; kwargs go to SentenceTransformer.encode."""
+    return get_embedder(name).encode(texts, **kwargs)
+
+
+def warm_up(name=EMBED_MODEL_NAME):
+    """Load the embedder and run one tiny encode so the first real query is not slow."""
+    get_embedder(name).encode(["warm up"])
+    print(f"Embedder {name} ready!")
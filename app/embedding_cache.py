@@ -0,0 +1,157 @@
+# app/embedding_cache.py
+import hashlib
+import os
+
+import numpy as np
+
+from chunk_store import _replace
+from embedder import EMBED_MODEL_NAME, get_embedder
+
+
+def chunk_id(text):
+    """Stable non-negative int64 id for a chunk, derived from its content."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def _record_dtype(dim):
+    return np.dtype([("key", "<i8"), ("vec", "<f4", (dim,))])
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache keyed by chunk_id(), one file per
+    embedding model, so only new or edited chunks are ever re-encoded.
+    Keys and vectors live in one record array, so a save can never leave
+    them out of step. The saved cache is memory-mapped and vectors encoded
+    since the last save are appended to a scratch file, so only the keys
+    and the current batch are held in memory.
+    """
+
+    def __init__(self, cache_dir, model_name=EMBED_MODEL_NAME):
+        self.model_name = model_name
+        safe_name = model_name.replace("/", "__")
+        self.path = os.path.join(cache_dir, f"{safe_name}.npy")
+        self.pending_path = self.path + ".pending"
+        os.makedirs(cache_dir, exist_ok=True)
+        # written by earlier versions as two separate files
+        legacy = (os.path.join(cache_dir, f"{safe_name}.keys.npy"), os.path.join(cache_dir, f"{safe_name}.vecs.npy"))
+        if not os.path.exists(self.path) and all(os.path.exists(p) for p in legacy):
+            keys, vecs = (np.load(p) for p in legacy)
+            if len(keys) == len(vecs):  # a torn legacy save is dropped, not trusted
+                records = np.empty(len(keys), dtype=_record_dtype(vecs.shape[1]))
+                records["key"], records["vec"] = keys, vecs
+                _replace(self.path, lambda f: np.save(f, records))
+            for p in legacy:
+                os.remove(p)
+
+        # vectors encoded since the last save: key -> row of the pending file
+        self._pending = {}
+        self._pending_file = None
+        self._dirty = False
+        self._open_saved()
+
+    def _open_saved(self):
+        self._saved = np.load(self.path, mmap_mode="r") if os.path.exists(self.path) else None
+        self.dim = self._saved.dtype["vec"].shape[0] if self._saved is not None else None
+        keys = np.asarray(self._saved["key"]) if self._saved is not None else np.zeros(0, np.int64)
+        self._order = np.argsort(keys)
+        self._sorted_keys = keys[self._order]
+
+    def __len__(self):
+        return len(self._sorted_keys) + len(self._pending)
+
+    def _saved_rows(self, ids):
+        """Row of each id in the saved cache, -1 where it is not there."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self._sorted_keys):
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self._sorted_keys, ids), 0, len(self._sorted_keys) - 1)
+        return np.where(self._sorted_keys[pos] == ids, self._order[pos], -1)
+
+    def _pending_vecs(self):
+        self._pending_file.flush()
+        return np.memmap(self.pending_path, dtype=np.float32, mode="r", shape=(len(self._pending), self.dim))
+
+    def embed(self, texts, ids=None, batch_size=64):
+        """
+        Return float32 normalized embeddings for `texts`, encoding only the ones
+        whose id is not cached yet. Returns (embeddings, number_encoded).
+        """
+        ids = [chunk_id(t) for t in texts] if ids is None else [int(k) for k in ids]
+        if not ids:
+            return np.zeros((0, 0), dtype=np.float32), 0
+        saved_rows = self._saved_rows(ids)
+        missing_ids, missing_texts, seen = [], [], set()
+        for text, key, row in zip(texts, ids, saved_rows):
+            if row == -1 and key not in self._pending and key not in seen:
+                seen.add(key)
+                missing_ids.append(key)
+                missing_texts.append(text)
+
+        new = {}
+        if missing_texts:
+            vecs = np.asarray(get_embedder(self.model_name).encode(
+                missing_texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+            self.dim = vecs.shape[1]
+            if self._pending_file is None:
+                self._pending_file = open(self.pending_path, "w+b")
+            self._pending_file.write(vecs.tobytes())
+            for row, key in enumerate(missing_ids):
+                new[key] = vecs[row]
+                self._pending[key] = len(self._pending)
+            self._dirty = True
+
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        hit = saved_rows != -1
+        if hit.any():
+            out[hit] = self._saved["vec"][saved_rows[hit]]
+        earlier = [(i, self._pending[key]) for i, key in enumerate(ids) if not hit[i] and key not in new]
+        if earlier:
+            pending = self._pending_vecs()
+            for i, row in earlier:
+                out[i] = pending[row]
+        for i, key in enumerate(ids):
+            if key in new:
+                out[i] = new[key]
+        return out, len(missing_texts)
+
+    def save(self, retain=None, chunk_rows=65_536):
+        """
+        Write the cache atomically, streaming the saved and pending vectors
+        into the new file. With `retain` (the ids still in use), entries for
+        every other chunk are pruned first.
+        """
+        keep_saved = np.ones(len(self._order), dtype=bool)
+        pending_keys = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+        keep_pending = np.ones(len(pending_keys), dtype=bool)
+        if retain is not None:
+            retain = np.asarray(retain, dtype=np.int64)
+            if self._saved is not None:
+                keep_saved = np.isin(np.asarray(self._saved["key"]), retain)
+            keep_pending = np.isin(pending_keys, retain)
+        if not self._dirty and keep_saved.all():
+            return
+        dtype = _record_dtype(self.dim)
+        pending = self._pending_vecs() if self._pending else None
+
+        def write(f):
+            count = int(keep_saved.sum() + keep_pending.sum())
+            np.lib.format.write_array_header_1_0(
+                f, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)})
+            for start in range(0, len(keep_saved), chunk_rows):
+                block = self._saved[start:start + chunk_rows]
+                f.write(np.ascontiguousarray(block[keep_saved[start:start + chunk_rows]]).tobytes())
+            for start in range(0, len(pending_keys), chunk_rows):
+                keep = keep_pending[start:start + chunk_rows]
+                records = np.empty(int(keep.sum()), dtype=dtype)
+                records["key"] = pending_keys[start:start + chunk_rows][keep]
+                records["vec"] = pending[start:start + chunk_rows][keep]
+                f.write(records.tobytes())
+
+        _replace(self.path, write)
+        if self._pending_file is not None:
+            self._pending_file.close()
+            os.remove(self.pending_path)
+        self._pending, self._pending_file, self._dirty = {}, None, False
+        self._open_saved()
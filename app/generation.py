@@ -0,0 +1,593 @@
+# app/generation.py
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+import torch
+import torch.nn.functional as F
+
+import metrics
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # very old transformers: legacy tuples only
+    DynamicCache = None
+
+
+# -------------------
+# KV-cache helpers
+# -------------------
+def to_legacy_cache(past):
+    """Return past_key_values as a tuple of (key, value) per layer."""
+    if past is None or isinstance(past, tuple):
+        return past
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    if hasattr(past, "layers"):
+        return tuple((layer.keys, layer.values) for layer in past.layers)
+    return tuple(zip(past.key_cache, past.value_cache))
+
+
+def from_legacy_cache(legacy):
+    """Wrap legacy (key, value) tuples in whatever cache object the model expects."""
+    if DynamicCache is None:
+        return legacy
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(legacy):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def slice_cache(legacy, row, start):
+    """Take batch row `row` of a legacy cache, dropping the first `start` positions."""
+    return tuple((k[row:row + 1, :, start:], v[row:row + 1, :, start:]) for k, v in legacy)
+
+
+def gather_cache(legacy, row, spans):
+    """Concatenate the position spans [(start, end), ...] of batch row `row`."""
+    spans = [(a, b) for a, b in spans if b > a]
+
+    def take(t):
+        parts = [t[row:row + 1, :, a:b] for a, b in spans]
+        return parts[0] if len(parts) == 1 else torch.cat(parts, dim=2)
+
+    return tuple((take(k), take(v)) for k, v in legacy)
+
+
+def trim_cache(legacy, length):
+    """Keep only the first `length` positions (drops rejected speculative tokens)."""
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in legacy)
+
+
+def stack_caches(caches, lengths):
+    """
+    Left-pad per-request legacy caches to a common length and concatenate on batch.
+    A cache may be None (length 0) as long as at least one is not.
+    """
+    target = max(lengths)
+    template = next(c for c in caches if c is not None)
+    stacked = []
+    for layer in range(len(template)):
+        keys, values = [], []
+        for cache, length in zip(caches, lengths):
+            if cache is None:
+                k, v = (t[:1, :, :0] for t in template[layer])
+            else:
+                k, v = cache[layer]
+            pad = target - length
+            if pad:
+                k = F.pad(k, (0, 0, pad, 0))
+                v = F.pad(v, (0, 0, pad, 0))
+            keys.append(k)
+            values.append(v)
+        stacked.append((torch.cat(keys), torch.cat(values)))
+    return tuple(stacked)
+
+
+# -------------------
+# Requests
+# -------------------
+class GenerationRequest:
+    """One prompt's decoding state while it sits in the scheduler."""
+
+    def __init__(self, prompt, max_new_tokens=300, do_sample=False, temperature=1.0,
+                 top_p=1.0, repetition_penalty=1.0, stop_strings=(), max_input_tokens=None,
+                 streamer=None, static_prefix=None, context_prefix=None, speculative=False):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.stop_strings = tuple(stop_strings or ())
+        self.max_input_tokens = max_input_tokens
+        self.streamer = streamer
+        # prompt prefixes whose KV cache can be reused (see PrefixCache)
+        self.static_prefix = static_prefix
+        self.context_prefix = context_prefix
+        # greedy requests only: draft-then-verify decoding (see GenerationScheduler)
+        self.speculative = speculative and not (do_sample and temperature > 0)
+        self.future = Future()
+        self.cancelled = False
+        # timings are reported to the request trace of the submitting thread
+        self.trace = metrics.current_trace()
+        self.submitted_at = time.perf_counter()
+        self.decode_s = 0.0
+
+        self.prompt_ids = []
+        self.generated = []
+        self.past = None      # legacy cache for this request only, no padding (None while in the decode batch)
+        self.length = 0       # number of positions held in self.past
+        self.next_token = None
+        self.draft_past = None  # draft model's cache, only for speculative requests
+        self.draft_length = 0
+
+    def cancel(self):
+        """Ask the scheduler to drop this request at the next step boundary."""
+        self.cancelled = True
+        if self.future.cancel() and self.streamer is not None:
+            # never admitted, so the scheduler will not end the stream; end it now
+            # rather than when the scheduler next reaches the queue
+            self.streamer.fail(CancelledError())
+
+
+class TokenStreamer:
+    """
+    Iterable of text deltas for one streaming request.
+
+    The scheduler pushes the decoded continuation after every token; the
+    streamer yields only the new suffix. The last `holdback` characters are
+    held until the request finishes so a half-generated stop string is never
+    emitted, and so is a trailing partial UTF-8 character.
+    """
+
+    def __init__(self, holdback=0):
+        self.holdback = holdback
+        self.text = ""
+        self.request = None
+        self._emitted = 0
+        self._queue = queue.Queue()
+
+    def put(self, text, done):
+        safe = len(text) if done else max(0, len(text) - self.holdback)
+        if not done and text[safe - 1:safe] == "\ufffd":
+            safe -= 1
+        if safe > self._emitted:
+            self._queue.put(text[self._emitted:safe])
+            self._emitted = safe
+        if done:
+            self.text = text
+            self._queue.put(None)
+
+    def fail(self, exc):
+        self._queue.put(exc)
+
+    def close(self):
+        """Stop generating, e.g. because the client went away."""
+        if self.request is not None:
+            self.request.cancel()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+# -------------------
+# Scheduler
+# -------------------
+class GenerationScheduler:
+    """
+    Continuous-batching front for a causal LM.
+
+    Callers submit prompts from any thread; a single worker owns the model.
+    New prompts are padded and prefilled together, then every decode step
+    runs all active requests as one batch. Decode steps share one
+    left-padded batch KV cache that each step extends in place; it is only
+    re-stacked from the requests' rows when a request joins or leaves, so
+    requests still join and leave between decode steps and stop
+    independently (EOS, max_new_tokens or a stop string).
+
+    With a PrefixCache, a request's `static_prefix` / `context_prefix` are
+    looked up (or computed once and stored) so prefill only runs over the
+    rest of the prompt.
+
+    With a `draft_model` (a small LM sharing the tokenizer), requests
+    submitted with speculative=True and greedy decoding are decoded
+    speculatively: the draft proposes `num_draft_tokens` tokens, the main
+    model scores them all in one forward pass, and the longest prefix it
+    agrees with is kept plus its own next token. Output is identical to
+    plain greedy decoding. Verification runs one request per forward pass,
+    so it only pays off while the model is otherwise idle: speculation is
+    used only while at most `speculative_max_active` requests are active,
+    and beyond that speculative requests join the batched decode step (the
+    draft catches up on their tokens when speculation resumes).
+    """
+
+    def __init__(self, model, tokenizer, device, max_batch_size=8, prefix_cache=None,
+                 draft_model=None, num_draft_tokens=4, speculative_max_active=1):
+        self.model = model
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.speculative_max_active = speculative_max_active
+        self.prefix_cache = prefix_cache
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        if draft_model is not None and draft_model.config.vocab_size != model.config.vocab_size:
+            raise ValueError("draft model must share the main model's vocabulary")
+
+        self.stats = {"tokens": 0, "decode_s": 0.0, "spec_tokens": 0, "spec_s": 0.0,
+                      "drafted": 0, "accepted": 0}
+        self._pending = queue.Queue()
+        self._active = []
+        # decode batch: member requests (None once a member is detached), their
+        # shared left-padded cache and its width
+        self._batch = []
+        self._batch_past = None
+        self._batch_width = 0
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt, **kwargs):
+        """Queue a prompt; returns a Future resolving to the generated text (prompt excluded)."""
+        req = GenerationRequest(prompt, **kwargs)
+        self._pending.put(req)
+        return req.future
+
+    def generate(self, prompt, **kwargs):
+        """Blocking helper around submit()."""
+        return self.submit(prompt, **kwargs).result()
+
+    def stream(self, prompt, **kwargs):
+        """Queue a prompt and return a TokenStreamer yielding text as it is generated."""
+        stops = kwargs.get("stop_strings") or ()
+        streamer = TokenStreamer(holdback=max((len(stop) - 1 for stop in stops), default=0))
+        req = GenerationRequest(prompt, streamer=streamer, **kwargs)
+        streamer.request = req
+        self._pending.put(req)
+        return streamer
+
+    @property
+    def queue_depth(self):
+        return self._pending.qsize()
+
+    def metrics(self):
+        """Decode throughput and, with a draft model, speculative acceptance."""
+        stats = dict(self.stats)
+        return {
+            "tokens_generated": stats["tokens"],
+            "tokens_per_s": round(stats["tokens"] / stats["decode_s"], 2) if stats["decode_s"] else None,
+            "speculative_tokens_per_s": round(stats["spec_tokens"] / stats["spec_s"], 2) if stats["spec_s"] else None,
+            "draft_tokens": stats["drafted"],
+            "draft_accepted": stats["accepted"],
+            "acceptance_rate": round(stats["accepted"] / stats["drafted"], 3) if stats["drafted"] else None,
+        }
+
+    # -------------------
+    # Worker loop
+    # -------------------
+    def _run(self):
+        with torch.inference_mode():
+            while True:
+                joiners = []
+                if not self._active:
+                    joiners.append(self._pending.get())
+                while len(self._active) + len(joiners) < self.max_batch_size:
+                    try:
+                        joiners.append(self._pending.get_nowait())
+                    except queue.Empty:
+                        break
+
+                joiners = [r for r in joiners if r.future.set_running_or_notify_cancel()]
+                self._drop_cancelled()
+                if joiners:
+                    self._guarded(self._prefill, joiners)
+                # under load one batched step beats N single-request verify passes
+                speculate = self.draft_model is not None and len(self._active) <= self.speculative_max_active
+                speculative = [r for r in self._active if r.speculative] if speculate else []
+                plain = [r for r in self._active if r not in speculative]
+                if plain:
+                    self._guarded(self._decode_step, plain)
+                for req in speculative:
+                    self._guarded(self._speculative_step, [req])
+                if not plain:
+                    self._batch, self._batch_past = [], None  # idle or all speculative: free it
+
+    def _drop_cancelled(self):
+        for r in [r for r in self._active if r.cancelled]:
+            self._active.remove(r)
+            r.past = r.draft_past = None
+            if not r.future.done():
+                r.future.set_exception(CancelledError())
+            if r.streamer is not None:
+                r.streamer.fail(CancelledError())
+
+    def _guarded(self, step, reqs):
+        try:
+            step(reqs)
+        except Exception as e:
+            print("Error in generation scheduler:", e)
+            for r in reqs:
+                if r in self._active:
+                    self._active.remove(r)
+                if not r.future.done():
+                    r.future.set_exception(e)
+                if r.streamer is not None:
+                    r.streamer.fail(e)
+
+    def _encode(self, req):
+        kwargs = {}
+        if req.max_input_tokens:
+            kwargs = {"truncation": True, "max_length": req.max_input_tokens}
+        return self.tokenizer(req.prompt, **kwargs)["input_ids"]
+
+    def _prefix_len(self, text, ids):
+        """Number of leading tokens of `ids` that `text` tokenizes to."""
+        prefix_ids = self.tokenizer(text)["input_ids"]
+        n = 0
+        for a, b in zip(prefix_ids, ids):
+            if a != b:
+                break
+            n += 1
+        # always leave at least one token for prefill to produce logits from
+        return min(n, len(ids) - 1)
+
+    def _run_forward(self, input_ids, attention_mask, position_ids, past=None, model=None):
+        out = (model or self.model)(
+            input_ids=input_ids.to(self.device),
+            attention_mask=attention_mask.to(self.device),
+            position_ids=position_ids.to(self.device),
+            past_key_values=from_legacy_cache(past) if past is not None else None,
+            use_cache=True,
+        )
+        return out.logits, to_legacy_cache(out.past_key_values)
+
+    def _cached_prefix(self, req, ids):
+        """Return (past, length) for the longest reusable prefix of `ids`."""
+        past, start = None, 0
+        if self.prefix_cache is None:
+            return past, start
+        for text, pinned in ((req.static_prefix, True), (req.context_prefix, False)):
+            if not text:
+                continue
+            n = self._prefix_len(text, ids)
+            if n <= start:
+                continue
+            key = tuple(ids[:n])
+            cached = self.prefix_cache.get(key)
+            if cached is None:
+                # extend the shorter prefix we already have instead of starting over
+                new_ids = torch.tensor([ids[start:n]], dtype=torch.long)
+                _, cached = self._run_forward(
+                    new_ids,
+                    torch.ones((1, n), dtype=torch.long),
+                    torch.arange(start, n, dtype=torch.long).unsqueeze(0),
+                    past,
+                )
+                self.prefix_cache.put(key, cached, pinned=pinned)
+            past, start = cached, n
+        return past, start
+
+    def _prefill(self, reqs):
+        t0 = time.perf_counter()
+        ids_list = []
+        for r in reqs:
+            metrics.observe("queue_wait", t0 - r.submitted_at, r.trace)
+            t = time.perf_counter()
+            ids_list.append(self._encode(r))
+            metrics.observe("tokenize", time.perf_counter() - t, r.trace)
+        t0 = time.perf_counter()
+        prefixes = [self._cached_prefix(r, ids) for r, ids in zip(reqs, ids_list)]
+        prefix_lens = [n for _, n in prefixes]
+        suffixes = [ids[n:] for ids, n in zip(ids_list, prefix_lens)]
+        p_width = max(prefix_lens)
+        s_width = max(len(s) for s in suffixes)
+
+        # layout per row: [pad | cached prefix][pad | suffix]
+        input_ids = torch.full((len(reqs), s_width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(reqs), p_width + s_width), dtype=torch.long)
+        position_ids = torch.zeros((len(reqs), s_width), dtype=torch.long)
+        for row, (suffix, n) in enumerate(zip(suffixes, prefix_lens)):
+            input_ids[row, s_width - len(suffix):] = torch.tensor(suffix, dtype=torch.long)
+            attention_mask[row, p_width - n:p_width] = 1
+            attention_mask[row, p_width + s_width - len(suffix):] = 1
+            position_ids[row, s_width - len(suffix):] = torch.arange(n, n + len(suffix))
+
+        past = None
+        if p_width:
+            past = stack_caches([p for p, _ in prefixes], prefix_lens)
+        logits, past = self._run_forward(input_ids, attention_mask, position_ids, past)
+        prefill_s = time.perf_counter() - t0
+        for r in reqs:
+            metrics.observe("prefill", prefill_s, r.trace)
+
+        end = p_width + s_width
+        for row, (req, ids, n) in enumerate(zip(reqs, ids_list, prefix_lens)):
+            req.prompt_ids = ids
+            # drop both padding runs: keep [prefix] + [suffix] only
+            req.past = gather_cache(past, row, [(p_width - n, p_width), (end - (len(ids) - n), end)])
+            req.length = len(ids)
+            self._active.append(req)
+            self._advance(req, logits[row, -1])
+
+    def _detach(self, req):
+        """Give `req` its own cache again (its row of the batch cache) and take it out of the batch."""
+        if req.past is None and req in self._batch:
+            row = self._batch.index(req)
+            req.past = slice_cache(self._batch_past, row, self._batch_width - req.length)
+            self._batch[row] = None
+        return req.past
+
+    def _regroup(self, reqs):
+        """Re-stack the batch cache for a new set of decoding requests."""
+        caches = [self._detach(r) for r in reqs]
+        lengths = [r.length for r in reqs]
+        self._batch_past = stack_caches(caches, lengths)
+        self._batch, self._batch_width = list(reqs), max(lengths)
+        for r in reqs:
+            r.past = None  # the batch cache holds it now
+
+    def _decode_step(self, reqs):
+        t0 = time.perf_counter()
+        if reqs != self._batch:
+            self._regroup(reqs)
+        width = self._batch_width
+
+        attention_mask = torch.zeros((len(reqs), width + 1), dtype=torch.long)
+        for row, req in enumerate(reqs):
+            attention_mask[row, width - req.length:] = 1
+        input_ids = torch.tensor([[r.next_token] for r in reqs], dtype=torch.long)
+        position_ids = torch.tensor([[r.length] for r in reqs], dtype=torch.long)
+
+        logits, self._batch_past = self._run_forward(input_ids, attention_mask, position_ids, self._batch_past)
+        self._batch_width = width + 1
+        step_s = time.perf_counter() - t0
+
+        # every row grew by one position, whatever _advance does with the request
+        for req in reqs:
+            req.length += 1
+            req.decode_s += step_s
+        for row, req in enumerate(reqs):
+            self._advance(req, logits[row, -1])
+        elapsed = time.perf_counter() - t0
+        metrics.observe("decode_step", elapsed)
+        self.stats["tokens"] += len(reqs)
+        self.stats["decode_s"] += elapsed
+
+    def _draft(self, req, k):
+        """Greedily propose k tokens with the draft model, catching its cache up first."""
+        seq = req.prompt_ids + req.generated  # ends with req.next_token
+        feed = seq[req.draft_length:]
+        proposals = []
+        for _ in range(k):
+            start = req.draft_length
+            logits, req.draft_past = self._run_forward(
+                torch.tensor([feed], dtype=torch.long),
+                torch.ones((1, start + len(feed)), dtype=torch.long),
+                torch.arange(start, start + len(feed), dtype=torch.long).unsqueeze(0),
+                req.draft_past,
+                model=self.draft_model,
+            )
+            req.draft_length = start + len(feed)
+            token = int(torch.argmax(logits[0, -1]))
+            proposals.append(token)
+            feed = [token]
+        return proposals
+
+    def _speculative_step(self, reqs):
+        (req,) = reqs
+        t0 = time.perf_counter()
+        self._detach(req)  # it may have decoded in the batch while the scheduler was busy
+        length = req.length
+        k = min(self.num_draft_tokens, req.max_new_tokens - len(req.generated) - 1)
+        proposals = self._draft(req, k) if k > 0 else []
+
+        # one main-model pass scores next_token and every proposal
+        tokens = [req.next_token] + proposals
+        logits, past = self._run_forward(
+            torch.tensor([tokens], dtype=torch.long),
+            torch.ones((1, length + len(tokens)), dtype=torch.long),
+            torch.arange(length, length + len(tokens), dtype=torch.long).unsqueeze(0),
+            req.past,
+        )
+
+        req.decode_s += time.perf_counter() - t0
+        metrics.observe("speculative_step", time.perf_counter() - t0)
+
+        # _advance picks the main model's token at each position; stop at the
+        # first disagreement (that token is the correction) or when req finishes
+        produced = accepted = 0
+        for i in range(len(tokens)):
+            self._advance(req, logits[0, i])
+            produced += 1
+            if req.future.done() or i == len(proposals) or req.next_token != proposals[i]:
+                break
+            accepted += 1
+
+        if not req.future.done():
+            # keep next_token plus the accepted proposals, drop the rejected tail
+            req.length = length + produced
+            req.past = trim_cache(past, req.length)
+            req.draft_length = min(req.draft_length, req.length)
+            req.draft_past = trim_cache(req.draft_past, req.draft_length) if req.draft_past else None
+        else:
+            req.draft_past = None
+
+        elapsed = time.perf_counter() - t0
+        self.stats["drafted"] += len(proposals)
+        self.stats["accepted"] += accepted
+        self.stats["tokens"] += produced
+        self.stats["spec_tokens"] += produced
+        self.stats["decode_s"] += elapsed
+        self.stats["spec_s"] += elapsed
+
+    @staticmethod
+    def _report(req):
+        metrics.observe("decode", req.decode_s, req.trace)
+        metrics.TOKENS.inc(len(req.generated))
+        if req.trace is not None:
+            req.trace.annotate(tokens=len(req.generated), speculative=req.speculative,
+                               tokens_per_s=round(len(req.generated) / req.decode_s, 2) if req.decode_s else None)
+
+    # -------------------
+    # Per-request sampling and stop conditions
+    # -------------------
+    def _sample(self, req, logits):
+        logits = logits.float()
+        if req.repetition_penalty != 1.0:
+            seen = torch.tensor(sorted(set(req.prompt_ids) | set(req.generated)), device=logits.device)
+            scores = logits[seen]
+            logits[seen] = torch.where(scores < 0, scores * req.repetition_penalty, scores / req.repetition_penalty)
+
+        if not req.do_sample or req.temperature <= 0:
+            return int(torch.argmax(logits))
+
+        probs = torch.softmax(logits / req.temperature, dim=-1)
+        if req.top_p < 1.0:
+            sorted_probs, sorted_idx = torch.sort(probs, descending=True)
+            cumulative = torch.cumsum(sorted_probs, dim=-1)
+            # keep the smallest prefix whose mass reaches top_p (always at least one token)
+            sorted_probs[(cumulative - sorted_probs) > req.top_p] = 0.0
+            probs = torch.zeros_like(probs).scatter_(0, sorted_idx, sorted_probs)
+        return int(torch.multinomial(probs, 1))
+
+    def _advance(self, req, logits):
+        token = self._sample(req, logits)
+        done = token == self.eos_token_id
+        if not done:
+            req.generated.append(token)
+            req.next_token = token
+            done = len(req.generated) >= req.max_new_tokens
+
+        text = None
+        if req.stop_strings or req.streamer is not None:
+            text = self.tokenizer.decode(req.generated, skip_special_tokens=True)
+            for stop in req.stop_strings:
+                pos = text.find(stop)
+                if pos != -1:
+                    text = text[:pos]
+                    done = True
+                    break
+
+        if done:
+            if text is None:
+                text = self.tokenizer.decode(req.generated, skip_special_tokens=True)
+            self._active.remove(req)
+            req.past = None
+            self._report(req)
+            # token counts for callers that account per request (batch_qa.py)
+            req.future.usage = {"prompt_tokens": len(req.prompt_ids), "completion_tokens": len(req.generated)}
+            # before set_result: result() waiters may wake before done callbacks run
+            req.future.finished_at = time.perf_counter()
+            req.future.set_result(text)
+        if req.streamer is not None:
+            req.streamer.put(text, done)
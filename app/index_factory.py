@@ -0,0 +1,172 @@
+# app/index_factory.py
+import math
+import os
+
+import faiss
+import numpy as np
+
+# flat:  exact brute-force scan (the original IndexFlatIP)
+# ivf:   inverted lists over k-means cells, exact vectors; tune nprobe
+# ivfpq: inverted lists + product-quantized codes (~dim/8 bytes/vector); tune nprobe
+# hnsw:  graph index, no training, no removals; tune efSearch
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+# below this many vectors the coarse quantizer can't be trained meaningfully
+MIN_TRAIN_PER_CELL = 39
+
+
+def default_nlist(n_vectors):
+    """~4*sqrt(n) cells, capped so every cell still gets enough training points."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_TRAIN_PER_CELL))
+
+
+def factory_string(kind, dim, n_vectors, nlist=None, pq_m=None, hnsw_m=32):
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    nlist = nlist or default_nlist(n_vectors)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    if kind == "ivfpq":
+        m = pq_m or next(m for m in (dim // 8, 48, 32, 16, 8, 4, 2, 1) if m and dim % m == 0)
+        return f"IVF{nlist},PQ{m}x8"
+    raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_TYPES}")
+
+
+def effective_kind(kind, n_vectors):
+    """The kind make_index builds for `kind`: flat when the corpus is too small to train it."""
+    if kind in ("ivf", "ivfpq") and n_vectors < MIN_TRAIN_PER_CELL * (256 if kind == "ivfpq" else 1):
+        return "flat"
+    return kind
+
+
+def make_index(kind, dim, n_vectors, **kwargs):
+    """
+    Untrained, ID-mapped inner-product index of the requested kind. Falls back
+    to flat when the corpus is too small to train the requested index.
+    """
+    if effective_kind(kind, n_vectors) != kind:
+        print(f"Only {n_vectors} vectors: too few to train {kind}, using flat.")
+        kind = "flat"
+    spec = factory_string(kind, dim, n_vectors, **kwargs)
+    return faiss.IndexIDMap2(faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT))
+
+
+def train_index(index, embeddings, sample_size=100_000, seed=0):
+    """Train on a random sample of `embeddings` (no-op for flat / HNSW)."""
+    if index.is_trained:
+        return
+    n = len(embeddings)
+    if n > sample_size:
+        rows = np.sort(np.random.default_rng(seed).choice(n, sample_size, replace=False))
+        sample = np.asarray(embeddings[rows], dtype=np.float32)
+    else:
+        sample = np.asarray(embeddings, dtype=np.float32)
+    index.train(sample)
+
+
+def build_ann_index(kind, embeddings, ids, batch_size=65_536, **kwargs):
+    """Make, train and fill an index; `embeddings` may be a memory-mapped array."""
+    index = make_index(kind, embeddings.shape[1], len(embeddings), **kwargs)
+    train_index(index, embeddings)
+    ids = np.asarray(ids, dtype=np.int64)
+    for start in range(0, len(embeddings), batch_size):
+        index.add_with_ids(np.asarray(embeddings[start:start + batch_size], dtype=np.float32),
+                           ids[start:start + batch_size])
+    return index
+
+
+def index_kind(index):
+    """Inverse of make_index: which INDEX_TYPES entry `index` is."""
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Apply query-time knobs (recall vs latency); defaults come from
+    $FAISS_NPROBE / $FAISS_EF_SEARCH. Knobs that don't apply are ignored.
+    """
+    nprobe = nprobe or os.getenv("FAISS_NPROBE")
+    ef_search = ef_search or os.getenv("FAISS_EF_SEARCH")
+    kind = index_kind(index)
+    params = faiss.ParameterSpace()
+    if nprobe and kind in ("ivf", "ivfpq"):
+        params.set_index_parameter(index, "nprobe", int(nprobe))
+    if ef_search and kind == "hnsw":
+        params.set_index_parameter(index, "efSearch", int(ef_search))
+    return index
+
+
+# -------------------
+# Filtered search
+# -------------------
+class IDFilter:
+    """
+    The FAISS ids a search is restricted to, as a faiss.IDSelectorBatch
+    (hash set + bloom filter) the index checks while it scans, so a
+    selective filter still returns a full k instead of post-filtering the
+    unfiltered top-k. Build once per filter and reuse across queries.
+    """
+
+    def __init__(self, ids):
+        self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+        self.selector = faiss.IDSelectorBatch(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def search_params(index, id_filter, exhaustive=False):
+    """
+    SearchParameters carrying `id_filter`'s selector plus the index's own
+    nprobe / efSearch (params replace, not extend, the index settings).
+    `exhaustive` probes every IVF list, for when the selected ids are too
+    sparse to turn up in the default nprobe lists.
+    """
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=id_filter.selector,
+                                         nprobe=inner.nlist if exhaustive else inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=id_filter.selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=id_filter.selector)
+
+
+def _exact_search(index, queries, k, ids):
+    """Brute-force inner product over the stored vectors of `ids` (HNSW,Flat can reconstruct them)."""
+    vectors = np.vstack([index.reconstruct(int(i)) for i in ids])
+    scores = queries @ vectors.T
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    D = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    I = np.full((len(queries), k), -1, dtype=np.int64)
+    D[:, :top.shape[1]] = np.take_along_axis(scores, top, axis=1)
+    I[:, :top.shape[1]] = ids[top]
+    return D, I
+
+
+def filtered_search(index, queries, k, id_filter):
+    """
+    index.search restricted to `id_filter`. Queries that come back with
+    fewer than min(k, len(id_filter)) hits (IVF lists or the HNSW graph
+    neighbourhood missing sparse ids) are re-run exhaustively: all IVF
+    lists, or an exact scan of the selected vectors for HNSW. Every query
+    gets a full k when the filter allows.
+    """
+    D, I = index.search(queries, k, params=search_params(index, id_filter))
+    want = min(k, len(id_filter))
+    short = np.flatnonzero((I[:, :want] == -1).any(axis=1))
+    if len(short):
+        if index_kind(index) == "hnsw":
+            D2, I2 = _exact_search(index, queries[short], k, id_filter.ids)
+        else:
+            D2, I2 = index.search(queries[short], k, params=search_params(index, id_filter, exhaustive=True))
+        D[short], I[short] = D2, I2
+    return D, I
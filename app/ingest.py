@@ -0,0 +1,191 @@
+# app/ingest.py
+"""
+Corpus ingestion: index a whole directory of documents into one FAISS index.
+
+    python app/ingest.py data/corpus --out models --workers 8
+
+Documents stream through a generator pipeline: regex cleaning and chunking
+run in a process pool (a bounded window of documents in flight), chunks are
+embedded in large batches through the persistent embedding cache, and each
+batch is appended to the chunk store on disk before the next one is built,
+so ingestion holds one batch of embeddings (plus a few ints per chunk)
+rather than the corpus. The index is filled at the end from the
+memory-mapped embeddings.npy; it holds every vector itself (flat, ivf,
+hnsw) or their PQ codes (ivfpq).
+Per-chunk source documents are recorded in chunk_docs.npy / docs.json,
+sections and years for filtered search in chunk_meta.npz, and BM25 term
+statistics for hybrid retrieval in bm25.npz.
+With --index-type ivf/ivfpq/hnsw the ANN index is trained on a sample of
+those embeddings first.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+
+from build_index import INDEX_FILE, META_FILE, clean_context, split_paragraph_chunks
+from chunker import DEFAULT_TOKEN_OVERLAP, token_chunker
+import chunk_meta
+from chunk_store import ChunkStore, ChunkStoreWriter
+from embedder import EMBED_MODEL_NAME
+from embedding_cache import EmbeddingCache, chunk_id
+from index_factory import INDEX_TYPES, build_ann_index, index_kind
+from retrieval import save_bm25
+
+
+def iter_documents(root, patterns=("*.txt", "*.md")):
+    """Yield document paths under `root` in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if any(fnmatch.fnmatch(name, p) for p in patterns):
+                yield os.path.join(dirpath, name)
+
+
+_chunkers = {}
+
+
+def prepare_document(path, chunk_size=80, overlap=20, chunk_tokens=None, token_overlap=DEFAULT_TOKEN_OVERLAP,
+                     align_sentences=False):
+    """
+    Read, clean, chunk and describe (chunk_meta) one document (runs in a
+    worker process). With
+    `chunk_tokens` chunks are token-bounded (see chunker.TokenChunker); each
+    worker loads the tokenizer once.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    chunker = None
+    if chunk_tokens:
+        key = (chunk_tokens, token_overlap, align_sentences)
+        chunker = _chunkers.get(key)
+        if chunker is None:
+            chunker = _chunkers[key] = token_chunker(chunk_tokens, token_overlap, align_sentences)
+    chunks = split_paragraph_chunks(clean_context(text), chunk_size=chunk_size, overlap=overlap, chunker=chunker)
+    return path, chunks, chunk_meta.describe(chunks)
+
+
+def iter_prepared(paths, workers, window, **chunking):
+    """Run prepare_document over `paths` in a process pool, keeping at most `window` in flight."""
+    if workers <= 1:
+        for path in paths:
+            yield prepare_document(path, **chunking)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(prepare_document, path, **chunking))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_batches(prepared, batch_size, docs):
+    """Group (doc, chunks, meta) results into batches of ~batch_size unique chunks."""
+    seen = set()
+    texts, ids, doc_ids, metas = [], [], [], []
+    for path, chunks, meta in prepared:
+        doc_id = len(docs)
+        docs.append(path)
+        keep = []
+        for row, chunk in enumerate(chunks):
+            key = chunk_id(chunk)
+            if key in seen:  # identical chunk already indexed from another doc
+                continue
+            seen.add(key)
+            texts.append(chunk)
+            ids.append(key)
+            doc_ids.append(doc_id)
+            keep.append(row)
+        metas.append({name: column[keep] for name, column in meta.items()})
+        if len(texts) >= batch_size:
+            yield texts, ids, doc_ids, chunk_meta.concat(metas)
+            texts, ids, doc_ids, metas = [], [], [], []
+    if texts:
+        yield texts, ids, doc_ids, chunk_meta.concat(metas)
+
+
+def ingest(root, out_dir, workers=None, batch_size=2048, patterns=("*.txt", "*.md"),
+           model_name=EMBED_MODEL_NAME, kind="flat", **chunking):
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    docs = []
+    cache = EmbeddingCache(os.path.join(out_dir, "embedding_cache"), model_name)
+    writer = ChunkStoreWriter(out_dir)
+    encoded = 0
+    embed_s = 0.0
+
+    prepared = iter_prepared(iter_documents(root, patterns), workers, window=workers * 4, **chunking)
+    for texts, ids, doc_ids, meta in iter_batches(prepared, batch_size, docs):
+        t0 = time.perf_counter()
+        embeddings, n_new = cache.embed(texts, ids, batch_size=256)
+        embed_s += time.perf_counter() - t0
+        encoded += n_new
+        writer.add(texts, embeddings, ids, doc_ids, meta)
+        del embeddings  # on disk now (chunk store + cache scratch file)
+
+        elapsed = time.perf_counter() - start
+        print(f"  {len(docs)} docs, {writer.count} chunks "
+              f"({len(docs) / elapsed:.1f} docs/s, {writer.count / elapsed:.1f} chunks/s)")
+
+    if not writer.count:
+        raise ValueError(f"No documents matching {patterns} under {root}.")
+
+    writer.close(docs=docs)
+    store = ChunkStore(out_dir)
+    cache.save(retain=store.ids)  # drop embeddings of chunks no longer in the corpus
+    # fill (and for ANN kinds, train on a sample of) the index, reading vectors back via mmap
+    index = build_ann_index(kind, store.embeddings, store.ids)
+    t0 = time.perf_counter()
+    save_bm25(store, out_dir)
+    print(f"  BM25 statistics built in {time.perf_counter() - t0:.1f}s")
+
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"embed_model": model_name, "dim": int(index.d), "chunks": writer.count, "docs": len(docs),
+                   "index_type": index_kind(index)}, f)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "docs": len(docs),
+        "chunks": writer.count,
+        "encoded": encoded,
+        "seconds": round(elapsed, 3),
+        "embed_seconds": round(embed_s, 3),
+        "docs_per_s": round(len(docs) / elapsed, 1),
+        "chunks_per_s": round(writer.count / elapsed, 1),
+    }
+    print(f"Ingested {stats['docs']} docs → {stats['chunks']} chunks ({encoded} encoded) in {elapsed:.1f}s "
+          f"[{stats['docs_per_s']} docs/s, {stats['chunks_per_s']} chunks/s] → {index_path}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory of documents to index")
+    parser.add_argument("--out", default="models")
+    parser.add_argument("--workers", type=int, default=None, help="cleaning/chunking processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=2048, help="chunks per embedding/index batch")
+    parser.add_argument("--pattern", action="append", dest="patterns", help="file glob (repeatable; default *.txt, *.md)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--chunk-tokens", type=int, default=None,
+                        help="token-bounded chunks of at most N embedder tokens (default: 80-word windows)")
+    parser.add_argument("--token-overlap", type=int, default=DEFAULT_TOKEN_OVERLAP)
+    parser.add_argument("--align-sentences", action="store_true", help="with --chunk-tokens: cut at sentence ends")
+    args = parser.parse_args()
+    ingest(args.root, args.out, workers=args.workers, batch_size=args.batch_size,
+           patterns=tuple(args.patterns or ("*.txt", "*.md")), kind=args.index_type,
+           chunk_tokens=args.chunk_tokens, token_overlap=args.token_overlap, align_sentences=args.align_sentences)
+
+
+if __name__ == "__main__":
+    main()
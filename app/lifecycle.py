@@ -0,0 +1,71 @@
+# app/lifecycle.py
+import threading
+import time
+import traceback
+
+
+class Startup:
+    """
+    Runs named loading stages (model, index, warm-up, ...) on a background
+    thread so the server can bind and answer probes immediately.
+
+    status() backs the /healthz and /readyz endpoints: healthy unless a stage
+    failed, ready once every stage has finished.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = []
+        self.error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, stages):
+        """`stages` is a list of (name, callable) run in order."""
+        self.stages = [{"name": name, "state": "pending"} for name, _ in stages]
+        threading.Thread(target=self._run, args=([fn for _, fn in stages],), name="startup", daemon=True).start()
+        return self
+
+    def _run(self, fns):
+        for stage, fn in zip(self.stages, fns):
+            with self._lock:
+                stage["state"] = "running"
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                traceback.print_exc()
+                with self._lock:
+                    stage.update(state="failed", error=f"{type(e).__name__}: {e}")
+                    self.error = stage["error"]
+                return
+            with self._lock:
+                stage.update(state="done", seconds=round(time.perf_counter() - t0, 2))
+            print(f"Startup: {stage['name']} done in {stage['seconds']}s")
+        self._ready.set()
+        print(f"Startup: ready after {time.time() - self.started_at:.1f}s")
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def wait(self, timeout=None):
+        """Block until ready (True), or until a stage fails or `timeout` passes (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.wait(0.2):
+            if self.failed or (deadline is not None and time.monotonic() >= deadline):
+                return False
+        return True
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "failed": self.failed,
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "stages": [dict(stage) for stage in self.stages],
+            }
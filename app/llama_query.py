@@ -1,7 +1,18 @@
 import os
-import pickle
-import faiss
+import sys
+import time
 import torch
+from embedder import register_embedder, warm_up as warm_up_embedder
+from query_batcher import QueryBatcher
+from generation import GenerationScheduler
+from model_loader import load_causal_lm
+from prefix_cache import PrefixCache
+from chunk_store import CURRENT_FILE, load_chunks, read_index
+from index_factory import set_search_params
+from retrieval import HybridRetriever, load_bm25
+from context_builder import ContextBuilder
+from model_server import ModelClient
+from lifecycle import Startup
 from transformers import LlamaTokenizer, LlamaForCausalLM, GenerationConfig
 
 # -------------------
@@ -10,68 +21,146 @@ from transformers import LlamaTokenizer, LlamaForCausalLM, GenerationConfig
 model_name = "NousResearch/Llama-2-7b-chat-hf"  # change if you used another model
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-print(f"Loading model on {device}...")
-tokenizer = LlamaTokenizer.from_pretrained(model_name)
-model = LlamaForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-    low_cpu_mem_usage=True
-).to(device)
-model.eval()
+# MODEL_SERVER=<unix socket>: the model, embedder and index live in a shared
+# model_server.py process and this one (e.g. one of several Gradio workers)
+# only proxies to it, so memory doesn't grow with the worker count
+MODEL_SERVER = os.getenv("MODEL_SERVER")
+
+# Everything below is loaded by the background startup stages, so importers
+# (the Gradio UI) can bind their port right away and gate on startup.ready
+model = tokenizer = scheduler = model_client = None
+index = chunks = retriever = context_builder = None
+startup = Startup()
+
+def _load_model():
+    global model, tokenizer, scheduler, model_client
+    if MODEL_SERVER:
+        print(f"Using model server at {MODEL_SERVER}")
+        model_client = ModelClient(MODEL_SERVER)
+        while True:  # the model server may still be loading its own model
+            try:
+                model_client.ping()
+                break
+            except OSError:
+                time.sleep(1)
+        register_embedder(model_client.embedder)
+        scheduler = model_client.scheduler
+        return
+
+    tokenizer = LlamaTokenizer.from_pretrained(model_name)
+    # LLM_QUANTIZE=int8|int4|bf16 shrinks the resident model on CPU (see model_loader)
+    model = load_causal_lm(model_name, device, model_cls=LlamaForCausalLM)
+
+    # one worker owns the model; concurrent callers are batched step by step
+    scheduler = GenerationScheduler(
+        model, tokenizer, device,
+        max_batch_size=int(os.getenv("GENERATION_MAX_BATCH", "8")),
+        prefix_cache=PrefixCache(max_entries=int(os.getenv("PREFIX_CACHE_SIZE", "4"))),
+    )
 
 # -------------------
 # Load FAISS index + chunks
 # -------------------
-index_file = "models/resume.index"
-chunks_file = "models/chunks.pkl"
+models_dir = "models"
+index_file = os.path.join(models_dir, "resume.index")
+# switched last by build_index.py, so its mtime marks a finished rebuild
+chunks_file = os.path.join(models_dir, CURRENT_FILE)
+
+def _load_index():
+    global index, chunks, retriever, context_builder
+    if MODEL_SERVER:
+        retriever = model_client.retriever
+        context_builder = model_client.context_builder
+        return
+
+    print("Loading FAISS index and chunks...")
+    # both are memory-mapped: worker processes share pages via the OS page cache
+    index = read_index(index_file)
+    # IVF/HNSW indexes: FAISS_NPROBE / FAISS_EF_SEARCH trade recall for latency
+    set_search_params(index)
+    chunks = load_chunks(models_dir)
+
+    # concurrent callers (e.g. Gradio threads) share one encode() + search() per window
+    retrieval_batcher = QueryBatcher(
+        index,
+        max_batch_size=int(os.getenv("RETRIEVAL_MAX_BATCH", "32")),
+        max_wait_ms=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5")),
+        # chunks are indexed as normalized vectors, so normalized queries give cosine scores
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+    # BM25 over the same chunks, fused with the dense hits; exact-term queries
+    # ("Kafka", "Samza") skip the embedding call entirely
+    retriever = HybridRetriever(chunks, retrieval_batcher.search, bm25=load_bm25(chunks, models_dir))
+    # over-fetch, MMR-rerank and pack hits into the prompt's token budget
+    context_builder = ContextBuilder(retriever, tokenizer, fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", "12")))
 
-print("Loading FAISS index and chunks...")
-index = faiss.read_index(index_file)
-with open(chunks_file, "rb") as f:
-    chunks = pickle.load(f)
+def _warm_up():
+    """One short retrieval + generation, so the first real question doesn't pay for lazy init."""
+    warm_up_embedder()
+    context = "\n".join(retriever.retrieve("technical skills", 2))
+    scheduler.generate(f"Here is the resume content:\n{context}\n\nQuestion: hi\nAnswer:", max_new_tokens=4,
+                       do_sample=False)
+
+startup.start([("model", _load_model), ("index", _load_index), ("warm-up", _warm_up)])
 
 # -------------------
 # Helper: retrieve top-k chunks
 # -------------------
 def retrieve(query, k=3):
-    from sentence_transformers import SentenceTransformer
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    query_emb = embedder.encode([query])
-    D, I = index.search(query_emb, k)
-    return [chunks[i] for i in I[0] if i != -1]
+    return retriever.retrieve(query, k)
+
+def build_context(query, prompt_template, max_input_tokens):
+    """
+    Reranked chunks that fit in `prompt_template` (the prompt with an empty
+    context) without exceeding `max_input_tokens`.
+    """
+    budget = context_builder.budget_for(prompt_template, max_input_tokens)
+    return context_builder.build(query, budget)
 
 # -------------------
 # Main chat loop
 # -------------------
-print("ChatBot ready! Ask me about my resume (type 'exit' to quit).")
-
-while True:
-    query = input("\nYou: ")
-    if query.lower() in ["exit", "quit", "q"]:
-        print("Goodbye!")
-        break
-
-    # Retrieve relevant context
-    context_chunks = retrieve(query, k=3)
-    if not context_chunks:
-        print("Bot: I don't know.")
-        continue
-
-    context_text = "\n".join(context_chunks)
-
-    # Build prompt with context
-    prompt = (
-        f"You are an assistant answering questions about a resume.\n"
-        f"Here is the resume content:\n{context_text}\n\n"
-        f"Question: {query}\n"
-        f"Answer:"
-    )
+def chat_loop():
+    print("ChatBot ready! Ask me about my resume (type 'exit' to quit).")
+
+    while True:
+        query = input("\nYou: ")
+        if query.lower() in ["exit", "quit", "q"]:
+            print("Goodbye!")
+            break
+
+        # Retrieve relevant context, packed into what the prompt leaves of the input budget
+        template = (
+            f"You are an assistant answering questions about a resume.\n"
+            f"Here is the resume content:\n\n\n"
+            f"Question: {query}\n"
+            f"Answer:"
+        )
+        context_chunks = build_context(query, template, max_input_tokens=2048)
+        if not context_chunks:
+            print("Bot: I don't know.")
+            continue
+
+        context_text = "\n".join(context_chunks)
+
+        # Build prompt with context
+        context_prefix = (
+            f"You are an assistant answering questions about a resume.\n"
+            f"Here is the resume content:\n{context_text}\n\n"
+        )
+        prompt = (
+            f"{context_prefix}"
+            f"Question: {query}\n"
+            f"Answer:"
+        )
 
-    # Tokenize & generate
-    inputs = tokenizer(prompt, return_tensors="pt").to(device)
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
+        # Generate (the scheduler returns only the continuation, not the prompt)
+        answer = scheduler.generate(
+            prompt,
+            static_prefix="You are an assistant answering questions about a resume.\n",
+            context_prefix=context_prefix,
+            max_input_tokens=2048,
             max_new_tokens=300,
             do_sample=True,
             temperature=0.7,
@@ -79,10 +168,10 @@ while True:
             repetition_penalty=1.2
         )
 
-    answer = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        print(f"Bot: {answer.strip()}")
 
-    # Strip the prompt back off
-    if "Answer:" in answer:
-        answer = answer.split("Answer:")[-1].strip()
 
-    print(f"Bot: {answer}")
+if __name__ == "__main__":
+    if not startup.wait():
+        sys.exit(f"Startup failed: {startup.error}")
+    chat_loop()
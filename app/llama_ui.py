@@ -1,69 +1,115 @@
-import threading
 import torch
 import gc
 import gradio as gr
-from llama_query import model as llama_model, tokenizer as llama_tokenizer, device as llama_device, retrieve as llama_retrieve
+import os
+import llama_query
+from llama_query import build_context, index_file, chunks_file
+from redaction import StreamRedactor
+from answer_cache import AnswerCache
+import metrics
 
 gc.collect()
 torch.cuda.empty_cache()
 
 # ------------------- Model loading -------------------
-model_ready = False
-model = llama_model
-tokenizer = llama_tokenizer
-device = llama_device
-
-def load_model():
-    global model_ready
-    # model is already imported from llama_query
-    model_ready = True
-    print("Model loaded!")
-
-threading.Thread(target=load_model).start()
+# importing llama_query starts its background startup (model, index,
+# warm-up); the UI binds immediately and answers once llama_query.startup.ready
 
 # ------------------- Chat functions -------------------
-def answer_question(question, history):
-    if not model_ready:
-        history.append({"role": "assistant", "content": "🤖 Model is still loading, please wait a moment..."})
-        return history, ""
-    
-    chunks = llama_retrieve(question)
-    context = "\n".join(chunks)
-    
-    prompt = f"""You are Ameesha Priya's AI assistant. Answer questions about her resume and background.
+# suggested-prompt buttons repeat the same few questions; serve those from cache
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    watch_paths=[index_file, chunks_file],
+)
+
+PROMPT_PREAMBLE = """You are Ameesha Priya's AI assistant. Answer questions about her resume and background.
 
 IMPORTANT PRIVACY RULES:
 - NEVER share phone numbers or personal contact information
 - If asked for contact info, say "Please use the contact form to reach out"
 - Stay focused on professional topics only
 - Don't make up information not in the resume
+"""
+MAX_INPUT_TOKENS = 2048
+
+def answer_question(question, history):
+    """Generator for Gradio: yields (history, "") as the answer streams in."""
+    if not llama_query.startup.ready:
+        history.append({"role": "assistant", "content": "🤖 Model is still loading, please wait a moment..."})
+        yield history, ""
+        return
 
+    with metrics.trace("ui"):
+        yield from _answer(question, history)
+
+def _answer(question, history):
+    with metrics.stage("answer_cache"):
+        cached = answer_cache.get(question)
+    if cached is not None:
+        history.append({"role": "user", "content": question})
+        history.append({"role": "assistant", "content": cached})
+        yield history, ""
+        return
+    
+    # reranked chunks packed into what the template leaves of max_input_tokens,
+    # instead of a fixed top-3 that the scheduler might truncate
+    template = f"""{PROMPT_PREAMBLE}
 Context from resume:
-{context}
+
 
 Question: {question}
 Answer:"""
+    with metrics.stage("retrieval"):
+        chunks = build_context(question, template, MAX_INPUT_TOKENS)
+    context = "\n".join(chunks)
     
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048).to(device)
-    
-    with torch.no_grad():
-        outputs = model.generate(
-            inputs.input_ids,
-            max_new_tokens=150,
-            temperature=0.7,
-            top_p=0.9,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id
-        )
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    answer = response.split("Answer:")[-1].strip()
+    # static preamble + retrieved context are prefix-cached; only the question is prefilled
+    context_prefix = f"""{PROMPT_PREAMBLE}
+Context from resume:
+{context}
+
+"""
+    prompt = f"""{context_prefix}Question: {question}
+Answer:"""
     
-    if "Question:" in answer:
-        answer = answer.split("Question:")[0].strip()
+    # shared scheduler batches concurrent Gradio threads; stop before the model
+    # starts inventing the next "Question:"
+    streamer = llama_query.scheduler.stream(
+        prompt,
+        static_prefix=PROMPT_PREAMBLE,
+        context_prefix=context_prefix,
+        max_input_tokens=MAX_INPUT_TOKENS,
+        max_new_tokens=150,
+        temperature=0.7,
+        top_p=0.9,
+        do_sample=True,
+        stop_strings=["Question:"],
+    )
     
     history.append({"role": "user", "content": question})
-    history.append({"role": "assistant", "content": answer})
-    return history, ""
+    history.append({"role": "assistant", "content": ""})
+    redactor = StreamRedactor()
+    answer = ""
+    try:
+        for delta in streamer:
+            answer += redactor.feed(delta)
+            history[-1]["content"] = answer.lstrip()
+            yield history, ""
+    finally:
+        streamer.close()
+    answer += redactor.flush()
+    history[-1]["content"] = answer.strip()
+    with metrics.stage("answer_cache"):
+        answer_cache.put(question, history[-1]["content"])
+    yield history, ""
+
+def ask_preset(question):
+    """Bind a suggested-prompt button to a streaming answer_question call."""
+    def handler(history):
+        yield from answer_question(question, history)
+    return handler
 
 def submit_contact_form(name, email, message):
     if not name or not email or not message:
@@ -122,13 +168,41 @@ with gr.Blocks(css=custom_css, title="Ameesha Priya - Resume Assistant") as ifac
     submit_btn.click(answer_question, [msg, chatbot], [chatbot, msg])
     msg.submit(answer_question, [msg, chatbot], [chatbot, msg])
     
-    exp_btn.click(lambda h: answer_question("Tell me about your experience", h), [chatbot], [chatbot, msg])
-    proj_btn.click(lambda h: answer_question("What projects have you worked on?", h), [chatbot], [chatbot, msg])
-    skills_btn.click(lambda h: answer_question("What are your technical skills?", h), [chatbot], [chatbot, msg])
-    edu_btn.click(lambda h: answer_question("Tell me about your education", h), [chatbot], [chatbot, msg])
+    exp_btn.click(ask_preset("Tell me about your experience"), [chatbot], [chatbot, msg])
+    proj_btn.click(ask_preset("What projects have you worked on?"), [chatbot], [chatbot, msg])
+    skills_btn.click(ask_preset("What are your technical skills?"), [chatbot], [chatbot, msg])
+    edu_btn.click(ask_preset("Tell me about your education"), [chatbot], [chatbot, msg])
     
     contact_submit.click(submit_contact_form, [contact_name, contact_email, contact_message], [contact_output, contact_name, contact_email, contact_message])
 
 # ------------------- Launch -------------------
+def probe_app():
+    """FastAPI app serving the Gradio UI at / plus /healthz, /readyz and /metrics."""
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    api = FastAPI()
+
+    @api.get("/healthz")
+    def healthz():
+        status = llama_query.startup.status()
+        return JSONResponse(status, status_code=500 if status["failed"] else 200)
+
+    @api.get("/readyz")
+    def readyz():
+        status = llama_query.startup.status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    @api.get("/metrics")
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    return gr.mount_gradio_app(api, iface, path="/")
+
 if __name__ == "__main__":
-    iface.launch(server_name="0.0.0.0", server_port=7860, share=True)
+    if os.getenv("GRADIO_SHARE") == "1":
+        # public *.gradio.live link; no probe endpoints in this mode
+        iface.launch(server_name="0.0.0.0", server_port=7860, share=True)
+    else:
+        import uvicorn
+        uvicorn.run(probe_app(), host="0.0.0.0", port=int(os.getenv("PORT", "7860")))
@@ -0,0 +1,328 @@
+# app/mailer.py
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+SPOOL_DIR = os.getenv("MAIL_SPOOL_DIR", os.path.join("spool", "mail"))
+
+
+class TransientError(Exception):
+    """Delivery failed but may succeed later (network error, 429, 5xx)."""
+
+    def __init__(self, msg, retry_after=None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class PermanentError(Exception):
+    """Delivery can never succeed as sent (bad request, auth failure)."""
+
+
+# -------------------
+# Transports
+# -------------------
+class SendGridTransport:
+    """
+    SendGrid v3 mail/send over one pooled, keep-alive requests.Session.
+    `url` can point at a local stub server in tests.
+    """
+
+    def __init__(self, api_key, url=SENDGRID_URL, timeout=(3.05, 10), pool_size=4):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        # retries are the mailer's job (with backoff + spool), not urllib3's
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+
+    def send(self, message):
+        payload = {
+            "personalizations": [{"to": [{"email": message["to"]}]}],
+            "from": {"email": message["from"]},
+            "subject": message["subject"],
+            "content": [{"type": "text/plain", "value": message["text"]}],
+        }
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise TransientError(str(e)) from e
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise TransientError(f"HTTP {response.status_code}: {response.text[:200]}",
+                                 retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if response.status_code >= 400:
+            raise PermanentError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+class LogTransport:
+    """Prints messages instead of sending them (no provider configured)."""
+
+    def send(self, message):
+        print(f"[mail] to={message['to']} subject={message['subject']!r}\n{message['text']}")
+
+
+# -------------------
+# Spooling mailer
+# -------------------
+def _claim_owner(pid):
+    """
+    "<pid>-<start time>" naming process `pid` in claim files; the start time
+    (clock ticks since boot, from /proc) is left out where /proc is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return str(pid)
+    # field 22; the command name (field 2) may contain spaces, so count from its ")"
+    return f"{pid}-{int(stat[stat.rindex(b')') + 2:].split()[19])}"
+
+
+class Mailer:
+    """
+    Durable outbound mail queue.
+
+    enqueue() writes the message to a spool directory (temp file + rename)
+    and returns immediately; a background thread delivers due messages
+    through `transport`, retrying transient failures with exponential
+    backoff and jitter. Delivered messages are deleted; permanently failed
+    ones, or ones out of attempts, move to <spool>/failed/. Messages left in
+    the spool by a previous run are picked up on start.
+
+    Several worker processes may share one spool: a message is claimed by
+    renaming it to <id>.json.<pid>-<start time>.sending before it is sent,
+    so exactly one process delivers it. Its next_attempt_at is re-read
+    after the claim, so a backoff another process set is kept. Claims of
+    dead processes are released on start; the start time tells a live
+    claimer from a new process that reused its pid (PID 1 again after a
+    container restart).
+    """
+
+    def __init__(self, transport, spool_dir=SPOOL_DIR, max_attempts=8, base_delay=2.0, max_delay=600.0):
+        self.transport = transport
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, "failed")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        self.sent = 0
+        self.failed = 0
+        self._due = []  # heap of (next_attempt_at, path)
+        self._inflight = 0
+        self._io_errors = {}  # path -> consecutive errors handling it (not delivery failures)
+        self._cond = threading.Condition()
+        self._owner = _claim_owner(os.getpid())
+        self._release_dead_claims()
+        for name in sorted(os.listdir(spool_dir)):
+            if name.endswith(".json"):
+                path = os.path.join(spool_dir, name)
+                try:
+                    next_at = self._read(path).get("next_attempt_at", 0.0)
+                except (OSError, ValueError):
+                    next_at = 0.0  # the worker reports and drops it
+                self._due.append((next_at, path))
+        heapq.heapify(self._due)
+        if self._due:
+            print(f"Mailer: resuming {len(self._due)} spooled message(s).")
+
+        self._worker = threading.Thread(target=self._run, name="mailer", daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._due) + self._inflight
+
+    def enqueue(self, to, sender, subject, text):
+        """Spool a message for delivery; returns its id without touching the network."""
+        msg_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        record = {"id": msg_id, "to": to, "from": sender, "subject": subject, "text": text,
+                  "attempts": 0, "next_attempt_at": 0.0}
+        path = os.path.join(self.spool_dir, msg_id + ".json")
+        self._write(path, record)
+        with self._cond:
+            heapq.heappush(self._due, (0.0, path))
+            self._cond.notify()
+        return msg_id
+
+    def flush(self, timeout=None):
+        """Block until the spool is empty (or `timeout` passes); returns True if it emptied."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._due or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # -------------------
+    # Worker
+    # -------------------
+    @staticmethod
+    def _read(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write(path, record):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp, path)
+
+    def _claim_path(self, path):
+        return f"{path}.{self._owner}.sending"
+
+    def _claimer_alive(self, owner):
+        pid, _, start = owner.partition("-")
+        pid = int(pid)
+        if pid == os.getpid():
+            # released before our worker claims anything: an earlier process with our pid
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # alive, owned by another user
+        # claims without a start time (no /proc): trust the pid
+        return not start or _claim_owner(pid) == owner
+
+    def _release_dead_claims(self):
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".sending"):
+                continue
+            base, owner, _ = name.rsplit(".", 2)
+            try:
+                if self._claimer_alive(owner):
+                    continue
+            except ValueError:
+                continue  # not a claim name we wrote
+            try:
+                os.replace(os.path.join(self.spool_dir, name), os.path.join(self.spool_dir, base))
+            except FileNotFoundError:
+                pass  # another process released it first
+
+    def _backoff(self, attempts, retry_after=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)  # jitter so a provider outage doesn't end in a thundering herd
+        return max(delay, retry_after or 0.0)
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if self._due:
+                    wait = self._due[0][0] - time.time()
+                    if wait <= 0:
+                        self._inflight += 1
+                        return heapq.heappop(self._due)[1]
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _done(self, path, next_at=None):
+        with self._cond:
+            self._inflight -= 1
+            if next_at is not None:
+                heapq.heappush(self._due, (next_at, path))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            path = self._next_due()
+            try:
+                next_at = self._deliver(path)
+            except Exception as e:  # disk full, permissions, ...: keep the only delivery thread alive
+                errors = self._io_errors[path] = self._io_errors.get(path, 0) + 1
+                next_at = time.time() + self._backoff(errors)
+                print(f"Mailer: error handling {path}, retrying in {next_at - time.time():.0f}s: {e}")
+                self._unclaim(path)
+            else:
+                self._io_errors.pop(path, None)
+            self._done(path, next_at)
+
+    def _unclaim(self, path):
+        """Put our claim on `path` back in the spool, if it is still there."""
+        try:
+            os.rename(self._claim_path(path), path)
+        except OSError:
+            pass
+
+    def _deliver(self, path):
+        """Claim and try to send one message; returns when to try it again, or None if it is finished."""
+        claimed = self._claim_path(path)
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None  # delivered or claimed by another worker process
+        try:
+            record = self._read(claimed)
+        except (OSError, ValueError) as e:
+            print(f"Mailer: dropping unreadable spool file {path}: {e}")
+            os.remove(claimed)
+            return None
+
+        next_at = record.get("next_attempt_at", 0.0)
+        if next_at > time.time():
+            # another process rescheduled it (backoff, Retry-After) after we queued it
+            os.rename(claimed, path)
+            return next_at
+
+        try:
+            self.transport.send(record)
+        except TransientError as e:
+            record["attempts"] += 1
+            if record["attempts"] < self.max_attempts:
+                record["next_attempt_at"] = time.time() + self._backoff(record["attempts"], e.retry_after)
+                record["last_error"] = str(e)
+                self._write(path, record)  # back in the spool, unclaimed
+                os.remove(claimed)
+                return record["next_attempt_at"]
+            self._fail(path, claimed, record, e)
+        except Exception as e:
+            self._fail(path, claimed, record, e)
+        else:
+            os.remove(claimed)
+            self.sent += 1
+        return None
+
+    def _fail(self, path, claimed, record, error):
+        record["last_error"] = str(error)
+        print(f"Mailer: giving up on {record['id']} after {record['attempts']} attempt(s): {error}")
+        self._write(os.path.join(self.failed_dir, os.path.basename(path)), record)
+        os.remove(claimed)
+        self.failed += 1
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer():
+    """
+    Process-wide Mailer: SendGrid when $SENDGRID_API_KEY is set (or
+    $MAIL_API_URL points at another compatible endpoint), else log only.
+    """
+    global _mailer
+    with _mailer_lock:
+        if _mailer is None:
+            api_key = os.getenv("SENDGRID_API_KEY")
+            if api_key:
+                transport = SendGridTransport(api_key, url=os.getenv("MAIL_API_URL", SENDGRID_URL))
+            else:
+                print("SENDGRID_API_KEY not set; contact messages will only be logged.")
+                transport = LogTransport()
+            _mailer = Mailer(transport)
+        return _mailer
@@ -0,0 +1,242 @@
+# app/metrics.py
+"""
+Hot-path instrumentation.
+
+    with metrics.trace("ask", request_id):      # one per request
+        with metrics.stage("retrieval"):        # anywhere below it, any module
+            ...
+
+Stage timings go to a `resume_stage_seconds{stage=...}` histogram and to the
+current request's trace, which is printed as one JSON line when the request
+ends. Work done on another thread (the query batcher, the generation
+scheduler) is attributed to the trace that was current when it was queued
+(see current_trace / Trace.add). render() returns everything, plus gauges
+registered with gauge() (or running totals kept elsewhere, with
+scraped_counter()), in the Prometheus text format for /metrics.
+
+METRICS=0 makes stage() and trace() no-ops; TRACE_LOG=0 keeps the metrics
+but drops the per-request log lines.
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+TRACE_LOG = os.getenv("TRACE_LOG", "1") != "0"
+
+# seconds; spans a PII regex check (~µs) up to a full 300-token answer
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# -------------------
+# Metric types
+# -------------------
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: str(item[0]))
+        for label_value, value in items:
+            labels = f'{{{self.label}="{_escape(label_value)}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {value}")
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by one label."""
+
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            items = sorted(((k, list(v)) for k, v in self._series.items()), key=lambda item: str(item[0]))
+        for label_value, series in items:
+            prefix = f'{self.label}="{_escape(label_value)}",' if self.label else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            labels = f"{{{prefix.rstrip(',')}}}" if prefix else ""
+            lines.append(f"{self.name}_sum{labels} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+
+
+STAGE_SECONDS = Histogram("resume_stage_seconds", "Time spent in each hot-path stage.", label="stage")
+REQUEST_SECONDS = Histogram("resume_request_seconds", "End-to-end request time.", label="endpoint")
+REQUESTS = Counter("resume_requests_total", "Requests served.", label="endpoint")
+TOKENS = Counter("resume_generated_tokens_total", "Tokens generated by the scheduler.")
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, TOKENS]
+_gauges = {}  # name -> (help, fn, type)
+
+
+def gauge(name, help, fn):
+    """Register a gauge read at scrape time; `fn` returns a number (None to skip)."""
+    _gauges[name] = (help, fn, "gauge")
+
+
+def scraped_counter(name, help, fn):
+    """Like gauge(), for a monotonically increasing total some other object keeps."""
+    _gauges[name] = (help, fn, "counter")
+
+
+def render():
+    """Every metric and gauge in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        metric.render(lines)
+    for name, (help, fn, kind) in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            value = None  # e.g. model server unreachable; skip rather than fail the scrape
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------
+# Traces and stage timers
+# -------------------
+_local = threading.local()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """Per-request record: stage durations (ms, summed per stage) and extra fields."""
+
+    def __init__(self, endpoint, request_id=None):
+        self.endpoint = endpoint
+        self.request_id = request_id or new_request_id()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.fields = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000.0
+
+    def annotate(self, **fields):
+        self.fields.update(fields)
+
+
+def current_trace():
+    """The trace of the request running on this thread, if any."""
+    return getattr(_local, "trace", None)
+
+
+def observe(stage, seconds, trace=None):
+    """Record a stage duration measured elsewhere (e.g. on a worker thread)."""
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = current_trace()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, self.trace)
+        return False
+
+
+class _Noop:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _Noop()
+
+
+def stage(name):
+    """Context manager timing `name` into the histogram and the current trace."""
+    return _Stage(name) if ENABLED else _NOOP
+
+
+class _TraceScope:
+    def __init__(self, endpoint, request_id):
+        self.trace = Trace(endpoint, request_id)
+
+    def __enter__(self):
+        self.previous = current_trace()
+        _local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        # a generator may finish on another thread than it started on
+        # (Gradio); only unwind the thread that still points at this trace
+        if current_trace() is self.trace:
+            _local.trace = self.previous
+        t = self.trace
+        elapsed = time.perf_counter() - t.started
+        REQUEST_SECONDS.observe(elapsed, t.endpoint)
+        REQUESTS.inc(label_value=t.endpoint)
+        if TRACE_LOG:
+            record = {"request_id": t.request_id, "endpoint": t.endpoint, "total_ms": round(elapsed * 1000, 2),
+                      "stages_ms": {k: round(v, 2) for k, v in t.stages.items()}, **t.fields}
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            print(json.dumps(record))
+        return False
+
+
+def trace(endpoint, request_id=None):
+    """Context manager opening a request trace on this thread; yields the Trace (None when disabled)."""
+    return _TraceScope(endpoint, request_id) if ENABLED else _NOOP
@@ -0,0 +1,57 @@
+# app/model_loader.py
+import os
+import torch
+from transformers import AutoModelForCausalLM
+
+# fp32: original behaviour; bf16: half the memory, no extra deps;
+# int8: dynamic int8 quantization of every nn.Linear (CPU);
+# int4: 4-bit weights (optimum-quanto on CPU, bitsandbytes on CUDA)
+QUANTIZE_MODES = ("fp32", "bf16", "int8", "int4")
+
+
+def _quantization_config(mode, device):
+    if device == "cuda":
+        from transformers import BitsAndBytesConfig
+        if mode == "int8":
+            return BitsAndBytesConfig(load_in_8bit=True)
+        return BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_compute_dtype=torch.float16)
+    from transformers import QuantoConfig
+    return QuantoConfig(weights="int4")
+
+
+def load_causal_lm(model_name, device, quantize=None, model_cls=AutoModelForCausalLM):
+    """
+    Load a causal LM for inference, optionally in low precision.
+    `quantize` defaults to $LLM_QUANTIZE (fp32 when unset). On CUDA, fp32/bf16
+    keep the previous float16 load.
+    """
+    mode = (quantize or os.getenv("LLM_QUANTIZE") or "fp32").lower()
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZE_MODES}")
+
+    # several replicas per node only pay off if they don't all grab every core
+    if os.getenv("TORCH_NUM_THREADS"):
+        torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS")))
+
+    print(f"Loading {model_name} on {device} ({mode})...")
+    kwargs = {"low_cpu_mem_usage": True}
+    if device == "cuda":
+        kwargs["torch_dtype"] = torch.float16
+    elif mode == "bf16":
+        kwargs["torch_dtype"] = torch.bfloat16
+    else:
+        kwargs["torch_dtype"] = torch.float32
+
+    if mode == "int4" or (device == "cuda" and mode == "int8"):
+        kwargs["quantization_config"] = _quantization_config(mode, device)
+        kwargs["device_map"] = device
+        model = model_cls.from_pretrained(model_name, **kwargs)
+    else:
+        model = model_cls.from_pretrained(model_name, **kwargs).to(device)
+
+    if mode == "int8" and device != "cuda":
+        # weights become int8 with per-channel scales; activations stay fp32
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    model.eval()
+    return model
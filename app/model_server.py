@@ -0,0 +1,417 @@
+# app/model_server.py
+"""
+Shared model process for multi-worker deployments.
+
+    python app/model_server.py --socket /tmp/resume-model.sock
+    MODEL_SERVER=/tmp/resume-model.sock uvicorn serve_async:app --workers 4   (from app/)
+
+One process owns the LLM (behind the continuous-batching scheduler), the
+embedder, the FAISS index and chunk store, and the per-tenant index pool
+(tenants.py). Front-end workers started with
+$MODEL_SERVER set load none of these; they talk to this process over a
+Unix socket (multiprocessing.connection), so memory no longer grows with
+the worker count and requests from every worker share one decode batch.
+
+Each connection serves one call at a time; clients keep a small pool of
+connections. Streams are cancelled with a separate "cancel" call.
+
+multiprocessing.connection unpickles what it receives, so every connection
+must pass the authkey handshake: $MODEL_SERVER_AUTHKEY if set, otherwise a
+random key the server writes to <socket>.key (mode 0600) on start and
+workers running as the same user read from there.
+"""
+import argparse
+import os
+import queue
+import secrets
+import socket
+import tempfile
+import threading
+import uuid
+from concurrent.futures import CancelledError
+from multiprocessing.connection import Client, Listener
+
+DEFAULT_SOCKET = "/tmp/resume-model.sock"
+
+# tenants.TenantPool methods callable as "tenants.<name>"
+_TENANT_OPS = ("has_tenant", "check_filters", "retrieve", "build_context", "fan_out", "stats")
+
+
+def _key_file(address):
+    return address + ".key"
+
+
+def _authkey(address):
+    """The connection authkey for `address`: $MODEL_SERVER_AUTHKEY, else the server's key file."""
+    key = os.getenv("MODEL_SERVER_AUTHKEY")
+    if key:
+        return key.encode()
+    try:
+        with open(_key_file(address), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise ConnectionRefusedError(
+            f"no model server key at {_key_file(address)} (is the server running?); "
+            "set MODEL_SERVER_AUTHKEY to use a shared key instead") from None
+
+
+def _new_authkey(address):
+    """The server's authkey: $MODEL_SERVER_AUTHKEY, else a fresh random key written to the key file."""
+    key = os.getenv("MODEL_SERVER_AUTHKEY")
+    if key:
+        return key.encode()
+    key = secrets.token_hex(32).encode()
+    # mkstemp creates the file 0600; the rename makes it appear complete
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(address)), prefix=".model-key-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        os.replace(tmp, _key_file(address))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return key
+
+
+def _listening(address):
+    """True if a server accepts connections on the Unix socket `address`."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(address)
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    finally:
+        probe.close()
+
+
+# -------------------
+# Server
+# -------------------
+class ModelServer:
+    """Serves scheduler / retriever / context builder / embedder / tenant pool calls on a Unix socket."""
+
+    def __init__(self, scheduler, retriever, context_builder, embedder, tenants=None):
+        self.scheduler = scheduler
+        self.retriever = retriever
+        self.context_builder = context_builder
+        self.embedder = embedder
+        self.tenants = tenants
+        self._streams = {}
+        self._cancelled = set()  # cancels that arrived before their stream started
+        self._streams_lock = threading.Lock()
+
+    def serve(self, address=DEFAULT_SOCKET, ready=None):
+        if os.path.exists(address):
+            if _listening(address):
+                raise RuntimeError(f"another model server is already listening on {address}")
+            os.remove(address)  # stale socket from a previous run
+        with Listener(address, family="AF_UNIX", authkey=_new_authkey(address)) as listener:
+            print(f"Model server listening on {address}")
+            if ready is not None:
+                ready.set()
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # failed handshake; keep serving the rest
+                    print("Model server: rejected connection:", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), name="model-conn", daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "stream":
+                        self._stream(conn, *args, **kwargs)
+                        continue
+                    conn.send(("ok", self._call(op, args, kwargs)))
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                except Exception as e:
+                    conn.send(("err", type(e).__name__, str(e)))
+
+    def _call(self, op, args, kwargs):
+        if op == "generate":
+            return self.scheduler.generate(*args, **kwargs)
+        if op == "cancel":
+            with self._streams_lock:
+                streamer = self._streams.get(args[0])
+                if streamer is None:
+                    if len(self._cancelled) > 1024:
+                        self._cancelled.clear()
+                    self._cancelled.add(args[0])
+            if streamer is not None:
+                streamer.close()
+            return None
+        if op == "encode":
+            return self.embedder.encode(*args, **kwargs)
+        if op == "retrieve":
+            return self.retriever.retrieve(*args, **kwargs)
+        if op == "check_filters":
+            return self.retriever.check_filters(*args, **kwargs)
+        if op == "build_context":
+            return self.context_builder.build(*args, **kwargs)
+        if op.startswith("tenants.") and op[len("tenants."):] in _TENANT_OPS:
+            return getattr(self.tenants, op[len("tenants."):])(*args, **kwargs)
+        if op == "budget_for":
+            return self.context_builder.budget_for(*args, **kwargs)
+        if op == "queue_depth":
+            return self.scheduler.queue_depth
+        if op == "metrics":
+            return self.scheduler.metrics()
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"unknown op {op!r}")
+
+    def _stream(self, conn, stream_id, prompt, **kwargs):
+        streamer = self.scheduler.stream(prompt, **kwargs)
+        with self._streams_lock:
+            self._streams[stream_id] = streamer
+            if stream_id in self._cancelled:
+                self._cancelled.discard(stream_id)
+                streamer.close()
+        try:
+            for delta in streamer:
+                conn.send(("delta", delta))
+            conn.send(("end", None))
+        except (BrokenPipeError, ConnectionResetError):
+            streamer.close()  # worker died mid-stream: stop decoding for it
+            raise
+        except CancelledError:
+            conn.send(("err", "CancelledError", "cancelled"))
+        except Exception as e:
+            conn.send(("err", type(e).__name__, str(e)))
+        finally:
+            with self._streams_lock:
+                self._streams.pop(stream_id, None)
+
+
+# -------------------
+# Client side (used by front-end workers)
+# -------------------
+class RemoteError(RuntimeError):
+    pass
+
+
+def _raise(kind, message):
+    if kind == "CancelledError":
+        raise CancelledError(message)
+    if kind == "ValueError":  # bad request arguments (e.g. retrieval filters)
+        raise ValueError(message)
+    if kind == "UnknownTenant":
+        from tenants import UnknownTenant
+        raise UnknownTenant(message)
+    raise RemoteError(f"{kind}: {message}")
+
+
+class ModelClient:
+    """
+    Thread-safe client: each in-flight call borrows a pooled connection.
+    Exposes drop-in stand-ins for the objects a worker would otherwise
+    build locally: .scheduler, .retriever, .context_builder, .embedder.
+    """
+
+    def __init__(self, address=DEFAULT_SOCKET, max_idle=16):
+        self.address = address
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self.scheduler = _RemoteScheduler(self)
+        self.retriever = _RemoteRetriever(self)
+        self.context_builder = _RemoteContextBuilder(self)
+        self.tenants = _RemoteTenantPool(self)
+        self.embedder = _RemoteEmbedder(self)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.address, family="AF_UNIX", authkey=_authkey(self.address))
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, op, *args, **kwargs):
+        conn = self._acquire()
+        try:
+            conn.send((op, args, kwargs))
+            reply = conn.recv()
+        except BaseException:
+            conn.close()  # state unknown: never reuse
+            raise
+        self._release(conn)
+        if reply[0] == "err":
+            _raise(*reply[1:])
+        return reply[1]
+
+    def ping(self):
+        return self.call("ping")
+
+
+class _RemoteStream:
+    """TokenStreamer stand-in: iterate for deltas, close() to cancel."""
+
+    def __init__(self, client, prompt, kwargs):
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self._finished = False
+        self._started = False
+        self._conn = client._acquire()
+        self._conn.send(("stream", (self.id, prompt), kwargs))
+
+    def __iter__(self):
+        self._started = True
+        conn, clean = self._conn, False
+        try:
+            while True:
+                reply = conn.recv()
+                if reply[0] == "delta":
+                    yield reply[1]
+                    continue
+                self._finished = clean = True
+                if reply[0] == "err":
+                    _raise(*reply[1:])
+                return
+        finally:
+            # abandoned mid-stream, the connection still has replies queued
+            if clean:
+                self.client._release(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        if not self._finished:
+            self.client.call("cancel", self.id)
+            if not self._started:
+                self._conn.close()
+
+
+class _RemoteScheduler:
+    def __init__(self, client):
+        self.client = client
+
+    def generate(self, prompt, **kwargs):
+        return self.client.call("generate", prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        return _RemoteStream(self.client, prompt, kwargs)
+
+    @property
+    def queue_depth(self):
+        return self.client.call("queue_depth")
+
+    def metrics(self):
+        return self.client.call("metrics")
+
+
+class _RemoteRetriever:
+    def __init__(self, client):
+        self.client = client
+
+    def retrieve(self, query, k=3, filters=None):
+        return self.client.call("retrieve", query, k, filters)
+
+    def check_filters(self, filters):
+        return self.client.call("check_filters", filters)
+
+
+class _RemoteContextBuilder:
+    def __init__(self, client):
+        self.client = client
+
+    def build(self, query, budget_tokens, filters=None):
+        return self.client.call("build_context", query, budget_tokens, filters)
+
+    def budget_for(self, prompt_template, max_input_tokens, reserve=8):
+        return self.client.call("budget_for", prompt_template, max_input_tokens, reserve)
+
+
+class _RemoteTenantPool:
+    """tenants.TenantPool's query methods; the tenants' indexes live in the server."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def has_tenant(self, tenant_id):
+        return self.client.call("tenants.has_tenant", tenant_id)
+
+    def check_filters(self, tenant_id, filters):
+        return self.client.call("tenants.check_filters", tenant_id, filters)
+
+    def retrieve(self, tenant_id, query, k=3, filters=None):
+        return self.client.call("tenants.retrieve", tenant_id, query, k, filters)
+
+    def build_context(self, tenant_ids, query, budget_tokens, filters=None):
+        return self.client.call("tenants.build_context", tenant_ids, query, budget_tokens, filters)
+
+    def fan_out(self, query, k=3, tenant_ids=None, filters=None):
+        return self.client.call("tenants.fan_out", query, k, tenant_ids, filters)
+
+    def stats(self):
+        return self.client.call("tenants.stats")
+
+
+class _RemoteEmbedder:
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, texts, **kwargs):
+        return self.client.call("encode", texts, **kwargs)
+
+
+# -------------------
+# Entry point
+# -------------------
+def load_components(model_name, models_dir="models"):
+    """Load the model, scheduler, retrieval stack and embedder exactly as app.py does in-process."""
+    import torch
+    from transformers import AutoTokenizer
+
+    from context_builder import ContextBuilder
+    from embedder import get_embedder
+    from generation import GenerationScheduler
+    from model_loader import load_causal_lm
+    from prefix_cache import PrefixCache
+    from resume_sections import RESUME_SECTIONS
+    from retrieval import load_retriever
+    from tenants import TenantPool
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = load_causal_lm(model_name, device)
+    draft_name = os.getenv("DRAFT_MODEL_NAME")
+    scheduler = GenerationScheduler(
+        model, tokenizer, device,
+        max_batch_size=int(os.getenv("GENERATION_MAX_BATCH", "8")),
+        prefix_cache=PrefixCache(max_entries=int(os.getenv("PREFIX_CACHE_SIZE", "4"))),
+        draft_model=load_causal_lm(draft_name, device) if draft_name else None,
+        num_draft_tokens=int(os.getenv("DRAFT_NUM_TOKENS", "4")),
+        speculative_max_active=int(os.getenv("SPECULATIVE_MAX_ACTIVE", "1")),
+    )
+    retriever = load_retriever(models_dir, fallback_corpus=RESUME_SECTIONS)
+    fetch_k = int(os.getenv("RETRIEVAL_FETCH_K", "12"))
+    context_builder = ContextBuilder(retriever, tokenizer, fetch_k=fetch_k)
+    tenants = TenantPool(os.getenv("TENANTS_DIR", os.path.join(models_dir, "tenants")), tokenizer=tokenizer,
+                         fetch_k=fetch_k)
+    return scheduler, retriever, context_builder, get_embedder(), tenants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.getenv("MODEL_SERVER", DEFAULT_SOCKET))
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "meta-llama/Llama-2-7b-chat-hf"))
+    parser.add_argument("--models-dir", default="models")
+    args = parser.parse_args()
+    ModelServer(*load_components(args.model, args.models_dir)).serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
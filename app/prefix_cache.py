@@ -0,0 +1,52 @@
+# app/prefix_cache.py
+import threading
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """
+    past_key_values for prompt prefixes, keyed by their token ids.
+
+    Pinned entries (the static instruction preamble) are never evicted;
+    everything else (preamble + retrieved context) lives in a small LRU.
+    Entries are legacy (key, value) tuples with batch size 1.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pinned = {}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            past = self._pinned.get(key)
+            if past is None:
+                past = self._lru.get(key)
+                if past is not None:
+                    self._lru.move_to_end(key)
+            if past is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return past
+
+    def put(self, key, past, pinned=False):
+        with self._lock:
+            if pinned:
+                self._pinned[key] = past
+                return
+            self._lru[key] = past
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pinned.clear()
+            self._lru.clear()
+
+    def __len__(self):
+        return len(self._pinned) + len(self._lru)
@@ -0,0 +1,58 @@
+# app/prompting.py
+# The prompt, generation settings and answer clean-up shared by app.py
+# (/ask, /ask/stream) and batch_qa.py, so evaluation runs answer exactly as
+# serving does (questions containing PII get POLICY_REFUSAL in both)
+POLICY_REFUSAL = "I'm sorry, I cannot share personal phone numbers or private email addresses. Please use the Contact form on this page to reach out."
+
+# shared by the blocking and streaming paths
+GENERATION_KWARGS = dict(
+    max_input_tokens=1024,
+    max_new_tokens=300,       # bigger to avoid truncation mid-sentence
+    top_p=0.9,
+    do_sample=False,        # deterministic completion reduces odd repeats
+)
+
+
+def build_prompt(question: str, context: str = ""):
+    """
+    Return (prompt, context_prefix); the prefix's KV cache is reused across questions.
+    With an empty context this is the skeleton to budget context tokens against.
+    """
+    # Use a plain chat-style prompt (no weird token markup needed)
+    # NOTE: we intentionally avoid complex role tokens so the causal LM doesn't echo them back verbatim.
+    context_prefix = f"Resume context:\n{context}\n\n"
+    prompt = (
+        f"{context_prefix}"
+        f"User question: {question}\n\n"
+        f"Answer:"
+    )
+    return prompt, context_prefix
+
+
+def clean_model_output(resp: str, prompt: str) -> str:
+    """
+    Robustly remove any echo from the model's continuation and return only the assistant's answer.
+    The scheduler already strips the prompt tokens, so this only handles echoes:
+    1) If model outputs an explicit assistant marker like '<|assistant|>' use that.
+    2) If the model repeated the prompt, drop everything up to and including it.
+    3) If the model re-emitted an 'Answer:' label, drop everything up to it.
+    """
+    if not resp:
+        return ""
+
+    # attempt to find explicit assistant marker
+    if "<|assistant|>" in resp:
+        return resp.split("<|assistant|>")[-1].strip()
+
+    # attempt to remove an echoed prompt
+    idx = resp.find(prompt)
+    if idx != -1:
+        return resp[idx + len(prompt):].strip()
+
+    # remove everything up to the last occurrence of "Answer:" (case-insensitive)
+    lower = resp.lower()
+    if "answer:" in lower:
+        pos = lower.rfind("answer:")
+        return resp[pos + len("answer:"):].strip()
+
+    return resp.strip()
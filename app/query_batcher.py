@@ -0,0 +1,137 @@
+# app/query_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+from embedder import get_embedder
+from index_factory import filtered_search
+
+_STOP = object()  # queued by close()
+
+
+class QueryBatcher:
+    """
+    Micro-batches concurrent retrieval queries.
+
+    Callers block in search(); a background thread collects queries for up to
+    `max_wait_ms` (or until `max_batch_size` are waiting), encodes them with a
+    single encode() call, runs one index.search() over the stacked matrix and
+    hands each caller back its own row of results. Filtered queries share
+    the encode() call; each distinct filter gets one restricted search.
+    A query may also be an already encoded vector (tenants.TenantPool
+    encodes a fanned-out query once for every shard).
+    """
+
+    def __init__(self, index, max_batch_size=32, max_wait_ms=5, encode_kwargs=None):
+        self.index = index
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.encode_kwargs = encode_kwargs or {}
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query, k=3, id_filter=None):
+        """Queue `query` and return a Future resolving to (scores, ids) for it."""
+        if self._closed:
+            raise RuntimeError("QueryBatcher is closed")
+        future = Future()
+        # the worker attributes its encode/search time to the caller's request trace
+        future.trace = metrics.current_trace()
+        future.id_filter = id_filter
+        self._queue.put((query, k, future))
+        return future
+
+    def search(self, query, k=3, id_filter=None):
+        """
+        Blocking helper: return (scores, ids) arrays of length <= k for
+        `query`, restricted to `id_filter` (index_factory.IDFilter) if given.
+        """
+        return self.submit(query, k, id_filter).result()
+
+    def close(self):
+        """Stop the worker once the queries already queued are answered."""
+        self._closed = True
+        self._queue.put(_STOP)
+
+    # -------------------
+    # Worker
+    # -------------------
+    def _collect(self):
+        """(batch, stop): up to max_batch_size queries, and whether close() was called."""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _encode(self, queries):
+        texts = [q for q in queries if isinstance(q, str)]
+        if len(texts) == len(queries):
+            return np.asarray(get_embedder().encode(queries, **self.encode_kwargs), dtype="float32")
+        encoded = iter(np.asarray(get_embedder().encode(texts, **self.encode_kwargs), dtype="float32")
+                       if texts else ())
+        return np.stack([next(encoded) if isinstance(q, str) else np.asarray(q, dtype="float32").ravel()
+                         for q in queries])
+
+    @staticmethod
+    def _observe(batch, embed_s, search_s):
+        metrics.observe("embed", embed_s)
+        metrics.observe("faiss_search", search_s)
+        for _, _, future in batch:
+            if future.trace is not None:
+                future.trace.add("embed", embed_s)
+                future.trace.add("faiss_search", search_s)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            # skip callers that gave up before we got to them
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                queries = [q for q, _, _ in batch]
+                t0 = time.perf_counter()
+                embs = self._encode(queries)
+                t1 = time.perf_counter()
+                # one search per distinct filter (None: the unfiltered rows)
+                groups = {}
+                for row, (_, _, future) in enumerate(batch):
+                    groups.setdefault(id(future.id_filter), []).append(row)
+                results = [None] * len(batch)
+                for rows in groups.values():
+                    id_filter = batch[rows[0]][2].id_filter
+                    k = max(batch[row][1] for row in rows)
+                    if id_filter is None:
+                        D, I = self.index.search(embs[rows], k)
+                    else:
+                        D, I = filtered_search(self.index, embs[rows], k, id_filter)
+                    for i, row in enumerate(rows):
+                        results[row] = (D[i], I[i])
+                t2 = time.perf_counter()
+                self._observe(batch, t1 - t0, t2 - t1)
+                for (_, k, future), (D, I) in zip(batch, results):
+                    future.set_result((D[:k], I[:k]))
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
@@ -0,0 +1,165 @@
+# app/redaction.py
+"""
+One PII redaction engine for ingestion (build_index.clean_context),
+request screening (contains_pii) and output scrubbing (redact /
+StreamRedactor).
+
+Each profile applies all of its rules in a single regex scan instead of
+one re.sub pass per rule. The scan patterns are the rules joined into one
+alternation, rearranged so that the whole pattern starts with a character
+class: re's C search loop can then skip every position that cannot start
+a match without entering the pattern at all, which is most of the text.
+"""
+import re
+
+REDACTED = "[redacted]"
+
+# The rules, in priority order. These are the patterns app.py and
+# build_index.py used to apply one after another; a phone number followed
+# in the same token by "@x" is left to the email rule, as it was when the
+# email pass ran first.
+#
+# OUTPUT gives the same result as those passes. INDEX does not always: one
+# scan takes the leftmost match at each point and never looks at its own
+# output, while the passes ran rule by rule, each over what the previous
+# ones left. Where matches of different rules overlap, the scan removes
+# more: "github.comhttp7(" loses the whole link, where the passes took
+# "http7(" first and left a bare "github.com". Where a deletion joins text
+# into a new match, the passes removed more: "555http) 5551234567555"
+# became "567555" instead of "555 555".
+EMAIL = r'\S+@\S+'
+PHONE = r'\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b(?!\S*@\S)'
+# index-time cleaning has always been looser: optional (area code), no word boundaries
+LOOSE_PHONE = r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}(?!\S*@\S)'
+URL = r'http\S+'
+LINKEDIN = r'linkedin\.com\S+'
+GITHUB = r'github\.com\S+'
+
+_NUMBER_TAIL = r'[-.\s]?\d{3}[-.\s]?\d{4}(?!\S*@\S)'
+
+# Scan patterns, run over " " + text. The first character is consumed by a
+# class and the alternatives check it with a lookbehind; group 1 holds a
+# character that is not PII and is put back by the replacement. An email
+# always spans a whole whitespace-delimited token, so it is matched from the
+# whitespace before it; a word-bounded phone number from the non-word
+# character before it.
+_OUTPUT_SCAN = r'(\W)(?:(?<=\s)\S+@\S+|\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b(?!\S*@\S))'
+_INDEX_SCAN = (
+    r'[\s\d(hlg](?:'
+    r'(?<=(\s))\S+@\S+'
+    r'|(?<=h)ttp\S+'
+    r'|(?<=l)inkedin\.com\S+'
+    r'|(?<=g)ithub\.com\S+'
+    r'|(?<=\()\d{3}\)?' + _NUMBER_TAIL +
+    r'|(?<=\d)\d\d\)?' + _NUMBER_TAIL +
+    r')'
+)
+
+
+class Redactor:
+    """
+    A redaction profile: named rules plus the single-scan pattern that
+    applies them. `scan` must match exactly what the rules would, joined
+    into one alternation with the earlier rule winning at a position.
+    """
+
+    def __init__(self, rules, scan, replacement=REDACTED):
+        self.rules = [(name, re.compile(pattern)) for name, pattern in rules]
+        self.scan = re.compile(scan)
+        self.replacement = replacement
+        self._template = r"\1" + replacement.replace("\\", r"\\")
+
+    def sub(self, text):
+        """`text` with every match replaced."""
+        return self.scan.sub(self._template, " " + text)[1:]
+
+    def contains(self, text):
+        return self.scan.search(" " + text) is not None
+
+    def _bounds(self, text):
+        # (start, end) in `text`: drop the sentinel and the kept character
+        for m in self.scan.finditer(" " + text):
+            yield (m.end(1) if m.start(1) != -1 else m.start()) - 1, m.end() - 1
+
+    def spans(self, text):
+        """Yield (start, end, rule name) for each match, left to right."""
+        for start, end in self._bounds(text):
+            yield start, end, self.kind(text[start:end])
+
+    def search(self, text):
+        """The first (start, end, rule name), or None."""
+        return next(self.spans(text), None)
+
+    def kind(self, fragment):
+        """Name of the rule a matched fragment came from."""
+        for name, regex in self.rules:
+            if regex.fullmatch(fragment):
+                return name
+        return None
+
+
+# request screening + model output: emails and phone numbers -> [redacted]
+OUTPUT = Redactor([("email", EMAIL), ("phone", PHONE)], _OUTPUT_SCAN)
+
+# ingestion: contact details and profile links dropped from the indexed text
+INDEX = Redactor(
+    [("email", EMAIL), ("url", URL), ("linkedin", LINKEDIN), ("github", GITHUB), ("phone", LOOSE_PHONE)],
+    _INDEX_SCAN,
+    replacement="",
+)
+
+# a phone number spans at most three whitespace-separated tokens ("555 123 4567")
+_HOLDBACK_TOKENS = 3
+_HELD_TAIL = re.compile(r'(?<!\S)\S+(?:\s+\S+){%d}\s*\Z' % (_HOLDBACK_TOKENS - 1))
+
+
+def contains_pii(text):
+    """True if `text` has an email address or phone number (request screening)."""
+    return OUTPUT.contains(text or "")
+
+
+def redact(text):
+    """Replace emails and phone numbers in `text` with [redacted]."""
+    return OUTPUT.sub(text)
+
+
+class StreamRedactor:
+    """
+    Incremental redact() over streamed text deltas.
+
+    Text is released only once no email/phone match could still grow into
+    it: the last few tokens stay buffered until more text (or the end of
+    the stream) arrives, so a number split across deltas is still caught.
+    """
+
+    def __init__(self, redactor=OUTPUT):
+        self.redactor = redactor
+        self._buffer = ""
+
+    def _safe_cut(self):
+        tail = _HELD_TAIL.search(self._buffer)
+        if tail is None:
+            return 0
+        cut = tail.start()
+        # never split a match that is already complete but straddles the cut
+        for start, end in self.redactor._bounds(self._buffer):
+            if end <= cut:
+                continue
+            if start < cut:
+                cut = start
+            break
+        return cut
+
+    def feed(self, delta):
+        """Add `delta` and return whatever redacted text is now final (maybe '')."""
+        self._buffer += delta
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self.redactor.sub(ready)
+
+    def flush(self):
+        """Return the redacted remainder at the end of the stream."""
+        ready, self._buffer = self._buffer, ""
+        return self.redactor.sub(ready)
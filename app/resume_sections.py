@@ -0,0 +1,11 @@
+# app/resume_sections.py
+# Built-in retrieval corpus for when no index has been built under models/
+# (shared by app.py and model_server.py)
+RESUME_SECTIONS = [
+    "Professional Experience: 4+ years at Bank of America, Brillio, Accenture, and Sheetz. Led automation tools for derivative trading, scaled operations from 700 to 1300 stores, developed microservices handling $50M+ daily volume.",
+    "Technical Skills: Java, Python, Spring Boot, Kafka, Kubernetes, AWS, GCP, Azure, Docker, ReactJS, MongoDB, Redis. Expert in distributed systems and microservices architecture.",
+    "Key Projects: Event syndicator for Sheetz scaling to 1300 stores, automation tools for Merrill Lynch trading, SOAP to REST migration at Brillio, real-time data processing with Kafka and Samza.",
+    "Education: Master of Software Engineering from Carnegie Mellon University (2024), Bachelor of Computer Science from Kalinga Institute of Industrial Technology (2020).",
+    "Awards: Silver Award from Bank of America (Q1 2023), Top 4 in Accenture x Salesforce Hackathon (2021).",
+    "Ameesha Priya is a Backend-focused Software Engineer with 4+ years architecting distributed systems across finance, healthcare, and e-commerce. Expert in Java, Kafka, Spring Boot, and Kubernetes on AWS/GCP/Azure.",
+]
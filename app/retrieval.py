@@ -0,0 +1,320 @@
+# app/retrieval.py
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+import metrics
+from chunk_meta import ChunkMetadata, filter_key
+from chunk_store import load_chunks, has_chunk_store, read_index
+from index_factory import IDFilter
+
+# Precomputed BM25 term statistics, stored next to the chunk store and
+# rewritten whenever build_index.py / ingest.py rewrite the chunks
+BM25_FILE = "bm25.npz"
+
+TOKEN_REGEX = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOPWORDS = frozenset(
+    "a about an and are as at be by can did do does for from had has have her his how i in is it its me "
+    "my of on or she should tell than that the their them they this to was were what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens minus stopwords ("C++", "C#" and "S3" survive intact)."""
+    return [t for t in TOKEN_REGEX.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index over chunk rows with Okapi BM25 scoring. Postings are kept
+    as CSR arrays (term -> rows, term frequencies), so a query only touches
+    the postings of its own terms.
+    """
+
+    def __init__(self, vocab, term_ptr, post_rows, post_tfs, doc_lens, k1=1.2, b=0.75):
+        self.terms = {term: i for i, term in enumerate(vocab)}
+        self.vocab = np.asarray(vocab)
+        self.term_ptr = term_ptr
+        self.post_rows = post_rows
+        self.post_tfs = post_tfs
+        self.doc_lens = doc_lens
+        self.k1, self.b = k1, b
+        n = len(doc_lens)
+        self.avgdl = float(doc_lens.mean()) if n else 0.0
+        df = np.diff(term_ptr).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, texts, **kwargs):
+        terms, term_ids, rows, tfs, doc_lens = {}, [], [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens.append(len(tokens))
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                term_ids.append(terms.setdefault(tok, len(terms)))
+                rows.append(row)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")  # rows stay ascending within a term
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_ptr[1:] = np.cumsum(np.bincount(term_ids, minlength=len(terms)))
+        return cls(
+            list(terms),
+            term_ptr,
+            np.asarray(rows, dtype=np.int64)[order],
+            np.asarray(tfs, dtype=np.float32)[order],
+            np.asarray(doc_lens, dtype=np.float32),
+            **kwargs,
+        )
+
+    def save(self, path, signature=()):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, vocab=self.vocab.astype(str), term_ptr=self.term_ptr, post_rows=self.post_rows,
+                 post_tfs=self.post_tfs, doc_lens=self.doc_lens, signature=np.asarray(signature, dtype=np.int64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, signature=None, **kwargs):
+        """Load a saved index; None if missing or built for a different chunk store."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if signature is not None and tuple(data["signature"].tolist()) != tuple(signature):
+                return None
+            return cls(data["vocab"].tolist(), data["term_ptr"], data["post_rows"], data["post_tfs"],
+                       data["doc_lens"], **kwargs)
+
+    def has_all(self, terms):
+        return bool(terms) and all(t in self.terms for t in terms)
+
+    def search(self, terms, k, mask=None):
+        """
+        Top-k (rows, scores) for query `terms`, best first; only rows
+        containing a term, and with a boolean row `mask` only rows it allows.
+        """
+        row_parts, score_parts = [], []
+        for term in set(terms):
+            tid = self.terms.get(term)
+            if tid is None:
+                continue
+            start, end = self.term_ptr[tid], self.term_ptr[tid + 1]
+            rows, tf = self.post_rows[start:end], self.post_tfs[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[rows] / self.avgdl)
+            row_parts.append(rows)
+            score_parts.append(self.idf[tid] * tf * (self.k1 + 1) / (tf + norm))
+        if not row_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        if mask is not None:
+            allowed = mask[rows]
+            rows, scores = rows[allowed], scores[allowed]
+        top = np.argsort(-scores, kind="stable")[:k]
+        return rows[top], scores[top].astype(np.float32)
+
+
+def store_signature(chunks):
+    """Cheap fingerprint tying a saved BM25 index to one chunk store build."""
+    if hasattr(chunks, "offsets"):
+        return (len(chunks), int(chunks.offsets[-1]))
+    return None
+
+
+def load_bm25(chunks, dirpath=None):
+    """Saved BM25 statistics for `chunks` when they match, else build them in memory."""
+    signature = store_signature(chunks)
+    if dirpath and signature is not None:
+        bm25 = BM25Index.load(os.path.join(dirpath, BM25_FILE), signature)
+        if bm25 is not None:
+            return bm25
+    return BM25Index.build(chunks)
+
+
+def save_bm25(chunks, dirpath):
+    """Build and store BM25 statistics for the chunk store just written to `dirpath`."""
+    bm25 = BM25Index.build(chunks)
+    bm25.save(os.path.join(dirpath, BM25_FILE), store_signature(chunks) or ())
+    return bm25
+
+
+def rrf_fuse(rankings, rrf_k=60):
+    """Reciprocal rank fusion of ranked key lists: [(key, score)], best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+class HybridRetriever:
+    """
+    BM25 + dense retrieval fused with reciprocal rank fusion (RRF).
+
+    Short queries whose terms all occur in the corpus ("Kafka", "Samza
+    experience") are answered from BM25 alone, without an embedding call.
+    Everything else searches both and fuses the two rankings.
+
+    `filters` (see chunk_meta.ChunkMetadata.mask) restrict both halves
+    before ranking: BM25 drops disallowed rows before its top-k, and FAISS
+    gets the allowed ids as a selector, so a selective filter still yields
+    a full k. Compiled filters are cached per distinct filter.
+    """
+
+    def __init__(self, chunks, dense_search=None, bm25=None, rrf_k=60, candidates=20, lexical_max_terms=2,
+                 filter_cache_size=64):
+        self.chunks = chunks
+        self.dense_search = dense_search  # query, k, id_filter=None -> (scores, faiss ids)
+        self.bm25 = bm25 if bm25 is not None else BM25Index.build(chunks)
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.lexical_max_terms = lexical_max_terms
+        self._meta = None
+        self._filters = OrderedDict()  # filter key -> (row mask, IDFilter)
+        self._filter_cache_size = filter_cache_size
+        self._filter_lock = threading.Lock()
+
+    @property
+    def meta(self):
+        """chunk_meta.ChunkMetadata for the chunks, loaded on first use."""
+        if self._meta is None:
+            self._meta = ChunkMetadata.for_chunks(self.chunks)
+        return self._meta
+
+    def compile_filter(self, filters):
+        """(row mask, IDFilter) for `filters`, or None when they filter nothing; ValueError if invalid."""
+        key = filter_key(filters)
+        if key is None:
+            return None
+        with self._filter_lock:
+            hit = self._filters.get(key)
+            if hit is not None:
+                self._filters.move_to_end(key)
+                return hit
+        mask = self.meta.mask(**dict(key))
+        if mask is None:
+            return None
+        rows = np.flatnonzero(mask)
+        ids = self.chunks.ids[rows] if getattr(self.chunks, "ids", None) is not None else rows
+        compiled = (mask, IDFilter(ids))
+        with self._filter_lock:
+            self._filters[key] = compiled
+            if len(self._filters) > self._filter_cache_size:
+                self._filters.popitem(last=False)
+        return compiled
+
+    def check_filters(self, filters):
+        """Raise ValueError if `filters` cannot apply to this index (e.g. a doc filter without doc metadata)."""
+        self.compile_filter(filters)
+
+    def _rows_for_ids(self, ids):
+        if hasattr(self.chunks, "rows_for_ids"):
+            return self.chunks.rows_for_ids(ids)
+        return np.asarray(ids, dtype=np.int64)
+
+    def rankings(self, query, k=3, filters=None, query_vector=None):
+        """
+        The two rankings search() fuses, as (lexical, dense) lists of
+        (row, score): BM25 scores, and inner products with the query
+        embedding (cosine; None when BM25 alone answers the query).
+        `query_vector` skips encoding the query (tenants fan-out).
+        """
+        with metrics.stage("filter"):
+            compiled = self.compile_filter(filters)
+        mask, id_filter = compiled if compiled is not None else (None, None)
+        if id_filter is not None and not len(id_filter):
+            return [], []
+
+        with metrics.stage("bm25"):
+            terms = tokenize(query or "")
+            depth = max(k, self.candidates)
+            lex_rows, lex_scores = self.bm25.search(terms, depth, mask)
+        lexical = list(zip(lex_rows.tolist(), lex_scores.tolist()))
+
+        # a filter can leave BM25 without a full k even when every term exists
+        lexical_only = (len(terms) <= self.lexical_max_terms and self.bm25.has_all(terms)
+                        and (mask is None or len(lex_rows) >= k))
+        if self.dense_search is None or lexical_only:
+            return lexical, None
+
+        with metrics.stage("dense_search"):  # embedding + FAISS (see QueryBatcher for the split)
+            q = query if query_vector is None else query_vector
+            if id_filter is None:
+                scores, ids = self.dense_search(q, depth)
+            else:
+                scores, ids = self.dense_search(q, depth, id_filter=id_filter)
+        dense = [(row, score) for row, score in zip(self._rows_for_ids(ids).tolist(), scores.tolist()) if row != -1]
+        return lexical, dense
+
+    def search(self, query, k=3, filters=None):
+        """Return [(row, score)] for the top-k chunks, best first."""
+        lexical, dense = self.rankings(query, k, filters)
+        if dense is None:
+            return lexical[:k]
+        return rrf_fuse([[row for row, _ in lexical], [row for row, _ in dense]], self.rrf_k)[:k]
+
+    def retrieve(self, query, k=3, filters=None):
+        """Chunk texts for the top-k hits."""
+        return [self.chunks[row] for row, _ in self.search(query, k, filters)]
+
+
+def in_memory_dense(texts):
+    """Dense search over a small in-memory corpus (no prebuilt index on disk)."""
+    from embedder import encode
+    from index_factory import filtered_search
+
+    state = {}
+
+    def search(query, k, id_filter=None):
+        if "index" not in state:
+            embs = np.asarray(encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+            state["index"] = faiss.IndexFlatIP(embs.shape[1])
+            state["index"].add(embs)
+        if isinstance(query, str):
+            q = np.asarray(encode([query], normalize_embeddings=True), dtype=np.float32)
+        else:
+            q = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        if id_filter is None:
+            D, I = state["index"].search(q, min(k, len(texts)))
+        else:  # ids are row numbers here
+            D, I = filtered_search(state["index"], q, min(k, len(id_filter)), id_filter)
+        return D[0], I[0]
+
+    return search
+
+
+def load_retriever(models_dir="models", fallback_corpus=None, **kwargs):
+    """
+    Hybrid retriever over the chunk store + FAISS index in `models_dir`, or
+    over `fallback_corpus` (a list of strings) when no index has been built.
+    """
+    index_path = os.path.join(models_dir, "resume.index")
+    if has_chunk_store(models_dir) and os.path.exists(index_path):
+        from index_factory import set_search_params
+        from query_batcher import QueryBatcher
+
+        chunks = load_chunks(models_dir)
+        index = set_search_params(read_index(index_path))
+        batcher = QueryBatcher(
+            index,
+            max_batch_size=int(os.getenv("RETRIEVAL_MAX_BATCH", "32")),
+            max_wait_ms=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5")),
+            encode_kwargs={"normalize_embeddings": True},
+        )
+        return HybridRetriever(chunks, batcher.search, bm25=load_bm25(chunks, models_dir), **kwargs)
+    if fallback_corpus is None:
+        raise FileNotFoundError(f"No chunk store / index in {models_dir}; run build_index.py first.")
+    print(f"No index in {models_dir}; retrieving over the built-in corpus.")
+    return HybridRetriever(list(fallback_corpus), in_memory_dense(fallback_corpus), **kwargs)
@@ -0,0 +1,324 @@
+# app/serve_async.py
+"""
+ASGI front-end for the resume site.
+
+    uvicorn serve_async:app --host 0.0.0.0 --port 7860    (from app/)
+    python app/serve_async.py
+
+/ask and /ask/stream are served natively on the event loop; every other
+route (/, /download, /contact) is delegated to the Flask app unchanged.
+
+Generation runs on a dedicated thread pool feeding the shared
+GenerationScheduler. At most ASK_MAX_CONCURRENCY requests generate at once
+and at most ASK_MAX_QUEUE more wait for a slot; beyond that requests get
+429 with a Retry-After estimate. Each request has an ASK_DEADLINE_S
+deadline, and a request whose client disconnects or whose deadline passes
+is cancelled in the scheduler so it stops taking decode steps.
+
+The port binds immediately; the model loads in the background and /ask
+returns 503 until GET /readyz reports ready.
+"""
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as resume_app
+import metrics
+from tenants import UnknownTenant
+
+MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", os.getenv("GENERATION_MAX_BATCH", "8")))
+MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "32"))
+DEADLINE_S = float(os.getenv("ASK_DEADLINE_S", "120"))
+
+_DONE = object()
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"admission queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Bounded admission: `max_concurrency` slots plus a waiting room of
+    `max_queue`. Retry-After is estimated from a moving average of how long
+    a slot is held.
+    """
+
+    def __init__(self, max_concurrency, max_queue, initial_service_s=5.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._service_s = initial_service_s
+
+    def retry_after(self):
+        waves = (self.waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(waves * self._service_s))
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.monotonic() - start)
+
+
+class _CancelHandle:
+    """Carries stream_answer / generate_answer's cancel callable from the worker thread to the event loop."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancel = None
+        self.cancelled = False
+
+    def set(self, cancel):
+        with self._lock:
+            self._cancel = cancel
+            cancelled = self.cancelled
+        if cancelled:
+            cancel()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            cancel = self._cancel
+        if cancel is not None:
+            cancel()
+
+
+def _pump(msg, options, loop, queue, handle, endpoint, request_id):
+    """Worker thread: drain stream_answer() into the request's asyncio queue."""
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    with metrics.trace(endpoint, request_id):
+        deltas = resume_app.stream_answer(msg, on_start=handle.set, filters=options[0], tenant=options[1])
+        try:
+            for delta in deltas:
+                if handle.cancelled:
+                    break
+                put(delta)
+            put(_DONE)
+        except Exception as e:
+            put(e)
+        finally:
+            deltas.close()
+
+
+def _answer(msg, options, handle, request_id):
+    """Worker thread: the same generate_answer() as Flask's /ask, cancellable through `handle`."""
+    with metrics.trace("ask", request_id):
+        return resume_app.generate_answer(msg, filters=options[0], tenant=options[1], on_start=handle.set)
+
+
+class AskServer:
+    """ASGI app: native /ask + /ask/stream, everything else through Flask."""
+
+    def __init__(self, flask_app, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, deadline_s=DEADLINE_S):
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.deadline_s = deadline_s
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.admission = None  # created on the serving loop
+        # one thread per admitted request, plus headroom for cancelled ones
+        # still waiting on their last decode step
+        self.executor = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="ask")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if self.admission is None:
+            self.admission = AdmissionQueue(self.max_concurrency, self.max_queue)
+            metrics.gauge("resume_admission_active", "Requests holding a generation slot.",
+                          lambda: self.admission.active)
+            metrics.gauge("resume_admission_waiting", "Requests waiting for a slot.", lambda: self.admission.waiting)
+            metrics.scraped_counter("resume_admission_rejected_total", "Requests rejected with 429 since start.",
+                                    lambda: self.admission.rejected)
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ("/ask", "/ask/stream"):
+            if not resume_app.startup.ready:
+                # still loading (see app.startup); /healthz and /readyz go through Flask
+                return await _Response(send).json(503, {"error": "model is still loading"},
+                                                  headers=[(b"retry-after", b"5")])
+            return await self._ask(scope, receive, send, stream=scope["path"] == "/ask/stream")
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # -------------------
+    # /ask, /ask/stream
+    # -------------------
+    async def _ask(self, scope, receive, send, stream):
+        body = await _read_body(receive)
+        if body is None:
+            return  # client left before sending the body
+        resp = _Response(send)
+        try:
+            data = json.loads(body or b"{}") or {}
+            msg = data.get("msg", "")
+        except (ValueError, AttributeError):
+            return await resp.json(400, {"error": "expected a JSON body with 'msg'"})
+        try:
+            # (filters, tenant); the tenant check may go to the model server
+            options = await asyncio.get_running_loop().run_in_executor(
+                self.executor, resume_app.request_options, data, _header(scope, b"x-tenant-id"))
+        except ValueError as e:
+            return await resp.json(400, {"error": str(e)})
+        except UnknownTenant as e:
+            return await resp.json(404, {"error": str(e)})
+
+        request_id = _header(scope, b"x-request-id") or metrics.new_request_id()
+        handler = self._stream if stream else self._blocking
+        work = asyncio.ensure_future(asyncio.wait_for(handler(msg, options, resp, request_id), self.deadline_s))
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        # a disconnect cancels the handler, and with it the generation
+        for task in (work, disconnect):
+            task.cancel()
+        await asyncio.gather(work, disconnect, return_exceptions=True)
+
+        if work.cancelled() or work.exception() is None:
+            return
+        exc = work.exception()
+        if resp.started:
+            # mid-stream: headers are out, so end the event stream with an error event
+            kind = "deadline exceeded" if isinstance(exc, asyncio.TimeoutError) else "generation failed"
+            await resp.chunk(f"event: error\ndata: {json.dumps({'error': kind})}\n\n", more=False)
+        elif isinstance(exc, Overloaded):
+            await resp.json(429, {"error": "server busy, please retry"},
+                            headers=[(b"retry-after", str(exc.retry_after).encode())])
+        elif isinstance(exc, asyncio.TimeoutError):
+            await resp.json(504, {"error": "deadline exceeded"})
+        elif isinstance(exc, ValueError):  # e.g. a doc filter on an index without doc metadata
+            await resp.json(400, {"error": str(exc)})
+        else:
+            print("Error in /ask:", exc)
+            await resp.json(500, {"error": "Sorry, an error occurred generating the response."})
+
+    async def _deltas(self, msg, options, endpoint, request_id):
+        """Async iterator over answer deltas; closing it cancels generation."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        handle = _CancelHandle()
+        loop.run_in_executor(self.executor, _pump, msg, options, loop, queue, handle, endpoint, request_id)
+        finished = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE or isinstance(item, Exception):
+                    finished = True
+                    if item is _DONE:
+                        return
+                    raise item
+                yield item
+        finally:
+            if not finished:  # deadline or disconnect
+                handle.cancel()
+
+    async def _blocking(self, msg, options, resp, request_id):
+        handle = _CancelHandle()
+        async with self.admission.slot():
+            try:
+                answer = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, _answer, msg, options, handle, request_id)
+            except asyncio.CancelledError:  # deadline or disconnect
+                handle.cancel()
+                raise
+        await resp.json(200, {"answer": answer}, headers=[(b"x-request-id", request_id.encode())])
+
+    async def _stream(self, msg, options, resp, request_id):
+        async with self.admission.slot():
+            await resp.start(200, [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                                   (b"x-accel-buffering", b"no"), (b"x-request-id", request_id.encode())])
+            async for delta in self._deltas(msg, options, "ask_stream", request_id):
+                await resp.chunk(f"data: {json.dumps({'delta': delta})}\n\n")
+        await resp.chunk("event: done\ndata: {}\n\n", more=False)
+
+
+# -------------------
+# ASGI helpers
+# -------------------
+class _Response:
+    """Thin wrapper over ASGI send() that remembers whether headers went out."""
+
+    def __init__(self, send):
+        self.send = send
+        self.started = False
+
+    async def start(self, status, headers):
+        self.started = True
+        await self.send({"type": "http.response.start", "status": status, "headers": headers})
+
+    async def chunk(self, text, more=True):
+        await self.send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": more})
+
+    async def json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        await self.start(status, [(b"content-type", b"application/json"),
+                                  (b"content-length", str(len(body)).encode()), *headers])
+        await self.send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive):
+    """Full request body, or None if the client disconnected first."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+app = AskServer(resume_app.app)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("PORT", "7860"))
+    print(f"Starting async server on http://localhost:{port}")
+    # one process: the model and scheduler live in this interpreter
+    uvicorn.run(app, host="0.0.0.0", port=port, workers=1)
@@ -0,0 +1,304 @@
+# app/tenants.py
+"""
+Per-tenant indexes behind one process.
+
+    models/tenants/<tenant id>/      one models dir per resume / candidate
+        resume.index, chunks.*, embeddings.npy, bm25.npz, ...
+
+built like the single-tenant one (python app/ingest.py docs/alice --out
+models/tenants/alice). TenantPool loads a tenant's index, chunk store and
+BM25 statistics on its first request and keeps recently used tenants
+resident while their estimated footprint fits in the memory budget; the
+least recently used idle tenant is closed first. Memory then grows with
+the number of active tenants, not with the number of tenants on disk.
+
+fan_out() searches several tenants (shards) for one query, encoding it
+once, and merges their rankings into a global top-k.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+from chunk_store import has_chunk_store, load_chunks, read_index, store_file
+from embedder import get_embedder
+from index_factory import set_search_params
+from retrieval import HybridRetriever, load_bm25, rrf_fuse
+
+TENANTS_DIR = os.getenv("TENANTS_DIR", os.path.join(os.getenv("MODELS_DIR", "models"), "tenants"))
+TENANT_MEMORY_MB = float(os.getenv("TENANT_MEMORY_MB", "2048"))
+INDEX_FILE = "resume.index"
+
+# tenant ids name directories: no separators, no leading dot
+TENANT_ID_REGEX = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}")
+
+# read in full or searched on every query; chunks.blob and embeddings.npy are
+# mmap'd and only paged in for the rows a query returns
+_RESIDENT_FILES = (INDEX_FILE, "bm25.npz")
+_RESIDENT_STORE_FILES = ("chunks.offsets.npy", "chunk_ids.npy", "chunk_docs.npy", "chunk_meta.npz")
+
+
+class UnknownTenant(LookupError):
+    pass
+
+
+def check_tenant_id(tenant_id):
+    """Raise ValueError unless `tenant_id` is a valid tenant id."""
+    if not isinstance(tenant_id, str) or not TENANT_ID_REGEX.fullmatch(tenant_id):
+        raise ValueError(f"invalid tenant id {tenant_id!r}")
+    return tenant_id
+
+
+def footprint(models_dir):
+    """Estimated resident bytes of a loaded tenant: the files it reads in full or searches over."""
+    paths = [os.path.join(models_dir, name) for name in _RESIDENT_FILES]
+    paths += [store_file(models_dir, name) for name in _RESIDENT_STORE_FILES]
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+class Tenant:
+    """One loaded tenant: its retriever, context builder and the query batcher behind them."""
+
+    def __init__(self, tenant_id, models_dir, retriever, context_builder, batcher, nbytes):
+        self.tenant_id = tenant_id
+        self.models_dir = models_dir
+        self.retriever = retriever
+        self.context_builder = context_builder
+        self.batcher = batcher
+        self.nbytes = nbytes
+        self.refs = 0  # requests currently using it; only idle tenants are evicted
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+def load_tenant(tenant_id, models_dir, tokenizer=None, fetch_k=12):
+    """Load one tenant's models dir the way llama_query.py loads the single-tenant one."""
+    from context_builder import ContextBuilder
+    from query_batcher import QueryBatcher
+
+    index = set_search_params(read_index(os.path.join(models_dir, INDEX_FILE)))
+    chunks = load_chunks(models_dir)
+    batcher = QueryBatcher(
+        index,
+        max_batch_size=int(os.getenv("RETRIEVAL_MAX_BATCH", "32")),
+        max_wait_ms=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5")),
+        encode_kwargs={"normalize_embeddings": True},
+    )
+    retriever = HybridRetriever(chunks, batcher.search, bm25=load_bm25(chunks, models_dir))
+    context_builder = ContextBuilder(retriever, tokenizer, fetch_k=fetch_k) if tokenizer is not None else None
+    return Tenant(tenant_id, models_dir, retriever, context_builder, batcher, footprint(models_dir))
+
+
+class TenantPool:
+    """
+    Lazily loaded tenants under a memory budget, least recently used
+    evicted first. The budget is soft: tenants serving a request are never
+    evicted, so a burst over many tenants can exceed it until they go idle.
+    """
+
+    def __init__(self, root=TENANTS_DIR, memory_budget_mb=TENANT_MEMORY_MB, tokenizer=None, fetch_k=12,
+                 loader=load_tenant):
+        self.root = root
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.tokenizer = tokenizer
+        self.fetch_k = fetch_k
+        self.loader = loader
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+        self._tenants = OrderedDict()  # tenant id -> Tenant, least recently used first
+        self._loading = {}  # tenant id -> lock, so concurrent first requests load once
+        self._lock = threading.Lock()
+        # shards are searched concurrently, so their batching windows overlap
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv("TENANT_FAN_OUT_THREADS", "8")),
+                                            thread_name_prefix="fan-out")
+
+    # -------------------
+    # Residency
+    # -------------------
+    def tenant_dir(self, tenant_id):
+        return os.path.join(self.root, check_tenant_id(tenant_id))
+
+    def tenant_ids(self):
+        """Every tenant with a built index under `root`."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if TENANT_ID_REGEX.fullmatch(name) and self._exists(os.path.join(self.root, name)))
+
+    def has_tenant(self, tenant_id):
+        """True if `tenant_id` has a built index (resident or not)."""
+        return tenant_id in self._tenants or self._exists(self.tenant_dir(tenant_id))
+
+    @staticmethod
+    def _exists(models_dir):
+        return has_chunk_store(models_dir) and os.path.exists(os.path.join(models_dir, INDEX_FILE))
+
+    @property
+    def resident_bytes(self):
+        with self._lock:
+            return sum(t.nbytes for t in self._tenants.values())
+
+    @contextmanager
+    def acquire(self, tenant_id):
+        """Pin tenant `tenant_id` (loading it if needed) for the duration of the block."""
+        tenant = self._checkout(tenant_id)
+        try:
+            yield tenant
+        finally:
+            with self._lock:
+                tenant.refs -= 1
+                self._evict()
+
+    def _checkout(self, tenant_id):
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                tenant.refs += 1
+                self.hits += 1
+                return tenant
+            load_lock = self._loading.setdefault(tenant_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:  # another request may have loaded it meanwhile
+                tenant = self._tenants.get(tenant_id)
+                if tenant is not None:
+                    self._tenants.move_to_end(tenant_id)
+                    tenant.refs += 1
+                    self.hits += 1
+                    return tenant
+            try:
+                models_dir = self.tenant_dir(tenant_id)
+                if not self._exists(models_dir):
+                    raise UnknownTenant(f"no index for tenant {tenant_id!r} under {self.root}")
+                with metrics.stage("tenant_load"):
+                    tenant = self.loader(tenant_id, models_dir, tokenizer=self.tokenizer, fetch_k=self.fetch_k)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(tenant_id, None)
+                raise
+            with self._lock:
+                tenant.refs += 1
+                self._tenants[tenant_id] = tenant
+                self._loading.pop(tenant_id, None)
+                self.loads += 1
+                self._evict()
+        stats = self.stats()
+        print(f"Loaded tenant {tenant_id} ({tenant.nbytes / 2**20:.1f} MB; "
+              f"{stats['resident']} resident, {stats['resident_mb']} MB of {stats['budget_mb']} MB)")
+        return tenant
+
+    def _evict(self):
+        # caller holds self._lock
+        resident = sum(t.nbytes for t in self._tenants.values())
+        for tenant_id in list(self._tenants):
+            if resident <= self.memory_budget:
+                break
+            tenant = self._tenants[tenant_id]
+            if tenant.refs:
+                continue
+            del self._tenants[tenant_id]
+            tenant.close()
+            resident -= tenant.nbytes
+            self.evictions += 1
+
+    def close(self):
+        with self._lock:
+            for tenant in self._tenants.values():
+                tenant.close()
+            self._tenants.clear()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.loads
+            return {
+                "resident": len(self._tenants),
+                "resident_mb": round(sum(t.nbytes for t in self._tenants.values()) / 2**20, 1),
+                "budget_mb": round(self.memory_budget / 2**20, 1),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    # -------------------
+    # Queries
+    # -------------------
+    def retrieve(self, tenant_id, query, k=3, filters=None):
+        """Top-k chunk texts from one tenant."""
+        with self.acquire(tenant_id) as tenant:
+            return tenant.retriever.retrieve(query, k, filters)
+
+    def check_filters(self, tenant_id, filters):
+        """Raise ValueError if `filters` cannot apply to tenant `tenant_id`'s index."""
+        with self.acquire(tenant_id) as tenant:
+            tenant.retriever.check_filters(filters)
+
+    def build_context(self, tenant_ids, query, budget_tokens, filters=None):
+        """
+        Context chunks that fit in `budget_tokens`, from one tenant (a str:
+        its ContextBuilder, with MMR) or several (a list: fan_out's merged
+        hits, packed in order).
+        """
+        if isinstance(tenant_ids, str):
+            with self.acquire(tenant_ids) as tenant:
+                return tenant.context_builder.build(query, budget_tokens, filters)
+        hits = self.fan_out(query, self.fetch_k, tenant_ids, filters)
+        if not hits:
+            return []
+        with self.acquire(hits[0][0]) as tenant, metrics.stage("pack"):
+            return tenant.context_builder.pack([text for _, text, _ in hits], budget_tokens)
+
+    def fan_out(self, query, k=3, tenant_ids=None, filters=None):
+        """
+        Search several tenants (all of them by default) and merge into a
+        global top-k of (tenant id, chunk text, score). The query is
+        encoded once and the shards are searched concurrently; dense hits
+        are merged by cosine and BM25 hits by score (each shard has its own
+        IDF, the usual sharded approximation), then the two merged rankings
+        are fused as in HybridRetriever.
+        """
+        tenant_ids = self.tenant_ids() if tenant_ids is None else [check_tenant_id(t) for t in tenant_ids]
+        if not tenant_ids:
+            return []
+        with metrics.stage("embed"):
+            query_vector = np.asarray(get_embedder().encode([query or ""], normalize_embeddings=True),
+                                      dtype="float32")[0]
+
+        def search_shard(tenant_id):
+            with self.acquire(tenant_id) as tenant:
+                retriever = tenant.retriever
+                lex, den = retriever.rankings(query, k, filters, query_vector=query_vector)
+                # read texts while the shard is pinned; it may be evicted afterwards
+                texts = {row: retriever.chunks[row] for row, _ in lex + (den or [])}
+                return lex, den or [], texts, retriever.rrf_k
+
+        lexical, dense, texts = [], [], {}
+        with metrics.stage("fan_out"):
+            for tenant_id, (lex, den, shard_texts, rrf_k) in zip(tenant_ids,
+                                                                   self._executor.map(search_shard, tenant_ids)):
+                lexical.extend(((tenant_id, row), score) for row, score in lex)
+                dense.extend(((tenant_id, row), score) for row, score in den)
+                texts.update(((tenant_id, row), text) for row, text in shard_texts.items())
+
+        lexical.sort(key=lambda item: -item[1])
+        dense.sort(key=lambda item: -item[1])
+        if dense:
+            merged = rrf_fuse([[key for key, _ in lexical], [key for key, _ in dense]], rrf_k)
+        else:
+            merged = lexical
+        return [(key[0], texts[key], score) for key, score in merged[:k]]
@@ -0,0 +1,99 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+# app/ modules import each other as top-level modules (python app/app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+# importing app.py starts its background model load and mail spool; keep both offline and out of the tree
+_scratch = tempfile.mkdtemp(prefix="resume-tests-")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("MODEL_NAME", os.path.join(_scratch, "no-model"))
+os.environ.setdefault("MODELS_DIR", os.path.join(_scratch, "models"))
+os.environ.setdefault("MAIL_SPOOL_DIR", os.path.join(_scratch, "spool"))
+os.environ.pop("SENDGRID_API_KEY", None)
+os.environ.pop("MODEL_SERVER", None)
+
+
+# -------------------
+# Stand-in model
+# -------------------
+WORDS = ["</s>", "resume", "context", "user", "question", "Answer:", "Kafka", "and", "Kubernetes"]
+EOS = 0
+
+
+class StubTokenizer:
+    """Whitespace tokenizer over WORDS (unknown words map to "resume")."""
+
+    eos_token_id = EOS
+    pad_token_id = EOS
+
+    def __call__(self, text, **kwargs):
+        return {"input_ids": [WORDS.index(w) if w in WORDS else 1 for w in text.split()]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(WORDS[i] for i in ids if not (skip_special_tokens and i == EOS))
+
+
+class GatedModel:
+    """
+    Emits the words of `reply`, one per forward pass, then EOS (one request
+    at a time). Forward passes block while the gate is closed.
+    """
+
+    config = SimpleNamespace(vocab_size=len(WORDS))  # checked when used as a draft model
+
+    def __init__(self, reply="", open_gate=False):
+        self.script = [WORDS.index(w) for w in reply.split()]
+        self.calls = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        if open_gate:
+            self.gate.set()
+
+    def __call__(self, input_ids, attention_mask, position_ids, past_key_values=None, use_cache=True):
+        self.entered.set()
+        self.gate.wait()
+        token = self.script[self.calls] if self.calls < len(self.script) else EOS
+        self.calls = self.calls + 1 if token != EOS else 0
+        batch, width = input_ids.shape
+        logits = torch.zeros((batch, width, len(WORDS)))
+        logits[:, :, token] = 1.0
+        kv = torch.zeros((batch, 1, attention_mask.shape[1], 1))
+        return SimpleNamespace(logits=logits, past_key_values=((kv, kv),))
+
+
+def make_scheduler(model, **kwargs):
+    from generation import GenerationScheduler
+
+    return GenerationScheduler(model, StubTokenizer(), "cpu", **kwargs)
+
+
+@pytest.fixture
+def busy_scheduler():
+    """A scheduler whose single batch slot is held by a request stuck in prefill."""
+    model = GatedModel()
+    scheduler = make_scheduler(model, max_batch_size=1)
+    running = scheduler.submit("first question")
+    assert model.entered.wait(5)
+    yield scheduler, model, running
+    model.gate.set()
+
+
+@pytest.fixture
+def resume_app(monkeypatch, busy_scheduler):
+    """app.py with its loaded state replaced: the busy scheduler, no retrieval, no answer cache."""
+    import app as resume_app
+
+    scheduler, _, _ = busy_scheduler
+    monkeypatch.setattr(resume_app, "startup", SimpleNamespace(ready=True))
+    monkeypatch.setattr(resume_app, "scheduler", scheduler)
+    monkeypatch.setattr(resume_app, "_build_prompt", lambda msg, filters=None, tenant=None: (msg, None))
+    monkeypatch.setattr(resume_app, "_answer_cache_for", lambda tenant, filters: None)
+    return resume_app
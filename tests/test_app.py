@@ -0,0 +1,53 @@
+# tests/test_app.py
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import GatedModel, make_scheduler
+
+
+class DictCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, question):
+        return self.entries.get(question)
+
+    def put(self, question, answer):
+        self.entries[question] = answer
+
+
+@pytest.mark.parametrize("reply", ["Kafka and Kubernetes", "Answer: Kafka and Kubernetes"])
+def test_streamed_answer_matches_a_later_cache_hit(resume_app, monkeypatch, reply):
+    cache = DictCache()
+    monkeypatch.setattr(resume_app, "scheduler", make_scheduler(GatedModel(reply, open_gate=True)))
+    monkeypatch.setattr(resume_app, "_answer_cache_for", lambda tenant, filters: cache)
+
+    first = "".join(resume_app.stream_answer("skills"))
+    second = "".join(resume_app.stream_answer("skills"))
+    assert first == second == reply
+    # an echoed label would make /ask (which cleans it off) disagree, so that one is not cached
+    assert cache.get("skills") == (reply if not reply.startswith("Answer:") else None)
+
+
+def test_page_gets_a_json_error_with_retry_after_while_loading(resume_app, monkeypatch):
+    # the chat page shows this instead of reading the body as an event stream
+    monkeypatch.setattr(resume_app.startup, "ready", False)
+    res = resume_app.app.test_client().post("/ask/stream", json={"msg": "skills"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "5"
+    assert res.get_json() == {"error": "model is still loading"}
+    assert "if (!res.ok)" in resume_app.app.test_client().get("/").get_data(as_text=True)
+
+
+def test_metrics_scrape_types_totals_and_leaves_the_mailer_alone(resume_app, monkeypatch):
+    import mailer
+
+    monkeypatch.setattr(mailer, "_mailer", None)
+    monkeypatch.setattr(resume_app, "tenant_pool", SimpleNamespace(stats=lambda: {"evictions": 3}))
+    body = resume_app.app.test_client().get("/metrics").get_data(as_text=True)
+
+    assert "# TYPE resume_tenant_evictions_total counter" in body
+    assert "resume_tenant_evictions_total 3.0" in body
+    assert "resume_mail_spool_size" not in body
+    assert mailer._mailer is None
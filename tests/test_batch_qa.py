@@ -0,0 +1,43 @@
+# tests/test_batch_qa.py
+from types import SimpleNamespace
+
+from batch_qa import BatchAnswerer
+from prompting import POLICY_REFUSAL
+from conftest import GatedModel, make_scheduler
+
+
+def test_generate_records_timings_and_usage():
+    scheduler = make_scheduler(GatedModel("Kafka and Kubernetes", open_gate=True), max_batch_size=1)
+    answerer = BatchAnswerer(scheduler, SimpleNamespace(budget_for=lambda template, max_tokens: 100), None,
+                             batch_size=4)
+    bucket = [{"id": str(n), "prompt": f"user question {n}", "context_prefix": "", "retrieval_ms": 1.0}
+              for n in range(4)]
+    try:
+        records = answerer.generate(bucket)
+    finally:
+        answerer.close()
+
+    for record in records:
+        assert "error" not in record
+        assert record["answer"] == "Kafka and Kubernetes"
+        assert 0 <= record["generation_ms"] <= record["latency_ms"]
+        assert record["completion_tokens"] == 3
+
+
+def test_generate_cleans_and_refuses_like_ask():
+    scheduler = make_scheduler(GatedModel("Answer: Kafka and Kubernetes", open_gate=True), max_batch_size=1)
+    answerer = BatchAnswerer(scheduler, SimpleNamespace(budget_for=lambda template, max_tokens: 100), None)
+    bucket = [
+        {"id": "1", "question": "What do you use?", "prompt": "What do you use?", "context_prefix": "",
+         "retrieval_ms": 1.0},
+        {"id": "2", "question": "Is your email jane@example.com?", "prompt": "Is your email jane@example.com?",
+         "context_prefix": "", "retrieval_ms": 1.0},
+    ]
+    try:
+        echoed, refused = answerer.generate(bucket)
+    finally:
+        answerer.close()
+
+    assert echoed["answer"] == "Kafka and Kubernetes"
+    assert refused["answer"] == POLICY_REFUSAL
+    assert "completion_tokens" not in refused  # never reached the model
@@ -0,0 +1,58 @@
+# tests/test_batched_decode.py
+import pytest
+import torch
+
+import generation
+
+PROMPTS = ["resume context user question answer :", "Kafka ?", "user question about Kubernetes and Spark answer :",
+           "context . context , resume"]
+
+
+@pytest.fixture(scope="module")
+def tiny_lm(tmp_path_factory):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from bench_e2e import make_tiny_lm
+
+    path = str(tmp_path_factory.mktemp("tiny-lm"))
+    torch.manual_seed(0)
+    make_tiny_lm(path, hidden=32)
+    return AutoModelForCausalLM.from_pretrained(path).eval(), AutoTokenizer.from_pretrained(path)
+
+
+def _solo(tiny_lm, prompt):
+    model, tokenizer = tiny_lm
+    scheduler = generation.GenerationScheduler(model, tokenizer, "cpu", max_batch_size=1)
+    return scheduler.generate(prompt, max_new_tokens=24)
+
+
+def test_requests_joining_and_leaving_decode_like_solo_runs(tiny_lm, monkeypatch):
+    model, tokenizer = tiny_lm
+    expected = [_solo(tiny_lm, p) for p in PROMPTS]
+
+    stacks = []
+    real_stack = generation.stack_caches
+    monkeypatch.setattr(generation, "stack_caches", lambda caches, lengths: stacks.append(len(caches)) or
+                        real_stack(caches, lengths))
+    scheduler = generation.GenerationScheduler(model, tokenizer, "cpu", max_batch_size=4)
+    # different lengths and budgets, so requests join and finish at different steps
+    futures = [scheduler.submit(p, max_new_tokens=n) for p, n in zip(PROMPTS, (24, 5, 24, 10))]
+    texts = [f.result(30) for f in futures]
+    assert texts[0] == expected[0] and texts[2] == expected[2]
+    for text, full in zip(texts[1::2], expected[1::2]):
+        assert full.startswith(text)
+
+    # the batch cache is re-stacked when a request joins or leaves, not on each of the ~24 decode steps
+    assert sum(len(tokenizer(t)["input_ids"]) for t in texts) == 24 + 5 + 24 + 10
+    assert len(stacks) <= 2 * len(PROMPTS)
+
+
+def test_speculative_request_leaving_the_batch_keeps_its_cache(tiny_lm):
+    model, tokenizer = tiny_lm
+    expected = [_solo(tiny_lm, p) for p in PROMPTS[:2]]
+    # both decode in the batch until the short one finishes, then the long one speculates alone
+    scheduler = generation.GenerationScheduler(model, tokenizer, "cpu", max_batch_size=2, draft_model=model)
+    futures = [scheduler.submit(p, max_new_tokens=n, speculative=True) for p, n in zip(PROMPTS, (24, 5))]
+    long_text, short_text = (f.result(30) for f in futures)
+    assert long_text == expected[0] and expected[1].startswith(short_text)
+    assert scheduler.stats["accepted"] > 0
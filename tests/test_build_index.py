@@ -0,0 +1,34 @@
+# tests/test_build_index.py
+import pytest
+
+from bench_e2e import HashEmbedder
+from build_index import update_index
+from embedder import register_embedder
+from index_factory import MIN_TRAIN_PER_CELL, index_kind
+
+MODEL = "hash-embedder"
+
+
+@pytest.fixture(autouse=True)
+def hash_embedder():
+    register_embedder(HashEmbedder(dim=32), name=MODEL)
+
+
+def _chunks(n):
+    return [f"chunk {i} about Kafka and Kubernetes number{i}" for i in range(n)]
+
+
+def test_ivf_fallen_back_to_flat_stays_incremental(tmp_path, capsys):
+    index = update_index(_chunks(10), str(tmp_path), model_name=MODEL, kind="ivf")
+    assert index_kind(index) == "flat"
+
+    capsys.readouterr()
+    index = update_index(_chunks(11), str(tmp_path), model_name=MODEL, kind="ivf")
+    assert index_kind(index) == "flat"
+    assert "+1/-0 vectors" in capsys.readouterr().out
+
+
+def test_ivf_is_built_once_the_corpus_can_train_it(tmp_path):
+    update_index(_chunks(10), str(tmp_path), model_name=MODEL, kind="ivf")
+    index = update_index(_chunks(MIN_TRAIN_PER_CELL), str(tmp_path), model_name=MODEL, kind="ivf")
+    assert index_kind(index) == "ivf"
@@ -0,0 +1,53 @@
+# tests/test_chunk_store.py
+import pickle
+
+import pytest
+
+from chunk_store import CURRENT_FILE, ChunkStore, ChunkStoreWriter, load_chunks, write_chunk_store
+
+
+def test_legacy_pickle_needs_an_explicit_opt_in(tmp_path, monkeypatch):
+    with open(tmp_path / "chunks.pkl", "wb") as f:
+        pickle.dump(["old chunk"], f)
+    monkeypatch.delenv("ALLOW_LEGACY_PICKLE", raising=False)
+    with pytest.raises(FileNotFoundError, match="build_index.py"):
+        load_chunks(str(tmp_path))
+    monkeypatch.setenv("ALLOW_LEGACY_PICKLE", "1")
+    assert load_chunks(str(tmp_path)) == ["old chunk"]
+
+
+def test_store_is_preferred_to_a_legacy_pickle(tmp_path):
+    with open(tmp_path / "chunks.pkl", "wb") as f:
+        pickle.dump(["old chunk"], f)
+    write_chunk_store(str(tmp_path), ["new chunk"])
+    chunks = load_chunks(str(tmp_path))
+    assert isinstance(chunks, ChunkStore) and list(chunks) == ["new chunk"]
+
+
+def test_readers_see_the_old_store_until_the_new_one_is_complete(tmp_path):
+    write_chunk_store(str(tmp_path), ["old one", "old two"])
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.add(["new chunk that is longer than the old ones"])
+    assert list(ChunkStore(str(tmp_path))) == ["old one", "old two"]  # mid-build
+    writer.close()
+    assert list(ChunkStore(str(tmp_path))) == ["new chunk that is longer than the old ones"]
+
+
+def test_rebuilds_keep_two_generations_and_clear_the_flat_layout(tmp_path):
+    # a store from before generations: files directly in the models dir
+    store = tmp_path / "legacy"
+    write_chunk_store(str(store), ["flat chunk"])
+    generation = (store / CURRENT_FILE).read_text()
+    for path in (store / generation).iterdir():
+        path.rename(store / path.name)
+    (store / CURRENT_FILE).unlink()
+    (store / generation).rmdir()
+    assert list(ChunkStore(str(store))) == ["flat chunk"]
+
+    for text in ("first", "second", "third"):
+        write_chunk_store(str(store), [text])
+    assert list(load_chunks(str(store))) == ["third"]
+    # the current generation plus the previous one, for readers that resolved it just before the switch
+    generations = [p.name for p in store.iterdir() if p.is_dir()]
+    assert len(generations) == 2 and (store / CURRENT_FILE).read_text() in generations
+    assert not (store / "chunks.blob").exists()
@@ -0,0 +1,84 @@
+# tests/test_context_builder.py
+import numpy as np
+import pytest
+
+from context_builder import ContextBuilder, mmr_order
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word."""
+
+    def encode(self, text, add_special_tokens=False):
+        return text.split()
+
+    def __call__(self, text):
+        return {"input_ids": text.split()}
+
+
+class ListRetriever:
+    """Fixed hits over a list of chunks, whatever the query."""
+
+    def __init__(self, chunks, hits):
+        self.chunks = chunks
+        self.hits = hits
+
+    def search(self, query, k, filters=None):
+        return self.hits[:k]
+
+
+def _window(start, n):
+    return " ".join(f"w{i}" for i in range(start, start + n))
+
+
+def _tokens(builder, packed):
+    return builder.count_tokens(builder.separator.join(packed))
+
+
+def test_mmr_puts_a_diverse_hit_before_a_near_duplicate():
+    sim = np.array([[1.0, 0.98, 0.1], [0.98, 1.0, 0.1], [0.1, 0.1, 1.0]], dtype=np.float32)
+    assert mmr_order([1.0, 0.99, 0.7], sim, mmr_lambda=0.7) == [0, 2, 1]
+    assert mmr_order([1.0, 0.99, 0.7], sim, mmr_lambda=1.0) == [0, 1, 2]  # relevance only
+    assert mmr_order([], np.zeros((0, 0))) == []
+
+
+def test_select_drops_near_duplicates():
+    chunks = ["Kafka streams at Acme", "Kafka streams at Acme", "Kubernetes at Initech"]
+    builder = ContextBuilder(ListRetriever(chunks, [(0, 3.0), (1, 2.9), (2, 1.0)]), WordTokenizer())
+    assert builder.select("kafka") == ["Kafka streams at Acme", "Kubernetes at Initech"]
+
+
+def test_pack_merges_overlapping_windows_and_pays_only_for_new_words():
+    builder = ContextBuilder(None, WordTokenizer())
+    # split_into_chunks(chunk_size=30, overlap=10)-style neighbours
+    packed = builder.pack([_window(0, 30), _window(20, 30)], budget_tokens=50)
+    assert packed == [_window(0, 50)]
+    # the second window sits before the first: merged at the front
+    assert builder.pack([_window(20, 30), _window(0, 30)], budget_tokens=50) == [_window(0, 50)]
+
+
+def test_pack_skips_what_does_not_fit_and_keeps_filling():
+    builder = ContextBuilder(None, WordTokenizer())
+    texts = [_window(0, 30), _window(100, 30), _window(200, 5)]
+    packed = builder.pack(texts, budget_tokens=40)
+    assert packed == [_window(0, 30), _window(200, 5)]
+    assert _tokens(builder, packed) + len(packed) - 1 <= 40  # plus one token per separator
+
+
+@pytest.mark.parametrize("budget", [0, 7, 25, 31, 60, 90, 500])
+def test_build_stays_within_the_token_budget(budget):
+    rng = np.random.default_rng(budget)
+    starts = rng.integers(0, 200, size=12)
+    chunks = [_window(int(s), int(n)) for s, n in zip(starts, rng.integers(3, 40, size=12))]
+    hits = [(row, float(score)) for row, score in enumerate(sorted(rng.random(12), reverse=True))]
+    builder = ContextBuilder(ListRetriever(chunks, hits), WordTokenizer())
+
+    packed = builder.build("question", budget)
+    assert _tokens(builder, packed) + max(0, len(packed) - 1) <= budget
+    if budget >= min(len(c.split()) for c in chunks):
+        assert packed
+
+
+def test_budget_for_leaves_room_for_the_template():
+    builder = ContextBuilder(None, WordTokenizer())
+    assert builder.budget_for("Resume context: User question: Answer:", 100) == 100 - 5 - 8
+    assert builder.budget_for("one two", 5) == 0
@@ -0,0 +1,59 @@
+# tests/test_embedding_cache.py
+import os
+
+import numpy as np
+import pytest
+
+from bench_e2e import HashEmbedder
+from embedder import register_embedder
+from embedding_cache import EmbeddingCache, chunk_id
+
+MODEL = "hash-embedder"
+TEXTS = ["Kafka pipelines", "Kubernetes operators", "resume summary"]
+
+
+@pytest.fixture(autouse=True)
+def hash_embedder():
+    register_embedder(HashEmbedder(dim=32), name=MODEL)
+
+
+def test_save_round_trips_and_prunes_unretained_ids(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), MODEL)
+    first, encoded = cache.embed(TEXTS)
+    assert encoded == 3
+    cache.save(retain=[chunk_id(t) for t in TEXTS[:2]])
+    assert os.listdir(tmp_path) == [f"{MODEL}.npy"]
+
+    reopened = EmbeddingCache(str(tmp_path), MODEL)
+    assert len(reopened) == 2
+    again, encoded = reopened.embed(TEXTS[:2])
+    assert encoded == 0
+    np.testing.assert_array_equal(again, first[:2])
+
+
+def test_legacy_pair_is_migrated_and_a_torn_one_dropped(tmp_path):
+    keys = np.asarray([chunk_id(t) for t in TEXTS], dtype=np.int64)
+    vecs = HashEmbedder(dim=32).encode(TEXTS, normalize_embeddings=True)
+    np.save(tmp_path / f"{MODEL}.keys.npy", keys)
+    np.save(tmp_path / f"{MODEL}.vecs.npy", vecs)
+    cache = EmbeddingCache(str(tmp_path), MODEL)
+    assert cache.embed(TEXTS)[1] == 0
+    cache.save()
+    assert os.listdir(tmp_path) == [f"{MODEL}.npy"]
+
+    torn = tmp_path / "torn"
+    torn.mkdir()
+    np.save(torn / f"{MODEL}.keys.npy", keys)
+    np.save(torn / f"{MODEL}.vecs.npy", vecs[:2])
+    assert len(EmbeddingCache(str(torn), MODEL)) == 0
+
+
+def test_embed_mixes_saved_pending_and_new_vectors(tmp_path):
+    expected = HashEmbedder(dim=32).encode(TEXTS, normalize_embeddings=True)
+    cache = EmbeddingCache(str(tmp_path), MODEL)
+    cache.embed(TEXTS[:1])
+    cache.save()
+    cache.embed(TEXTS[1:2])  # pending, not saved yet
+    vecs, encoded = cache.embed(TEXTS[::-1])
+    assert encoded == 1
+    np.testing.assert_allclose(vecs, expected[::-1])
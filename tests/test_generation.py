@@ -0,0 +1,66 @@
+# tests/test_generation.py
+import threading
+from concurrent.futures import CancelledError
+
+from conftest import GatedModel, make_scheduler
+
+
+def _drain(streamer, timeout=5):
+    """Iterate `streamer` on another thread; returns (finished, exception)."""
+    outcome = {}
+
+    def consume():
+        try:
+            outcome["deltas"] = list(streamer)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive(), outcome.get("error")
+
+
+def test_closing_a_pending_stream_ends_it(busy_scheduler):
+    scheduler, model, running = busy_scheduler
+    streamer = scheduler.stream("second question", max_new_tokens=4)
+    streamer.close()  # still queued behind the first request
+
+    # ends at once, not when the scheduler gets back to its queue
+    finished, error = _drain(streamer)
+    assert finished, "iterating a stream closed while pending never returned"
+    assert isinstance(error, CancelledError)
+    model.gate.set()
+    assert running.result(5) == ""
+
+
+def test_cancelled_pending_submit_does_not_block_scheduler(busy_scheduler):
+    scheduler, model, running = busy_scheduler
+    streamer = scheduler.stream("second question", max_new_tokens=4)
+    streamer.close()
+    later = scheduler.submit("third question", max_new_tokens=4)
+    model.gate.set()
+
+    assert later.result(5) == ""
+    assert _drain(streamer)[0]
+
+
+def test_lone_speculative_request_uses_the_draft():
+    draft = GatedModel(open_gate=True)
+    scheduler = make_scheduler(GatedModel("Kafka and Kubernetes", open_gate=True), draft_model=draft)
+    assert scheduler.submit("question", speculative=True).result(5)
+    assert draft.entered.is_set()
+
+
+def test_speculation_steps_aside_for_batched_decoding():
+    model, draft = GatedModel("Kafka and Kubernetes"), GatedModel(open_gate=True)
+    scheduler = make_scheduler(model, max_batch_size=4, draft_model=draft)
+    blocker = scheduler.submit("first question", max_new_tokens=1)
+    assert model.entered.wait(5)
+    # both join the batch together, so two requests are active from their first step
+    futures = [scheduler.submit("second question", speculative=True) for _ in range(2)]
+    model.gate.set()
+
+    assert blocker.result(5) == "Kafka"
+    assert [f.result(5) for f in futures] == ["and Kubernetes"] * 2
+    assert not draft.entered.is_set()
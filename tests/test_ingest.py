@@ -0,0 +1,51 @@
+# tests/test_ingest.py
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from bench_e2e import HashEmbedder
+from chunk_store import ChunkStore
+from embedder import register_embedder
+from ingest import ingest
+
+MODEL = "hash-embedder"
+
+
+@pytest.fixture(autouse=True)
+def hash_embedder():
+    register_embedder(HashEmbedder(dim=32), name=MODEL)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "corpus"
+    root.mkdir()
+    for d in range(6):
+        (root / f"doc{d}.txt").write_text(
+            "\n\n".join(f"Experience {d}.{p}: built Kafka and Kubernetes platforms, item {p}." for p in range(5)))
+    return root
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_ingest_builds_the_index_from_the_stored_embeddings(corpus, tmp_path, kind):
+    out = str(tmp_path / "models")
+    stats = ingest(str(corpus), out, workers=1, batch_size=4, model_name=MODEL, kind=kind)
+    store = ChunkStore(out)
+    index = faiss.read_index(os.path.join(out, "resume.index"))
+    assert index.ntotal == stats["chunks"] == len(store)
+    np.testing.assert_array_equal(np.sort(faiss.vector_to_array(index.id_map)), np.sort(store.ids))
+
+    # the cache was persisted batch by batch and saved: a re-ingest encodes nothing
+    assert sorted(os.listdir(os.path.join(out, "embedding_cache"))) == [f"{MODEL}.npy"]
+    assert ingest(str(corpus), out, workers=1, batch_size=4, model_name=MODEL, kind=kind)["encoded"] == 0
+
+
+def test_reingest_prunes_the_cache_to_the_current_corpus(corpus, tmp_path):
+    out = str(tmp_path / "models")
+    ingest(str(corpus), out, workers=1, batch_size=4, model_name=MODEL)
+    (corpus / "doc0.txt").unlink()
+    stats = ingest(str(corpus), out, workers=1, batch_size=4, model_name=MODEL)
+    cached = np.load(os.path.join(out, "embedding_cache", f"{MODEL}.npy"))
+    assert len(cached) == stats["chunks"]
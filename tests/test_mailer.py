@@ -0,0 +1,184 @@
+# tests/test_mailer.py
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mailer import Mailer, SendGridTransport, TransientError, _claim_owner
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message["id"])
+
+
+def _spool_claim(spool, msg_id, owner):
+    os.makedirs(spool, exist_ok=True)
+    record = {"id": msg_id, "to": "a@example.com", "from": "b@example.com", "subject": "hi", "text": "hello",
+              "attempts": 0, "next_attempt_at": 0.0}
+    with open(os.path.join(spool, f"{msg_id}.json.{owner}.sending"), "w") as f:
+        json.dump(record, f)
+
+
+@pytest.mark.parametrize("owner", [_claim_owner(os.getpid()), str(os.getpid()), f"{os.getppid()}-1"],
+                         ids=["our pid", "our pid, no start time", "reused pid"])
+def test_stale_claims_are_released_on_start(tmp_path, owner):
+    # e.g. PID 1 claimed it, then the container restarted and we are PID 1 again
+    _spool_claim(str(tmp_path), "m1", owner)
+    transport = Recorder()
+    mailer = Mailer(transport, spool_dir=str(tmp_path))
+    assert mailer.flush(timeout=5)
+    assert transport.sent == ["m1"]
+
+
+def test_live_claims_are_left_alone(tmp_path):
+    _spool_claim(str(tmp_path), "m1", _claim_owner(os.getppid()))
+    transport = Recorder()
+    mailer = Mailer(transport, spool_dir=str(tmp_path))
+    assert mailer.flush(timeout=1)
+    assert transport.sent == []
+    assert sorted(os.listdir(tmp_path)) == ["failed", f"m1.json.{_claim_owner(os.getppid())}.sending"]
+
+
+# -------------------
+# SendGrid transport against a local stub server
+# -------------------
+class StubSendGrid(ThreadingHTTPServer):
+    """Answers each POST with the next (status, headers) of `replies`, then 202s; records requests."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []  # (monotonic time, headers, payload)
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v3/mail/send"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((time.monotonic(), dict(self.headers), json.loads(body)))
+        status, headers = self.server.replies.pop(0) if self.server.replies else (202, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sendgrid(request):
+    server = StubSendGrid(getattr(request, "param", ()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _send_one(server, spool, **mailer_kwargs):
+    mailer = Mailer(SendGridTransport("test-key", url=server.url), spool_dir=spool, **mailer_kwargs)
+    mailer.enqueue("owner@example.com", "no-reply@example.com", "New message", "hello")
+    assert mailer.flush(timeout=10)
+    return mailer
+
+
+def test_sendgrid_delivers(sendgrid, tmp_path):
+    mailer = _send_one(sendgrid, str(tmp_path))
+    assert (mailer.sent, mailer.failed) == (1, 0)
+    (_, headers, payload), = sendgrid.requests
+    assert headers["Authorization"] == "Bearer test-key"
+    assert payload["personalizations"] == [{"to": [{"email": "owner@example.com"}]}]
+    assert payload["content"] == [{"type": "text/plain", "value": "hello"}]
+    assert os.listdir(tmp_path) == ["failed"]
+
+
+@pytest.mark.parametrize("sendgrid", [[(503, {})]], indirect=True)
+def test_sendgrid_5xx_is_retried_after_backoff(sendgrid, tmp_path):
+    mailer = _send_one(sendgrid, str(tmp_path), base_delay=0.2)
+    assert (mailer.sent, mailer.failed) == (1, 0)
+    (first, _, payload1), (second, _, payload2) = sendgrid.requests
+    assert second - first >= 0.1  # base_delay with jitter in [0.5, 1.0]
+    assert payload1 == payload2
+    assert os.listdir(tmp_path) == ["failed"]
+
+
+@pytest.mark.parametrize("sendgrid", [[(429, {"Retry-After": "1"})]], indirect=True)
+def test_sendgrid_retry_after_is_honoured(sendgrid, tmp_path):
+    mailer = _send_one(sendgrid, str(tmp_path), base_delay=0.01)
+    assert mailer.sent == 1
+    (first, _, _), (second, _, _) = sendgrid.requests
+    assert second - first >= 0.9
+
+
+@pytest.mark.parametrize("sendgrid", [[(400, {})]], indirect=True)
+def test_sendgrid_4xx_fails_permanently(sendgrid, tmp_path):
+    mailer = _send_one(sendgrid, str(tmp_path), base_delay=0.01)
+    assert (mailer.sent, mailer.failed) == (0, 1)
+    assert len(sendgrid.requests) == 1  # not retried
+    failed = os.listdir(tmp_path / "failed")
+    assert len(failed) == 1
+    with open(tmp_path / "failed" / failed[0]) as f:
+        assert json.load(f)["last_error"].startswith("HTTP 400")
+
+
+class FlakyTransport(Recorder):
+    """Fails transiently the first time, then records."""
+
+    def send(self, message):
+        if not message["attempts"]:
+            raise TransientError("HTTP 503")
+        super().send(message)
+
+
+def test_spool_errors_do_not_stop_delivery(tmp_path, monkeypatch):
+    transport = FlakyTransport()
+    mailer = Mailer(transport, spool_dir=str(tmp_path), base_delay=0.05)
+    real_write, calls = Mailer._write, []
+
+    def full_disk(path, record):
+        calls.append(path)
+        if len(calls) == 2:  # the retry write after the 503
+            raise OSError(28, "No space left on device")
+        real_write(path, record)
+
+    monkeypatch.setattr(mailer, "_write", full_disk)
+    mailer.enqueue("owner@example.com", "no-reply@example.com", "New message", "hello")
+    assert mailer.flush(timeout=5)
+    assert mailer._worker.is_alive()
+    assert len(transport.sent) == 1 and mailer.sent == 1
+    assert os.listdir(tmp_path) == ["failed"]
+
+
+def test_backoff_set_by_another_process_is_respected(tmp_path):
+    Mailer._write(str(tmp_path / "m1.json"), {"id": "m1", "to": "a@example.com", "from": "b@example.com",
+                                              "subject": "hi", "text": "hello", "attempts": 0, "next_attempt_at": 0.0})
+    sent_at = []
+
+    class OtherProcessRetries(Mailer):
+        def _next_due(self):
+            path = super()._next_due()
+            if not sent_at:
+                # after our start-up scan: another worker got a 429 and rescheduled it
+                record = self._read(path)
+                record.update(attempts=1, next_attempt_at=time.time() + 0.5)
+                self._write(path, record)
+                sent_at.append(time.time())
+            return path
+
+    transport = Recorder()
+    transport.send = lambda message: sent_at.append(time.time())
+    mailer = OtherProcessRetries(transport, spool_dir=str(tmp_path))
+    assert mailer.flush(timeout=5)
+    rescheduled, sent = sent_at
+    assert sent - rescheduled >= 0.45
@@ -0,0 +1,104 @@
+# tests/test_model_server.py
+import os
+import stat
+import threading
+import time
+from concurrent.futures import CancelledError
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+from model_server import ModelClient, ModelServer, _key_file
+
+
+@pytest.fixture
+def served(tmp_path, busy_scheduler):
+    """A ModelServer in front of the busy scheduler, and a client connected to it."""
+    scheduler, model, _ = busy_scheduler
+    server = ModelServer(scheduler, retriever=None, context_builder=None, embedder=None)
+    address = str(tmp_path / "model.sock")
+    ready = threading.Event()
+    threading.Thread(target=server.serve, args=(address,), kwargs={"ready": ready}, daemon=True).start()
+    assert ready.wait(5)
+    yield server, ModelClient(address), scheduler, model
+
+
+def _consume(stream):
+    """Start iterating `stream` on another thread; returns (thread, outcome)."""
+    outcome = {}
+
+    def consume():
+        try:
+            outcome["deltas"] = list(stream)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stream_closed_while_pending_ends(served):
+    server, client, scheduler, _ = served
+    stream = client.scheduler.stream("a question", max_new_tokens=4)
+    _wait_for(lambda: scheduler.queue_depth == 1)
+    consumer, outcome = _consume(stream)
+    time.sleep(0.05)  # consumer is now blocked in recv()
+    stream.close()
+
+    consumer.join(5)
+    assert not consumer.is_alive(), "client recv() never returned"
+    assert isinstance(outcome.get("error"), CancelledError)
+    _wait_for(lambda: not server._streams)  # the server thread let go of the stream too
+
+
+def test_stream_closed_before_iterating(served):
+    server, client, scheduler, _ = served
+    stream = client.scheduler.stream("a question", max_new_tokens=4)
+    _wait_for(lambda: scheduler.queue_depth == 1)
+    stream.close()
+
+    _wait_for(lambda: not server._streams)
+    assert client.ping() == "pong"
+
+
+def test_connections_need_the_server_key(served, tmp_path):
+    server, client, _, _ = served
+    address = client.address
+    assert stat.S_IMODE(os.stat(_key_file(address)).st_mode) == 0o600
+    assert client.ping() == "pong"
+    with pytest.raises(AuthenticationError):
+        Client(address, family="AF_UNIX", authkey=b"guess")
+    # skipping the handshake: the request is taken as a wrong digest, never unpickled
+    conn = Client(address, family="AF_UNIX")
+    conn.send(("ping", (), {}))
+    assert conn.recv_bytes().startswith(b"#CHALLENGE#")
+    assert conn.recv_bytes() == b"#FAILURE#"
+
+
+def test_serve_refuses_a_socket_in_use(served):
+    server, client, _, _ = served
+    with pytest.raises(RuntimeError, match="already listening"):
+        ModelServer(None, None, None, None).serve(client.address)
+    assert client.ping() == "pong"
+
+
+def test_serve_replaces_a_stale_socket(tmp_path):
+    import socket
+
+    address = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(address)  # bound, never listening: what a killed server leaves behind
+    stale.close()
+    ready = threading.Event()
+    threading.Thread(target=ModelServer(None, None, None, None).serve, args=(address, ready), daemon=True).start()
+    assert ready.wait(5)
+    assert ModelClient(address).ping() == "pong"
@@ -0,0 +1,106 @@
+# tests/test_retrieval.py
+import faiss
+import numpy as np
+import pytest
+
+from index_factory import filtered_search
+from retrieval import BM25Index, HybridRetriever, rrf_fuse, tokenize
+
+CORPUS = [
+    "Skills: Kafka, Kubernetes, Terraform and Python",
+    "Built a Kafka pipeline for clickstream events at Acme",
+    "Experience: ran Kubernetes clusters for the payments team",
+    "Skills: Go, gRPC and PostgreSQL",
+    "Education: BSc Computer Science",
+    "Skills: Samza, Flink and stream processing",
+    "Led the migration of batch jobs to Spark on Kubernetes",
+    "Projects: a Kafka Connect sink for S3",
+]
+
+
+class DenseStub:
+    """Exact inner-product search over random vectors; records every call."""
+
+    def __init__(self, n, dim=16, seed=0):
+        vecs = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+        self.index = faiss.IndexFlatIP(dim)
+        self.index.add(vecs)
+        self.query = vecs[:1]
+        self.calls = []
+
+    def __call__(self, query, k, id_filter=None):
+        self.calls.append((query, k, id_filter))
+        if id_filter is None:
+            D, I = self.index.search(self.query, min(k, self.index.ntotal))
+        else:
+            D, I = filtered_search(self.index, self.query, min(k, len(id_filter)), id_filter)
+        return D[0], I[0]
+
+
+def test_tokenize_keeps_tech_terms_and_drops_stopwords():
+    assert tokenize("What is your C++, C# and S3 experience?") == ["c++", "c#", "s3", "experience"]
+
+
+def test_bm25_ranks_by_term_weight_and_honours_the_mask():
+    bm25 = BM25Index.build(CORPUS)
+    rows, scores = bm25.search(tokenize("kafka pipeline"), k=3)
+    assert rows[0] == 1  # the only chunk with both terms
+    assert set(rows.tolist()) == {0, 1, 7}
+    assert list(scores) == sorted(scores, reverse=True)
+
+    mask = np.zeros(len(CORPUS), dtype=bool)
+    mask[[0, 7]] = True
+    rows, _ = bm25.search(tokenize("kafka pipeline"), k=3, mask=mask)
+    assert sorted(rows.tolist()) == [0, 7]
+
+
+def test_bm25_round_trips_and_rejects_a_stale_signature(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    BM25Index.build(CORPUS).save(path, signature=(len(CORPUS), 123))
+    loaded = BM25Index.load(path, signature=(len(CORPUS), 123))
+    assert loaded.search(["kafka"], 3)[0].tolist() == BM25Index.build(CORPUS).search(["kafka"], 3)[0].tolist()
+    assert BM25Index.load(path, signature=(len(CORPUS), 124)) is None
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = rrf_fuse([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_short_query_with_known_terms_skips_the_embedding():
+    dense = DenseStub(len(CORPUS))
+    retriever = HybridRetriever(CORPUS, dense)
+
+    hits = retriever.search("Kafka", k=2)
+    assert dense.calls == []
+    assert len(hits) == 2 and all("Kafka" in CORPUS[row] for row, _ in hits)
+
+    # an unknown term, or a longer question, goes to both halves
+    retriever.search("Kafka on Mesos", k=2)
+    retriever.search("Kafka Kubernetes Terraform Python", k=2)
+    assert len(dense.calls) == 2
+
+
+def test_hybrid_search_is_the_rrf_of_both_rankings():
+    dense = DenseStub(len(CORPUS))
+    retriever = HybridRetriever(CORPUS, dense)
+    lexical, dense_ranking = retriever.rankings("Kafka pipeline on Mesos", k=3)
+    expected = rrf_fuse([[row for row, _ in lexical], [row for row, _ in dense_ranking]])[:3]
+    assert retriever.search("Kafka pipeline on Mesos", k=3) == expected
+
+
+def test_filtered_search_still_returns_a_full_k():
+    dense = DenseStub(len(CORPUS))
+    retriever = HybridRetriever(CORPUS, dense)
+    skills = [row for row, text in enumerate(CORPUS) if text.startswith("Skills:")]
+
+    # one skills chunk mentions Kafka: BM25 alone can't fill k=3, so dense search runs under the filter
+    hits = retriever.search("Kafka", k=3, filters={"section": "skills"})
+    assert sorted(row for row, _ in hits) == skills
+    assert len(dense.calls) == 1 and dense.calls[0][2] is not None
+
+    assert retriever.search("Kafka", k=3, filters={"section": "awards"}) == []
+    with pytest.raises(ValueError, match="unknown section"):
+        retriever.search("Kafka", k=3, filters={"section": "hobbies"})
@@ -0,0 +1,124 @@
+# tests/test_serve_async.py
+import asyncio
+import json
+
+import pytest
+
+from conftest import GatedModel, make_scheduler
+
+
+def _scope(path):
+    return {"type": "http", "method": "POST", "path": path, "headers": []}
+
+
+class Client:
+    """One ASGI request: sends `body`, then disconnects when told to."""
+
+    def __init__(self, body):
+        self.body = json.dumps(body).encode()
+        self.sent_body = False
+        self.left = asyncio.Event()
+        self.messages = []
+
+    async def receive(self):
+        if not self.sent_body:
+            self.sent_body = True
+            return {"type": "http.request", "body": self.body, "more_body": False}
+        await self.left.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.messages.append(message)
+
+    @property
+    def status(self):
+        return next((m["status"] for m in self.messages if m["type"] == "http.response.start"), None)
+
+
+async def _wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.parametrize("path", ["/ask", "/ask/stream"])
+def test_disconnect_while_pending_frees_the_worker_thread(resume_app, busy_scheduler, path):
+    from serve_async import AskServer
+
+    scheduler, model, _ = busy_scheduler
+    server = AskServer(resume_app.app, max_concurrency=2, max_queue=8, deadline_s=30)
+    workers = server.executor._max_workers
+
+    async def scenario():
+        # more early disconnects than the pool has threads
+        for n in range(workers + 1):
+            client = Client({"msg": f"question {n}"})
+            request = asyncio.ensure_future(server(_scope(path), client.receive, client.send))
+            await _wait_for(lambda: scheduler.queue_depth == n + 1)
+            client.left.set()
+            await asyncio.wait_for(request, 5)
+        model.gate.set()
+        # every pool thread must come back once the scheduler drops the cancelled requests
+        loop = asyncio.get_running_loop()
+        await asyncio.wait_for(asyncio.gather(*(loop.run_in_executor(server.executor, lambda: True)
+                                                for _ in range(workers))), 5)
+
+        client = Client({"msg": "after the burst"})
+        await asyncio.wait_for(server(_scope(path), client.receive, client.send), 5)
+        assert client.status == 200
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_async_ask_matches_flask_ask(resume_app, monkeypatch):
+    from serve_async import AskServer
+
+    scheduler = make_scheduler(GatedModel("Answer: Kafka and Kubernetes", open_gate=True))
+    monkeypatch.setattr(resume_app, "scheduler", scheduler)
+    monkeypatch.setattr(resume_app, "SPECULATIVE_ENDPOINTS", {"ask_stream"})
+    speculative = []
+    stream = scheduler.stream
+    monkeypatch.setattr(scheduler, "stream", lambda prompt, **kw: speculative.append(kw["speculative"])
+                        or stream(prompt, **kw))
+
+    flask = resume_app.app.test_client().post("/ask", json={"msg": "skills"}).get_json()["answer"]
+    server = AskServer(resume_app.app, max_concurrency=2, max_queue=8, deadline_s=30)
+    client = Client({"msg": "skills"})
+    try:
+        asyncio.run(asyncio.wait_for(server(_scope("/ask"), client.receive, client.send), 5))
+    finally:
+        server.executor.shutdown(wait=False)
+    body = b"".join(m.get("body", b"") for m in client.messages if m["type"] == "http.response.body")
+
+    assert flask == "Kafka and Kubernetes"  # echoed "Answer:" label cleaned off
+    assert json.loads(body)["answer"] == flask
+    assert speculative == [False]  # /ask's setting, not /ask/stream's
+
+
+def test_doc_filter_without_doc_metadata_is_a_400_on_every_endpoint(resume_app, monkeypatch):
+    from retrieval import HybridRetriever
+    from serve_async import AskServer
+
+    # the built-in fallback corpus: sections, but no source documents
+    monkeypatch.setattr(resume_app, "retriever", HybridRetriever(["Kafka and Kubernetes", "Spring Boot"]))
+    monkeypatch.setattr(resume_app, "scheduler", make_scheduler(GatedModel("Kafka", open_gate=True)))
+    monkeypatch.setattr(resume_app, "_build_prompt", lambda msg, filters=None, tenant=None:
+                        ("\n".join(resume_app.llama_retrieve(msg, filters=filters)), None))
+    body = {"msg": "skills", "filters": {"doc": "resume.pdf"}}
+
+    for path in ("/ask", "/ask/stream"):
+        flask = resume_app.app.test_client().post(path, json=body)
+        assert flask.status_code == 400, path
+        assert "error" in flask.get_json()
+
+        server = AskServer(resume_app.app, max_concurrency=2, max_queue=8, deadline_s=30)
+        client = Client(body)
+        try:
+            asyncio.run(asyncio.wait_for(server(_scope(path), client.receive, client.send), 5))
+        finally:
+            server.executor.shutdown(wait=False)
+        assert client.status == 400, path